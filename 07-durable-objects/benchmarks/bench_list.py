@@ -0,0 +1,89 @@
+"""
+Latency and bytes written of adding a message to lists of growing length.
+
+Compares the List Durable Object of src/entry.py, one key per message and
+a count, with the previous one, kept below, which read the array of all the
+messages, appended to it and wrote it back. Lists are filled directly in an
+in-memory stand-in for storage that serializes values like the runtime does
+(see shim.py), then ADDS messages are added to each, and the newest page of
+messages is read.
+
+Run from the `07-durable-objects` directory:
+
+    uv run python benchmarks/bench_list.py
+"""
+
+import argparse
+import asyncio
+import time
+import types
+
+import shim
+from entry import COUNT_KEY, LEGACY_KEY, List, message_key
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+ADDS = 100
+PAGE = 50
+
+
+class ArrayList(shim.DurableObject):
+    """The previous List: every add rewrites the array of all the messages."""
+
+    async def get_messages(self):
+        messages = await self.ctx.storage.get(LEGACY_KEY)
+        return messages if messages else []
+
+    async def add_message(self, message):
+        messages = await self.get_messages()
+        messages.append(message)
+        await self.ctx.storage.put(LEGACY_KEY, messages)
+
+
+def filled(cls, size: int):
+    storage = shim.MemoryStorage()
+    messages = [f"message {seq}" for seq in range(size)]
+    if cls is ArrayList:
+        asyncio.run(storage.put(LEGACY_KEY, messages))
+    else:
+        entries = {message_key(seq): message for seq, message in enumerate(messages)}
+        asyncio.run(storage.put({**entries, COUNT_KEY: size}))
+    storage.writes = storage.bytes_written = 0
+    return cls(types.SimpleNamespace(storage=storage), None)
+
+
+async def measure(lst, size: int) -> tuple[float, float, float]:
+    start = time.perf_counter()
+    for seq in range(ADDS):
+        await lst.add_message(f"message {size + seq}")
+    add = (time.perf_counter() - start) / ADDS
+
+    start = time.perf_counter()
+    if isinstance(lst, ArrayList):
+        page = (await lst.get_messages())[-PAGE:]
+    else:
+        page = await lst.get_messages(size + ADDS - PAGE, PAGE)
+    read = time.perf_counter() - start
+    assert page[-1] == f"message {size + ADDS - 1}" and len(page) == PAGE
+    return add, lst.ctx.storage.bytes_written / ADDS, read
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    args = parser.parse_args()
+
+    print(
+        f"{'layout':<7} {'messages':>8} {'us/add':>9} {'bytes/add':>10} "
+        f"{'page read us':>12}"
+    )
+    for size in args.sizes:
+        for name, cls in [("array", ArrayList), ("keys", List)]:
+            add, written, read = asyncio.run(measure(filled(cls, size), size))
+            print(
+                f"{name:<7} {size:>8} {add * 1e6:>9.1f} {written:>10.0f} "
+                f"{read * 1e6:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
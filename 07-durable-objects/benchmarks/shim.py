@@ -0,0 +1,92 @@
+"""
+Stand-ins for the Workers runtime, so that the example can be imported by
+the benchmarks outside of workerd.
+
+Only the small part of `js`, `pyodide.ffi` and `workers` that the example
+touches is provided, plus an in-memory version of Durable Object storage.
+Import this module before importing anything from `src/`.
+"""
+
+import bisect
+import json
+import sys
+import types
+from pathlib import Path
+
+SRC = Path(__file__).parents[1] / "src"
+
+
+class MemoryStorage:
+    """
+    Durable Object storage kept in a dict, counting the keys and bytes written.
+
+    Values are stored serialized, like the runtime does, so that writing a
+    large value costs what it would.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.keys = []
+        self.writes = 0
+        self.bytes_written = 0
+
+    async def get(self, key):
+        value = self.data.get(key)
+        return None if value is None else json.loads(value)
+
+    async def put(self, key, value=None):
+        entries = key if isinstance(key, dict) else {key: value}
+        for key, value in entries.items():
+            serialized = json.dumps(value)
+            self.writes += 1
+            self.bytes_written += len(key) + len(serialized)
+            if key not in self.data:
+                if self.keys and key < self.keys[-1]:
+                    bisect.insort(self.keys, key)
+                else:
+                    self.keys.append(key)
+            self.data[key] = serialized
+
+    async def delete(self, key):
+        if key not in self.data:
+            return False
+        del self.data[key]
+        self.keys.remove(key)
+        return True
+
+    async def list(self, options=None):
+        options = options or {}
+        prefix = options.get("prefix", "")
+        first = bisect.bisect_left(self.keys, max(prefix, options.get("start", "")))
+        found = {}
+        for key in self.keys[first:]:
+            if not key.startswith(prefix) or len(found) == options.get("limit"):
+                break
+            found[key] = json.loads(self.data[key])
+        return found
+
+
+class DurableObject:
+    def __init__(self, ctx, env):
+        self.ctx = ctx
+        self.env = env
+
+
+def install():
+    js = types.ModuleType("js")
+    js.Object = types.SimpleNamespace(fromEntries=dict)
+    pyodide = types.ModuleType("pyodide")
+    ffi = types.ModuleType("pyodide.ffi")
+    ffi.to_js = lambda value, **options: value
+    pyodide.ffi = ffi
+    workers = types.ModuleType("workers")
+    workers.DurableObject = DurableObject
+    workers.Response = object
+    workers.WorkerEntrypoint = object
+    sys.modules.update(
+        {"js": js, "pyodide": pyodide, "pyodide.ffi": ffi, "workers": workers}
+    )
+    sys.path.insert(0, str(SRC))
+
+
+install()
@@ -1,19 +1,86 @@
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
 
+from js import Object
 from pyodide.ffi import to_js
 from workers import DurableObject, Response, WorkerEntrypoint
 
+# Each message has its own key, "msg:" and its zero-padded sequence number so
+# that keys sort in order, and the number of messages is kept under "count".
+# Adding a message writes two small keys however long the list is, where
+# rewriting a single array of all the messages grew with every message.
+PREFIX = "msg:"
+COUNT_KEY = "count"
+
+# Earlier versions kept all the messages in one array under this key
+LEGACY_KEY = "messages"
+
+# Most keys written by one put()
+MAX_PUT_KEYS = 128
+
+# Most messages returned by one get_messages() call, and by /show
+MAX_PAGE = 1000
+
+
+def message_key(seq: int) -> str:
+    return f"{PREFIX}{seq:012d}"
+
 
 class List(DurableObject):
-    async def get_messages(self):
-        messages = await self.ctx.storage.get("messages")
-        return messages if messages else []
+    def __init__(self, ctx, env):
+        super().__init__(ctx, env)
+        self.count = None
+
+    async def get_count(self):
+        """The number of messages, migrating those stored as one array."""
+        if self.count is None:
+            count = await self.ctx.storage.get(COUNT_KEY)
+            if count is None:
+                count = await self.migrate()
+            self.count = count
+        return self.count
+
+    async def migrate(self):
+        """Move the messages of the legacy array to their own keys."""
+        legacy = await self.ctx.storage.get(LEGACY_KEY)
+        if not legacy:
+            return 0
+        messages = list(legacy)
+        # The array is deleted last, so an interrupted migration starts over
+        for start in range(0, len(messages), MAX_PUT_KEYS):
+            entries = {
+                message_key(seq): messages[seq]
+                for seq in range(start, min(start + MAX_PUT_KEYS, len(messages)))
+            }
+            await self.ctx.storage.put(
+                to_js(entries, dict_converter=Object.fromEntries)
+            )
+        await self.ctx.storage.put(COUNT_KEY, len(messages))
+        await self.ctx.storage.delete(LEGACY_KEY)
+        return len(messages)
+
+    async def get_messages(self, offset=0, limit=MAX_PAGE):
+        """The messages from the `offset`-th, at most `limit` of them."""
+        if not 1 <= limit <= MAX_PAGE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE}")
+        if not await self.get_count():
+            return []
+        options = {
+            "prefix": PREFIX,
+            "start": message_key(max(offset, 0)),
+            "limit": limit,
+        }
+        messages = await self.ctx.storage.list(
+            to_js(options, dict_converter=Object.fromEntries)
+        )
+        return list(messages.values())
 
     async def add_message(self, message):
-        messages = await self.get_messages()
-        messages.append(message)
-        await self.ctx.storage.put("messages", to_js(messages))
-        return
+        # The input gate holds other events until the put is done, so the
+        # count is only moved on once the message and the count are stored
+        seq = await self.get_count()
+        entries = {message_key(seq): message, COUNT_KEY: seq + 1}
+        await self.ctx.storage.put(to_js(entries, dict_converter=Object.fromEntries))
+        self.count = seq + 1
 
 
 class Default(WorkerEntrypoint):
@@ -37,7 +104,19 @@ class Default(WorkerEntrypoint):
             await stub.add_message(message)
             return Response("Message sent")
         elif "/show" in url.path:
-            messages = await stub.get_messages()
+            # /<list_id>/show?offset=100&limit=50 shows a page of the messages
+            params = parse_qs(url.query)
+            try:
+                offset = int(params.get("offset", ["0"])[0])
+                limit = int(params.get("limit", [str(MAX_PAGE)])[0])
+            except ValueError:
+                return Response("offset and limit must be integers", status=400)
+            if offset < 0 or not 1 <= limit <= MAX_PAGE:
+                return Response(
+                    f"offset must be at least 0 and limit between 1 and {MAX_PAGE}",
+                    status=400,
+                )
+            messages = await stub.get_messages(offset, limit)
             if not messages:
                 return Response("No messages")
 
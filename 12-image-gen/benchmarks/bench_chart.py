@@ -0,0 +1,64 @@
+"""
+Chart rendering time for large series.
+
+A random walk of 1k, 100k and 1M points is parsed from JSON, downsampled
+with both algorithms and rendered as every kind of chart at the default
+600x400 size, then encoded as PNG.
+
+Run from the `12-image-gen` directory:
+
+    uv run python benchmarks/bench_chart.py
+"""
+
+import json
+import random
+import time
+
+import shim  # noqa: F401 - must be imported before charts
+from charts import KINDS, lttb, minmax, parse_body, render_chart
+from encoding import encode_image
+
+SIZES = (1_000, 100_000, 1_000_000)
+
+# Pixel columns of the default chart
+COLUMNS = 500
+
+
+def random_walk(count: int) -> list[float]:
+    rng = random.Random(count)
+    value = 0.0
+    values = []
+    for _ in range(count):
+        value += rng.gauss(0, 1)
+        values.append(value)
+    return values
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    print(f"{'points':>9} {'step':<16} {'ms':>9} {'bytes':>7}")
+    for count in SIZES:
+        body = json.dumps(random_walk(count))
+
+        (values, labels), elapsed = timed(parse_body, body, "application/json")
+        print(f"{count:>9} {'parse json':<16} {elapsed:>9.1f}")
+
+        for name, downsample in (("lttb", lttb), ("minmax", minmax)):
+            _, elapsed = timed(downsample, values, COLUMNS)
+            print(f"{count:>9} {name:<16} {elapsed:>9.1f}")
+
+        for kind in KINDS:
+            image, render_ms = timed(render_chart, values, labels, kind=kind)
+            buffer, encode_ms = timed(encode_image, image, "png")
+            size = buffer.getbuffer().nbytes
+            print(f"{count:>9} {'render ' + kind:<16} {render_ms:>9.1f}")
+            print(f"{count:>9} {'encode ' + kind:<16} {encode_ms:>9.1f} {size:>7}")
+
+
+if __name__ == "__main__":
+    main()
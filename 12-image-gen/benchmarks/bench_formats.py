@@ -0,0 +1,48 @@
+"""
+Encode time and output size per endpoint, output format and preset.
+
+Each endpoint renders its default image once, which is then encoded with
+every format and preset supported by the local Pillow build.
+
+Run from the `12-image-gen` directory:
+
+    uv run python benchmarks/bench_formats.py
+"""
+
+import time
+
+import shim  # noqa: F401 - must be imported before entry
+from encoding import PRESETS, available_formats, encode_image
+from entry import Default
+
+ENDPOINTS = {
+    "gradient": ("generate_gradient", {"colors": ["FF6B6B,FFE66D,4ECDC4"]}),
+    "badge": ("generate_badge", {"text": ["Python Workers"]}),
+    "placeholder": ("generate_placeholder", {}),
+    "chart": ("generate_chart", {}),
+}
+
+REPEAT = 5
+
+
+def main():
+    worker = Default()
+    print(
+        f"{'endpoint':<12} {'format':<6} {'preset':<9} {'encode ms':>10} {'bytes':>9}"
+    )
+    for endpoint, (method, params) in ENDPOINTS.items():
+        image = getattr(worker, method)(params)
+        for fmt in available_formats():
+            for preset in PRESETS:
+                start = time.perf_counter()
+                for _ in range(REPEAT):
+                    size = encode_image(image, fmt, preset).getbuffer().nbytes
+                elapsed = (time.perf_counter() - start) / REPEAT
+                print(
+                    f"{endpoint:<12} {fmt:<6} {preset:<9} "
+                    f"{elapsed * 1000:>10.2f} {size:>9}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark for the PNG response path in `image_to_response`.
+
+Compares the old path (`buffer.getvalue()` followed by `to_js(...)`) with the
+current one (`buffer.getbuffer()` assigned into a pre-sized `Uint8Array`).
+The JavaScript side is not available outside of the Workers runtime, so the
+copy into the JS heap is modelled with a bytearray of the same size, which
+costs the same number of bytes copied.
+
+Run from the `12-image-gen` directory:
+
+    uv run python benchmarks/bench_response.py
+"""
+
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+from gradients import render_gradient
+from PIL import Image
+
+SIZES = (256, 1024, 4096)
+
+
+class JsHeap:
+    """Stand-in for the JavaScript heap that counts the bytes copied into it."""
+
+    def __init__(self):
+        self.bytes_copied = 0
+
+    def to_js(self, data: bytes) -> bytearray:
+        # pyodide.ffi.to_js() allocates a new Uint8Array and copies into it.
+        self.bytes_copied += len(data)
+        return bytearray(data)
+
+    def assign(self, view: memoryview) -> bytearray:
+        # Uint8Array.new(n).assign(view) copies straight from the buffer.
+        target = bytearray(view.nbytes)
+        memoryview(target)[:] = view
+        self.bytes_copied += view.nbytes
+        return target
+
+
+def old_path(buffer: BytesIO, heap: JsHeap) -> int:
+    image_bytes = buffer.getvalue()
+    heap.bytes_copied += len(image_bytes)  # getvalue() copies out of BytesIO
+    return len(heap.to_js(image_bytes))
+
+
+def new_path(buffer: BytesIO, heap: JsHeap) -> int:
+    with buffer.getbuffer() as image_bytes:
+        return len(heap.assign(image_bytes))
+
+
+def encode(image) -> BytesIO:
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer
+
+
+def measure(path, image) -> tuple[int, int, float]:
+    # Encode outside of the measurement so only the response path is counted,
+    # and use a fresh buffer each time since BytesIO shares its storage with
+    # the bytes returned by getvalue().
+    buffer = encode(image)
+    heap = JsHeap()
+    tracemalloc.start()
+    start = time.perf_counter()
+    path(buffer, heap)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return heap.bytes_copied, peak, elapsed
+
+
+def noisy_gradient(size: int):
+    # Noise on top of a gradient compresses like a photo, which gives PNGs
+    # large enough for the copies to matter.
+    gradient = render_gradient((size, size), [(255, 0, 0), (0, 0, 255)], "diagonal")
+    noise = Image.merge("RGB", [Image.effect_noise((size, size), 48)] * 3)
+    return Image.blend(gradient, noise, 0.3)
+
+
+def main():
+    print(
+        f"{'size':>9} {'png bytes':>10} {'path':>5} {'copied':>10} "
+        f"{'peak mem':>10} {'time ms':>8}"
+    )
+    for size in SIZES:
+        image = noisy_gradient(size)
+        encoded = encode(image).getbuffer().nbytes
+
+        for name, path in (("old", old_path), ("new", new_path)):
+            copied, peak, elapsed = measure(path, image)
+            print(
+                f"{size:>4}x{size:<4} {encoded:>10} {name:>5} {copied:>10} "
+                f"{peak:>10} {elapsed * 1000:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Benchmark suite for the image generators.
+
+Every generator is run outside of the Workers runtime (see shim.py) over a
+sweep of sizes. For each case this reports:
+
+- render: time to draw the image with Pillow
+- encode: time to encode it as a PNG with the "balanced" preset
+- convert: time to copy the encoded image into a Uint8Array and build the
+  Response, as `image_to_response` does after encoding
+- bytes: size of the encoded image
+- peak KiB / allocs: peak traced memory and number of allocations still live
+  after rendering and building the response, from tracemalloc. Pixel data is
+  allocated by Pillow's C code and is not seen by tracemalloc, so these count
+  the Python-side overhead only.
+
+Times are the median of several runs. Run from the `12-image-gen` directory:
+
+    uv run python benchmarks/run.py                 # print the results
+    uv run python benchmarks/run.py --save          # update baseline.json
+    uv run python benchmarks/run.py --compare       # compare with baseline.json
+
+--compare exits with status 1 when a case got slower than the baseline by
+more than --tolerance and by more than --min-ms, or when its output size
+changed. Timings depend on the machine, so regenerate the baseline before
+comparing on a new one.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import shim  # noqa: F401 - must be imported before entry
+from encoding import encode_image
+from entry import Default
+from workers import Response
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+REPEAT = 5
+
+TIMINGS = ("render_ms", "encode_ms", "convert_ms")
+
+# Slowdowns smaller than this are noise, whatever the tolerance
+MIN_MS = 1.0
+
+
+def chart_data(count: int) -> tuple[list, list]:
+    rng = random.Random(count)
+    return [rng.uniform(0, 100) for _ in range(count)], []
+
+
+def cases() -> list[tuple[str, str, dict, tuple | None]]:
+    """Return (name, generator method, query parameters, POSTed data) tuples."""
+    sweep = []
+    for size in (256, 1024, 2048):
+        dimensions = {"width": [str(size)], "height": [str(size)]}
+        sweep.append(
+            (
+                f"gradient {size}x{size}",
+                "generate_gradient",
+                {"colors": ["FF6B6B,FFE66D,4ECDC4"], **dimensions},
+                None,
+            )
+        )
+        sweep.append(
+            (
+                f"gradient diagonal {size}x{size}",
+                "generate_gradient",
+                {"colors": ["FF6B6B,4ECDC4"], "direction": ["diagonal"], **dimensions},
+                None,
+            )
+        )
+        sweep.append(
+            (f"placeholder {size}x{size}", "generate_placeholder", dimensions, None)
+        )
+    for text in ("OK", "Python Workers", "A much longer badge label " * 4):
+        sweep.append(
+            (f"badge {len(text)} chars", "generate_badge", {"text": [text]}, None)
+        )
+    sweep.append(("chart bar 5 points", "generate_chart", {}, None))
+    for count in (1_000, 100_000):
+        for kind in ("bar", "line"):
+            sweep.append(
+                (
+                    f"chart {kind} {count} points",
+                    "generate_chart",
+                    {"kind": [kind]},
+                    chart_data(count),
+                )
+            )
+    return sweep
+
+
+def median_ms(func) -> tuple[float, object]:
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def measure(worker: Default, method: str, params: dict, data) -> dict:
+    generator = getattr(worker, method)
+    args = (params,) if data is None else (params, data)
+
+    render_ms, image = median_ms(lambda: generator(*args))
+    encode_ms, buffer = median_ms(lambda: encode_image(image, "png"))
+
+    def convert():
+        # The steps of image_to_response() after encoding
+        with buffer.getbuffer() as image_bytes:
+            body = worker.to_js_array(image_bytes)
+        return Response(body, headers={})
+
+    convert_ms, _ = median_ms(convert)
+
+    # Allocations of one full request, from parameters to Response
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    response = worker.image_to_response(generator(*args), {})
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocs = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "lineno"))
+    del response
+
+    return {
+        "render_ms": round(render_ms, 3),
+        "encode_ms": round(encode_ms, 3),
+        "convert_ms": round(convert_ms, 3),
+        "bytes": buffer.getbuffer().nbytes,
+        "peak_kib": round((peak - start_memory) / 1024, 1),
+        "allocs": allocs,
+    }
+
+
+def run() -> dict:
+    worker = Default()
+    results = {}
+    print(
+        f"{'case':<32} {'render':>9} {'encode':>9} {'convert':>9} "
+        f"{'bytes':>9} {'peak KiB':>9} {'allocs':>7}"
+    )
+    for name, method, params, data in cases():
+        result = measure(worker, method, params, data)
+        results[name] = result
+        print(
+            f"{name:<32} {result['render_ms']:>9.2f} {result['encode_ms']:>9.2f} "
+            f"{result['convert_ms']:>9.2f} {result['bytes']:>9} "
+            f"{result['peak_kib']:>9.1f} {result['allocs']:>7}"
+        )
+    return results
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float, min_ms: float = MIN_MS
+) -> list[str]:
+    """Return a description of every regression against the baseline."""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for field in TIMINGS:
+            limit = max(expected[field] * tolerance, expected[field] + min_ms)
+            if result[field] > limit:
+                regressions.append(
+                    f"{name}: {field} {result[field]:.2f} > {expected[field]:.2f}"
+                )
+        if result["bytes"] != expected["bytes"]:
+            regressions.append(
+                f"{name}: bytes {result['bytes']} != {expected['bytes']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--save", action="store_true", help="write baseline.json")
+    parser.add_argument(
+        "--compare", action="store_true", help="compare with baseline.json"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="allowed slowdown factor for --compare (default: 1.5)",
+    )
+    parser.add_argument(
+        "--min-ms",
+        type=float,
+        default=MIN_MS,
+        help=f"slowdowns ignored by --compare, in ms (default: {MIN_MS})",
+    )
+    args = parser.parse_args()
+
+    results = run()
+
+    if args.save:
+        BASELINE.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Saved {BASELINE.name}")
+
+    if args.compare:
+        baseline = json.loads(BASELINE.read_text())
+        regressions = compare(results, baseline, args.tolerance, args.min_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {BASELINE.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Stand-ins for the Workers runtime modules, so `src/entry.py` can be imported
+by the benchmarks outside of workerd.
+
+Only the small part of `js`, `pyodide.ffi` and `workers` that the image
+generators touch is provided. Import this module before importing `entry`.
+"""
+
+import sys
+import types
+from pathlib import Path
+
+SRC = Path(__file__).parents[1] / "src"
+
+
+class Uint8Array(bytearray):
+    """Models a JavaScript Uint8Array, copying on assign() like the real one."""
+
+    @classmethod
+    def new(cls, length):
+        return cls(length)
+
+    def assign(self, data):
+        memoryview(self)[:] = data
+
+
+class Proxy:
+    """Models a PyProxy created with pyodide.ffi.create_proxy()."""
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def destroy(self):
+        self.func = None
+
+
+class ReadableStream:
+    def __init__(self, source):
+        self.source = source
+
+    @classmethod
+    def new(cls, source):
+        return cls(source)
+
+
+class Response:
+    def __init__(self, body=None, status=200, headers=None, **kwargs):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+
+
+class Request:
+    def __init__(self, url, headers=None):
+        self.url = url
+        self.headers = headers or {}
+
+
+class WorkerEntrypoint:
+    def __init__(self, ctx=None, env=None):
+        self.ctx = ctx
+        self.env = env
+
+
+def install():
+    """Register the stand-in modules and put `src/` on the import path."""
+    js = types.ModuleType("js")
+    js.Object = types.SimpleNamespace(fromEntries=dict)
+    js.ReadableStream = ReadableStream
+    js.Uint8Array = Uint8Array
+
+    pyodide = types.ModuleType("pyodide")
+    ffi = types.ModuleType("pyodide.ffi")
+    ffi.create_proxy = Proxy
+    ffi.to_js = lambda obj, **kwargs: obj
+    pyodide.ffi = ffi
+
+    workers = types.ModuleType("workers")
+    workers.Request = Request
+    workers.Response = Response
+    workers.WorkerEntrypoint = WorkerEntrypoint
+
+    for name, module in (
+        ("js", js),
+        ("pyodide", pyodide),
+        ("pyodide.ffi", ffi),
+        ("workers", workers),
+    ):
+        sys.modules.setdefault(name, module)
+
+    if str(SRC) not in sys.path:
+        sys.path.insert(0, str(SRC))
+
+
+install()
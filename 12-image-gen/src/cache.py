@@ -0,0 +1,127 @@
+"""
+Render cache for the image endpoints.
+
+Every endpoint is a pure function of its query parameters, so a rendered
+image can be reused for any request with the same (normalized) parameters.
+This module builds a canonical cache key from the parameters an endpoint
+reads, so that unknown ones like cache busters do not get entries of their
+own, derives
+a strong ETag from it and keeps recently rendered images in an in-isolate LRU
+that is bounded by the total number of bytes it holds.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+# Bump this whenever the rendering code changes its output, so that ETags
+# handed out by older versions stop matching and KV entries are not reused.
+RENDER_VERSION = "4"
+
+# Parameters holding hex colors, which are case-insensitive and may or may
+# not start with "#".
+COLOR_PARAMS = {"color", "color1", "color2", "colors", "bg_color", "text_color"}
+
+# Parameters the image of each endpoint depends on. The output format is
+# not one of them: callers add the format actually served to the key.
+FONT_PARAMS = {"font", "font_size"}
+RENDER_PARAMS = {
+    "/gradient": {"width", "height", "direction", "colors", "color1", "color2"},
+    "/badge": {"text", "bg_color", "text_color", *FONT_PARAMS},
+    "/placeholder": {"width", "height", "bg_color", "text_color", *FONT_PARAMS},
+    "/chart": {
+        "values",
+        "labels",
+        "color",
+        "width",
+        "height",
+        "kind",
+        "downsample",
+        *FONT_PARAMS,
+    },
+}
+
+# Parameters of the encoder, which change the bytes of every image
+ENCODER_PARAMS = {"preset"}
+
+
+def _normalize(name: str, value: str) -> str:
+    value = value.strip()
+    if name in COLOR_PARAMS:
+        return ",".join(color.strip().lstrip("#").lower() for color in value.split(","))
+    return value
+
+
+def cache_key(path: str, params: dict) -> str:
+    """
+    Build a canonical cache key from a path and `parse_qs` output.
+
+    Only the parameters in RENDER_PARAMS for `path` and ENCODER_PARAMS are
+    kept, and generators only ever read the first value of each, so the key
+    does too. Parameters are sorted and colors normalized, which makes
+    `?color1=#FF0000&width=10` and `?width=10&color1=ff0000` share an entry.
+    """
+    names = RENDER_PARAMS.get(path, set()) | ENCODER_PARAMS
+    parts = [
+        f"{name}={_normalize(name, values[0])}"
+        for name, values in params.items()
+        if name in names
+    ]
+    return f"{path}?{'&'.join(sorted(parts))}"
+
+
+def make_etag(key: str) -> str:
+    """Return a strong ETag for the image rendered for `key`."""
+    digest = hashlib.sha256(f"{RENDER_VERSION}:{key}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag.
+
+    If-None-Match uses the weak comparison, so a `W/` prefix on the client's
+    copy of the tag is ignored.
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class LRUCache:
+    """
+    Least-recently-used cache of encoded images with a total byte budget.
+
+    Entries larger than the whole budget are never stored, so a single huge
+    image cannot flush everything else out of the cache.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key: str) -> bytes | None:
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+
+        self.entries[key] = data
+        self.size += len(data)
+
+        # Evict the least recently used entries until we are back in budget
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
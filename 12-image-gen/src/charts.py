@@ -0,0 +1,309 @@
+"""
+Chart rendering for large datasets.
+
+A chart can only show as many distinct x positions as it has pixel columns,
+so series with more points than that are downsampled first:
+
+- LTTB ("largest triangle three buckets") keeps the points that best preserve
+  the visual shape of the series. It is the default for line and area charts.
+- Min/max bucketing keeps the smallest and largest value of every pixel
+  column, so no spike is ever lost. It is the default for bar charts.
+
+The downsampled series is then drawn with a handful of batched calls (one
+polyline, one polygon per sign for areas and dense bars) instead of one call
+per point.
+"""
+
+import csv
+import json
+from io import StringIO
+
+from fonts import get_font, measure_text
+from PIL import Image, ImageDraw
+
+KINDS = ("bar", "line", "area")
+DOWNSAMPLERS = ("lttb", "minmax")
+
+# Largest number of points accepted in one chart
+MAX_POINTS = 1_000_000
+
+
+def parse_values(text: str) -> list[float]:
+    """Parse comma- or whitespace-separated numbers."""
+    values = [float(v) for v in text.replace(",", " ").split()]
+    if len(values) > MAX_POINTS:
+        raise ValueError(f"A chart can hold at most {MAX_POINTS} values")
+    return values
+
+
+def parse_body(text: str, content_type: str | None) -> tuple[list, list]:
+    """
+    Parse chart data POSTed as JSON or CSV.
+
+    JSON can be a list of numbers or an object with a "values" list and an
+    optional "labels" list. CSV has one point per row: the last column is the
+    value and, if there are two or more columns, the first one is the label.
+    A header row is skipped.
+
+    Returns:
+        Tuple of (values, labels)
+    """
+    if "json" in (content_type or ""):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            values, labels = data.get("values", []), data.get("labels", [])
+        else:
+            values, labels = data, []
+        if not isinstance(values, list) or not isinstance(labels, list):
+            raise ValueError("values and labels must be JSON lists")
+        if len(values) > MAX_POINTS:
+            raise ValueError(f"A chart can hold at most {MAX_POINTS} values")
+        try:
+            values = list(map(float, values))
+        except TypeError:
+            # null, lists and objects, which float() does not take either
+            raise ValueError("values must be numbers") from None
+        return values, [str(label) for label in labels]
+
+    values, labels = [], []
+    for index, row in enumerate(csv.reader(StringIO(text))):
+        if not row:
+            continue
+        try:
+            value = float(row[-1])
+        except ValueError:
+            if index == 0:
+                continue  # header row
+            raise
+        values.append(value)
+        if len(row) > 1:
+            labels.append(row[0].strip())
+        if len(values) > MAX_POINTS:
+            raise ValueError(f"A chart can hold at most {MAX_POINTS} values")
+    return values, labels
+
+
+def column_extremes(values: list, columns: int) -> tuple[list, list]:
+    """
+    Split values into `columns` consecutive buckets and return the minimum and
+    maximum of each. With fewer values than columns, values are repeated.
+    """
+    count = len(values)
+    minimums, maximums = [], []
+    for column in range(columns):
+        start = column * count // columns
+        end = max((column + 1) * count // columns, start + 1)
+        bucket = values[start:end]
+        minimums.append(min(bucket))
+        maximums.append(max(bucket))
+    return minimums, maximums
+
+
+def minmax(values: list, buckets: int) -> list[tuple[int, float]]:
+    """
+    Downsample to the minimum and maximum of each bucket.
+
+    Returns:
+        List of (index, value) points in index order, two per bucket
+    """
+    count = len(values)
+    if count <= 2 * buckets:
+        return list(enumerate(values))
+
+    points = []
+    for bucket in range(buckets):
+        start = bucket * count // buckets
+        end = (bucket + 1) * count // buckets
+        chunk = values[start:end]
+        low = start + chunk.index(min(chunk))
+        high = start + chunk.index(max(chunk))
+        for index in sorted((low, high)):
+            points.append((index, values[index]))
+    return points
+
+
+def lttb(values: list, threshold: int) -> list[tuple[int, float]]:
+    """
+    Downsample with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are kept. Every other bucket contributes the
+    point forming the largest triangle with the previously selected point and
+    the average of the next bucket.
+
+    Returns:
+        List of `threshold` (index, value) points in index order
+    """
+    count = len(values)
+    if threshold >= count or threshold < 3:
+        return list(enumerate(values))
+
+    every = (count - 2) / (threshold - 2)
+    points = [(0, values[0])]
+    selected = 0
+
+    for bucket in range(threshold - 2):
+        # Average of the next bucket, the third corner of the triangle
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        average_x = (next_start + next_end - 1) / 2
+        average_y = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        # The triangle's area is proportional to this, for a point (x, y)
+        ax, ay = selected, values[selected]
+        dx, dy = ax - average_x, average_y - ay
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        selected = max(
+            range(start, end),
+            key=lambda x: abs(dx * (values[x] - ay) - (ax - x) * dy),
+        )
+        points.append((selected, values[selected]))
+
+    points.append((count - 1, values[-1]))
+    return points
+
+
+def _format_value(value: float) -> str:
+    return f"{value:g}"
+
+
+def render_chart(
+    values: list,
+    labels: list,
+    kind: str = "bar",
+    size: tuple[int, int] = (600, 400),
+    color: tuple = (33, 150, 243),
+    font_params: tuple = (None, None),
+    downsample: str | None = None,
+) -> Image.Image:
+    """
+    Render a bar, line or area chart.
+
+    Args:
+        values: Data points
+        labels: Labels for the data points, only drawn for bars wide enough
+        kind: One of KINDS
+        size: (width, height) of the image
+        color: RGB color of the bars, line or area
+        font_params: (font name, font size) for labels, see fonts.py
+        downsample: One of DOWNSAMPLERS, defaults to "lttb" for line and
+            area charts. Bar charts only support "minmax".
+
+    Returns:
+        RGB image
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of: {', '.join(KINDS)}")
+    if downsample is not None and downsample not in DOWNSAMPLERS:
+        raise ValueError(f"downsample must be one of: {', '.join(DOWNSAMPLERS)}")
+    if kind == "bar" and downsample not in (None, "minmax"):
+        raise ValueError("bar charts can only be downsampled with minmax")
+    if not values:
+        raise ValueError("A chart needs at least one value")
+
+    # Chart dimensions
+    width, height = size
+    padding = 50
+    chart_width = width - (padding * 2)
+    chart_height = height - (padding * 2)
+    if chart_width < 1 or chart_height < 1:
+        raise ValueError(f"A chart must be larger than {padding * 2} pixels")
+
+    # Create image with white background
+    image = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+
+    # Scale values so that both 0 and every value are inside the chart
+    low, high = min(min(values), 0), max(max(values), 0)
+    scale = chart_height / ((high - low) or 1)
+    bottom = height - padding
+
+    def y_of(value):
+        return bottom - (value - low) * scale
+
+    baseline = y_of(0)
+
+    # Draw axes
+    draw.line(
+        [(padding, padding), (padding, height - padding)], fill=(0, 0, 0), width=2
+    )  # Y-axis
+    draw.line(
+        [(padding, baseline), (width - padding, baseline)],
+        fill=(0, 0, 0),
+        width=2,
+    )  # X-axis
+
+    if kind == "bar" and len(values) * 2 <= chart_width:
+        _draw_bars(draw, size, padding, values, labels, y_of, color, font_params)
+    elif kind == "bar":
+        # Too many bars for one pixel each: draw the extremes of every pixel
+        # column as one polygon above and one below the baseline.
+        minimums, maximums = column_extremes(values, chart_width)
+        tops = [min(y_of(value), baseline) for value in maximums]
+        bottoms = [max(y_of(value), baseline) for value in minimums]
+        for edge in (tops, bottoms):
+            if all(y == baseline for y in edge):
+                continue
+            outline = [(padding, baseline)]
+            for column, y in enumerate(edge):
+                outline.append((padding + column, y))
+                outline.append((padding + column + 1, y))
+            outline.append((padding + chart_width, baseline))
+            draw.polygon(outline, fill=color)
+    else:
+        if downsample == "minmax":
+            points = minmax(values, chart_width)
+        else:
+            points = lttb(values, chart_width)
+
+        step = chart_width / max(len(values) - 1, 1)
+        line = [(padding + index * step, y_of(value)) for index, value in points]
+        if kind == "area":
+            draw.polygon(
+                [(line[0][0], baseline), *line, (line[-1][0], baseline)], fill=color
+            )
+            draw.line(line, fill=(0, 0, 0), width=1)
+        else:
+            draw.line(line, fill=color, width=2, joint="curve")
+
+    return image
+
+
+def _draw_bars(draw, size, padding, values, labels, y_of, color, font_params):
+    """Draw one outlined bar per value, with value and label text if it fits."""
+    width, height = size
+    chart_width = width - (padding * 2)
+    baseline = y_of(0)
+    font = get_font(*font_params)
+
+    # Calculate bar dimensions
+    num_bars = len(values)
+    bar_width = chart_width // (num_bars * 2)
+    spacing = bar_width
+
+    for i, value in enumerate(values):
+        # Calculate bar position and height
+        x = padding + spacing + (i * (bar_width + spacing))
+        y = y_of(value)
+
+        # Draw bar
+        draw.rectangle(
+            [(x, min(y, baseline)), (x + bar_width, max(y, baseline))],
+            fill=color,
+            outline=(0, 0, 0),
+        )
+
+        # Draw value on top of bar, and label below the chart
+        texts = [(_format_value(value), min(y, baseline) - 20)]
+        if i < len(labels):
+            texts.append((labels[i], height - padding + 5))
+        for text, text_y in texts:
+            text_width, _ = measure_text(text, *font_params)
+            # Skip text that would overlap the neighboring bars
+            if text_width <= bar_width + spacing:
+                draw.text(
+                    (x + (bar_width - text_width) // 2, text_y),
+                    text,
+                    fill=(0, 0, 0),
+                    font=font,
+                )
@@ -0,0 +1,162 @@
+"""
+Image encoding and output format negotiation.
+
+The Worker can answer with PNG, WebP or JPEG. The format is picked from the
+`format=` query parameter if present, and otherwise from the request's Accept
+header. Each format is encoded with one of a few presets that trade encode
+time for output size.
+"""
+
+from io import BytesIO
+
+from PIL import Image, features
+
+# Output formats: name -> (Pillow format, MIME type)
+FORMATS = {
+    "png": ("PNG", "image/png"),
+    "png8": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+# Encoder settings per preset. "fast" keeps CPU time down, "small" spends
+# more time to produce fewer bytes. "quality" and "method" are for lossy WebP
+# and JPEG, "lossless" is the (method, effort) pair for lossless WebP, picked
+# from benchmarks/bench_formats.py as libwebp's speed settings are not
+# monotonic for the flat images generated here.
+PRESETS = {
+    "fast": {"compress_level": 1, "quality": 75, "method": 0, "lossless": (1, 0)},
+    "balanced": {"compress_level": 6, "quality": 80, "method": 4, "lossless": (6, 25)},
+    "small": {"compress_level": 9, "quality": 70, "method": 6, "lossless": (4, 80)},
+}
+
+# Pillow features needed by formats that are optional in some builds
+OPTIONAL_FEATURES = {"webp": "webp", "jpeg": "jpg"}
+
+# Formats picked from the Accept header, in order of preference. JPEG is only
+# used when asked for explicitly since it blurs the sharp edges of text and
+# flat shapes.
+NEGOTIATED_FORMATS = ("webp", "png")
+
+
+def available_formats() -> list[str]:
+    """Return the output formats supported by this build of Pillow."""
+    return [
+        name
+        for name in FORMATS
+        if name not in OPTIONAL_FEATURES or features.check(OPTIONAL_FEATURES[name])
+    ]
+
+
+def negotiate_format(accept: str | None, requested: str | None = None) -> str:
+    """
+    Pick the output format for a request.
+
+    Args:
+        accept: The request's Accept header
+        requested: Value of the `format=` query parameter, which takes
+            precedence over the Accept header
+
+    Returns:
+        One of the keys of FORMATS
+
+    Raises:
+        ValueError: If the requested format is unknown or unavailable
+    """
+    formats = available_formats()
+    if requested:
+        requested = requested.lower().replace("jpg", "jpeg")
+        if requested not in formats:
+            raise ValueError(f"format must be one of: {', '.join(formats)}")
+        return requested
+
+    # Collect the MIME types the client accepts, ignoring those with q=0
+    accepted = set()
+    for item in (accept or "").split(","):
+        mime_type, *options = (part.strip() for part in item.split(";"))
+        if "q=0" in options or "q=0.0" in options:
+            continue
+        accepted.add(mime_type.lower())
+
+    for name in NEGOTIATED_FORMATS:
+        if name in formats and FORMATS[name][1] in accepted:
+            return name
+    return "png"
+
+
+def _to_palette(image: Image.Image, max_colors: int = 256) -> Image.Image | None:
+    """
+    Convert an image with few colors to palette mode without losing anything.
+
+    Returns None if the image has more than `max_colors` colors. Quantizing
+    to a given palette snaps some colors to their neighbours (white becomes
+    #FCFCFC), so the image is quantized to as many colors as it has instead,
+    which keeps every one of them, and the result checked: it stays RGB if
+    any pixel changed.
+    """
+    colors = image.getcolors(max_colors)
+    if colors is None:
+        return None
+
+    # Of the methods that keep every color, the fastest on these images
+    indexed = image.quantize(
+        len(colors), method=Image.Quantize.MAXCOVERAGE, dither=Image.Dither.NONE
+    )
+    if indexed.convert("RGB").tobytes() != image.tobytes():
+        return None
+    return indexed
+
+
+def encode_image(image: Image.Image, fmt: str, preset: str = "balanced") -> BytesIO:
+    """
+    Encode an RGB image.
+
+    Images with at most 256 colors, like badges and charts, are stored as
+    indexed PNGs or lossless WebPs, which is both exact and much smaller.
+    "png8" quantizes every image down to 256 colors.
+
+    Args:
+        image: PIL Image object
+        fmt: One of the keys of FORMATS
+        preset: One of the keys of PRESETS
+
+    Returns:
+        BytesIO buffer holding the encoded image
+    """
+    settings = PRESETS[preset]
+    buffer = BytesIO()
+
+    if fmt in ("png", "png8"):
+        indexed = _to_palette(image)
+        if indexed is None and fmt == "png8":
+            indexed = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+        if indexed is not None:
+            image = indexed
+        image.save(
+            buffer,
+            format="PNG",
+            compress_level=settings["compress_level"],
+            optimize=preset == "small",
+        )
+    elif fmt == "webp":
+        if image.getcolors(256) is not None:
+            method, effort = settings["lossless"]
+            image.save(
+                buffer, format="WEBP", lossless=True, quality=effort, method=method
+            )
+        else:
+            image.save(
+                buffer,
+                format="WEBP",
+                quality=settings["quality"],
+                method=settings["method"],
+            )
+    else:
+        image.save(
+            buffer,
+            format="JPEG",
+            quality=settings["quality"],
+            optimize=preset == "small",
+        )
+
+    return buffer
@@ -1,12 +1,46 @@
+import json
 import random
-from io import BytesIO
+from functools import partial
 from pathlib import Path
 from urllib.parse import parse_qs, urlparse
 
-from PIL import Image, ImageDraw, ImageFont
-from pyodide.ffi import to_js
+from cache import LRUCache, cache_key, etag_matches, make_etag
+from charts import parse_body, parse_values, render_chart
+from encoding import FORMATS, PRESETS, encode_image, negotiate_format
+from fonts import get_font, measure_text
+from gradients import DIRECTIONS, render_gradient
+from js import Object, ReadableStream, Uint8Array
+from PIL import Image, ImageDraw
+from png_stream import iter_png
+from pyodide.ffi import create_proxy, to_js
+from sprites import compose, multipart_body
+from timing import phase, server_timing
 from workers import Request, Response, WorkerEntrypoint
 
+# Rendered images shared by every request handled by this isolate
+render_cache = LRUCache(max_bytes=16 * 1024 * 1024)
+
+# Largest accepted width or height, streamed or not
+MAX_DIMENSION = 16384
+
+# Images with more pixels than this are streamed instead of being held in
+# memory as a whole (uncompressed, 2048x2048 RGB is already 12 MiB)
+MAX_BUFFERED_PIXELS = 2048 * 2048
+
+
+# Most images accepted by a single /batch request
+MAX_BATCH_SIZE = 256
+
+
+class ImageTooLarge(ValueError):
+    """Raised when the requested image exceeds the size limits."""
+
+
+def check_batch_pixels(pixels: int):
+    """Raise ImageTooLarge if a batch holds more than MAX_BUFFERED_PIXELS."""
+    if pixels > MAX_BUFFERED_PIXELS:
+        raise ImageTooLarge(f"A batch can hold at most {MAX_BUFFERED_PIXELS} pixels")
+
 
 class Default(WorkerEntrypoint):
     """
@@ -21,11 +55,15 @@ class Default(WorkerEntrypoint):
     - /gradient - Generate a colorful gradient image
     - /badge - Generate a badge with custom text
     - /placeholder - Generate a placeholder image with dimensions
-    - /chart - Generate a simple bar chart
+    - /chart - Generate a bar, line or area chart (GET, or POST for large data)
+    - /batch - Generate many images at once as a sprite sheet (POST)
     - / - Show available endpoints
     """
 
+    @server_timing
     async def fetch(self, request: Request):
+        phase("parse")
+
         # Parse the request URL to determine which image to generate
         url = urlparse(request.url)
         path = url.path
@@ -33,20 +71,275 @@ class Default(WorkerEntrypoint):
         # Parse query parameters for customization
         query_params = parse_qs(url.query)
 
+        if path == "/batch":
+            return await self.generate_batch(request, query_params)
+
         # Route to different image generators based on path
-        if path == "/gradient":
-            return self.generate_gradient(query_params)
-        elif path == "/badge":
-            return self.generate_badge(query_params)
-        elif path == "/placeholder":
-            return self.generate_placeholder(query_params)
-        elif path == "/chart":
-            return self.generate_chart(query_params)
-        else:
+        generator = self.get_generator(path)
+        if generator is None:
             # Return a simple HTML page showing available endpoints
             return self.show_endpoints()
 
-    def generate_gradient(self, params: dict) -> Response:
+        # Pick the output format from the format= parameter or Accept header
+        try:
+            fmt, preset = self.get_output_params(request, query_params)
+        except ValueError as e:
+            return Response(str(e), status=400)
+
+        # Charts can be POSTed as JSON or CSV when the data is too large for
+        # the query string. POSTed charts are not cached.
+        data = None
+        if request.method == "POST" and path == "/chart":
+            try:
+                body = await request.text()
+                data = parse_body(body, request.headers.get("Content-Type"))
+            except ValueError as e:
+                return Response(str(e), status=400)
+
+        # Gradients and placeholders can be rendered in strips, which lets
+        # very large images be streamed instead of built in memory. Only PNG
+        # can be encoded a strip at a time, so this is decided first: it
+        # changes the format served.
+        strips = self.get_strip_renderer(path)
+        stream = False
+        if strips is not None:
+            try:
+                size, render = strips(query_params)
+                stream = self.should_stream(size, query_params)
+                if stream and fmt != "png" and "format" in query_params:
+                    raise ImageTooLarge(
+                        f"images larger than {MAX_BUFFERED_PIXELS} pixels "
+                        "are only available as PNG"
+                    )
+            except ImageTooLarge as e:
+                return Response(str(e), status=413)
+            except ValueError as e:
+                return Response(str(e), status=400)
+            if stream:
+                fmt = "png"
+
+        headers = {
+            "Content-Type": FORMATS[fmt][1],
+            "Cache-Control": "public, max-age=3600",
+        }
+        if "format" not in query_params:
+            headers["Vary"] = "Accept"
+
+        # The same parameters always produce the same image, so the ETag can
+        # be derived from the parameters and the format served alone, and
+        # checked before rendering. Streamed PNGs are encoded differently.
+        key = None
+        if data is None and self.is_cacheable(path, query_params):
+            encoding = "png-stream" if stream else fmt
+            key = f"{cache_key(path, query_params)}#{encoding}"
+            headers["ETag"] = make_etag(key)
+            if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+                return Response(None, status=304, headers=headers)
+
+        if stream:
+            return self.stream_png(size, render, headers)
+
+        if key is not None:
+            image_bytes = render_cache.get(key)
+            if image_bytes is not None:
+                phase("convert")
+                return Response(self.to_js_array(image_bytes), headers=headers)
+
+        try:
+            if strips is not None:
+                render_image = partial(render, (0, 0, *size))
+            elif data is not None:
+                render_image = partial(generator, query_params, data)
+            else:
+                render_image = partial(generator, query_params)
+
+            if key is None:
+                phase("render")
+                return self.image_to_response(render_image(), headers, fmt, preset)
+
+            # Try KV before rendering, the in-isolate cache already missed
+            phase("kv")
+            image_bytes = await self.load_from_kv(key)
+            if image_bytes is None:
+                phase("render")
+                image = render_image()
+                phase("encode")
+                image_bytes = encode_image(image, fmt, preset).getvalue()
+                self.store_in_kv(key, image_bytes)
+        except ImageTooLarge as e:
+            return Response(str(e), status=413)
+        except ValueError as e:
+            return Response(str(e), status=400)
+
+        phase("convert")
+        render_cache.put(key, image_bytes)
+        return Response(self.to_js_array(image_bytes), headers=headers)
+
+    async def generate_batch(self, request: Request, params: dict) -> Response:
+        """
+        Render many images in one request and return them as a sprite sheet.
+
+        The request body is a JSON list of image specs. Each spec has a "type"
+        (gradient, badge, placeholder or chart) and the same parameters as the
+        matching endpoint, e.g. {"type": "badge", "text": "Hi"}. The format and
+        preset query parameters apply to the whole sheet.
+
+        The response is multipart/form-data with two parts: "map", a JSON
+        object with the sheet size and the x, y, width and height of every
+        image in request order, and "sprite", the sprite sheet itself.
+        """
+        if request.method != "POST":
+            return Response(
+                "POST a JSON list of image specs", status=405, headers={"Allow": "POST"}
+            )
+
+        try:
+            fmt, preset = self.get_output_params(request, params)
+            specs = json.loads(await request.text())
+            if not isinstance(specs, list) or not specs:
+                raise ValueError("Expected a non-empty JSON list of image specs")
+            if len(specs) > MAX_BATCH_SIZE:
+                raise ImageTooLarge(f"At most {MAX_BATCH_SIZE} images per batch")
+
+            phase("render")
+            images = []
+            pixels = 0
+            for index, spec in enumerate(specs):
+                if not isinstance(spec, dict):
+                    raise ValueError(f"Image {index} is not a JSON object")
+                path = f"/{spec.get('type', '')}"
+                generator = self.get_generator(path)
+                if generator is None:
+                    raise ValueError(f"Image {index} has an unknown type")
+
+                # Specs use the same parameters as the query string
+                spec_params = {
+                    name: [str(value)] for name, value in spec.items() if name != "type"
+                }
+
+                # The whole sheet is built in memory, so every image counts
+                # towards the budget. Sizes are checked before rendering where
+                # they are known up front, and right after otherwise.
+                strips = self.get_strip_renderer(path)
+                if strips is not None:
+                    size, render = strips(spec_params)
+                    pixels += size[0] * size[1]
+                    check_batch_pixels(pixels)
+                    image = render((0, 0, *size))
+                else:
+                    image = generator(spec_params)
+                    pixels += image.width * image.height
+                    check_batch_pixels(pixels)
+                images.append(image)
+        except ImageTooLarge as e:
+            return Response(str(e), status=413)
+        except ValueError as e:
+            return Response(str(e), status=400)
+
+        sheet, frames = compose(images)
+        phase("encode")
+        sprite = encode_image(sheet, fmt, preset).getvalue()
+        phase("convert")
+        sheet_map = {"width": sheet.width, "height": sheet.height, "images": frames}
+        body, content_type = multipart_body(sheet_map, sprite, FORMATS[fmt][1])
+        return Response(self.to_js_array(body), headers={"Content-Type": content_type})
+
+    def get_output_params(self, request: Request, params: dict) -> tuple[str, str]:
+        """
+        Read the output format and encoder preset for a request.
+
+        Raises:
+            ValueError: If the format or preset is invalid
+        """
+        fmt = negotiate_format(
+            request.headers.get("Accept"), params.get("format", [None])[0]
+        )
+        preset = params.get("preset", ["balanced"])[0]
+        if preset not in PRESETS:
+            raise ValueError(f"preset must be one of: {', '.join(PRESETS)}")
+        return fmt, preset
+
+    def get_generator(self, path: str):
+        """Return the image generator method for a path, or None."""
+        generators = {
+            "/gradient": self.generate_gradient,
+            "/badge": self.generate_badge,
+            "/placeholder": self.generate_placeholder,
+            "/chart": self.generate_chart,
+        }
+        return generators.get(path)
+
+    def get_strip_renderer(self, path: str):
+        """Return the strip renderer method for a path, or None."""
+        strip_renderers = {
+            "/gradient": self.gradient_strips,
+            "/placeholder": self.placeholder_strips,
+        }
+        return strip_renderers.get(path)
+
+    def is_cacheable(self, path: str, params: dict) -> bool:
+        """
+        Check whether the image for a request only depends on its parameters.
+
+        Gradients pick random colors for any color that is not supplied.
+        """
+        if path != "/gradient":
+            return True
+        return "colors" in params or ("color1" in params and "color2" in params)
+
+    def should_stream(self, size: tuple[int, int], params: dict) -> bool:
+        """
+        Decide whether to stream an image instead of rendering it in one go.
+
+        Images are streamed when asked to with `stream=1`, and always when they
+        are too large to be held in memory.
+        """
+        width, height = size
+        if width * height > MAX_BUFFERED_PIXELS:
+            return True
+        return params.get("stream", ["0"])[0] in ("1", "true")
+
+    def get_size(self, params: dict, default: tuple[int, int]) -> tuple[int, int]:
+        """
+        Read and validate the width and height query parameters.
+
+        Raises:
+            ValueError: If a dimension is not a positive integer
+            ImageTooLarge: If a dimension is larger than MAX_DIMENSION
+        """
+        width = int(params.get("width", [default[0]])[0])
+        height = int(params.get("height", [default[1]])[0])
+        if width <= 0 or height <= 0:
+            raise ValueError("width and height must be positive")
+        if width > MAX_DIMENSION or height > MAX_DIMENSION:
+            raise ImageTooLarge(
+                f"width and height must be at most {MAX_DIMENSION} pixels"
+            )
+        return width, height
+
+    def get_font_params(self, params: dict) -> tuple[str | None, int | None]:
+        """Read the font and font_size query parameters."""
+        font_name = params.get("font", [None])[0]
+        font_size = params.get("font_size", [None])[0]
+        return font_name, int(font_size) if font_size else None
+
+    async def load_from_kv(self, key: str) -> bytes | None:
+        """Look up a rendered image in the optional RENDER_CACHE KV namespace."""
+        kv = getattr(self.env, "RENDER_CACHE", None)
+        if kv is None:
+            return None
+        data = await kv.get(make_etag(key), "arrayBuffer")
+        return data.to_bytes() if data else None
+
+    def store_in_kv(self, key: str, image_bytes: bytes):
+        """Write a rendered image to the optional RENDER_CACHE KV namespace."""
+        kv = getattr(self.env, "RENDER_CACHE", None)
+        if kv is None:
+            return
+        # Don't make the client wait for the write to finish
+        self.ctx.waitUntil(kv.put(make_etag(key), self.to_js_array(image_bytes)))
+
+    def generate_gradient(self, params: dict) -> Image.Image:
         """
         Generate a gradient image.
 
@@ -55,45 +348,49 @@ class Default(WorkerEntrypoint):
         - height: Image height (default: 400)
         - color1: Start color in hex (default: random)
         - color2: End color in hex (default: random)
+        - colors: Comma-separated list of hex color stops, overrides color1/color2
+        - direction: vertical, horizontal or diagonal (default: vertical)
+        - stream: Set to 1 to stream the PNG in strips (always on for huge images)
         """
-        # Get dimensions from query params or use defaults
-        width = int(params.get("width", [800])[0])
-        height = int(params.get("height", [400])[0])
+        size, render = self.gradient_strips(params)
+        return render((0, 0, *size))
 
-        # Get colors or generate random ones
-        color1 = params.get("color1", [None])[0]
-        color2 = params.get("color2", [None])[0]
+    def gradient_strips(self, params: dict):
+        """
+        Parse the gradient parameters, see `generate_gradient`.
 
-        if not color1:
-            color1 = f"#{random.randint(0, 0xFFFFFF):06x}"
-        if not color2:
-            color2 = f"#{random.randint(0, 0xFFFFFF):06x}"
+        Returns:
+            Tuple of the image size and a function rendering a given box
+        """
+        # Get dimensions from query params or use defaults
+        size = self.get_size(params, (800, 400))
+        direction = params.get("direction", ["vertical"])[0]
+
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of: {', '.join(DIRECTIONS)}")
+
+        # Get colors, random ones only for a missing color1 or color2, so that
+        # an image with all its colors given can be cached, see is_cacheable()
+        stops = params.get("colors", [None])[0]
+        if stops:
+            hex_colors = [color.strip() for color in stops.split(",")]
+            if not all(hex_colors):
+                raise ValueError("colors must be hex colors separated by commas")
+        else:
+            hex_colors = [
+                params.get(name, [None])[0] or f"#{random.randint(0, 0xFFFFFF):06x}"
+                for name in ("color1", "color2")
+            ]
+        if len(hex_colors) < 2:
+            raise ValueError("colors needs at least two hex colors")
 
         # Convert hex colors to RGB tuples
-        r1, g1, b1 = self.hex_to_rgb(color1)
-        r2, g2, b2 = self.hex_to_rgb(color2)
+        colors = [self.hex_to_rgb(color) for color in hex_colors]
 
-        # Create a new image with RGB mode
-        image = Image.new("RGB", (width, height))
-        draw = ImageDraw.Draw(image)
-
-        # Draw gradient by interpolating between colors
-        for y in range(height):
-            # Calculate interpolation factor (0.0 to 1.0)
-            factor = y / height
-
-            # Interpolate each color channel
-            r = int(r1 + (r2 - r1) * factor)
-            g = int(g1 + (g2 - g1) * factor)
-            b = int(b1 + (b2 - b1) * factor)
-
-            # Draw a horizontal line with the interpolated color
-            draw.line([(0, y), (width, y)], fill=(r, g, b))
-
-        # Convert image to bytes and return as PNG
-        return self.image_to_response(image, "image/png")
+        # Build the gradient from a single color ramp, see gradients.py
+        return size, partial(render_gradient, size, colors, direction)
 
-    def generate_badge(self, params: dict) -> Response:
+    def generate_badge(self, params: dict) -> Image.Image:
         """
         Generate a badge/button with custom text.
 
@@ -101,6 +398,8 @@ class Default(WorkerEntrypoint):
         - text: Badge text (default: "Hello World")
         - bg_color: Background color in hex (default: #4CAF50)
         - text_color: Text color in hex (default: #FFFFFF)
+        - font: Name of a bundled TrueType font (default: Pillow's built-in font)
+        - font_size: Font size in pixels
         """
         # Get parameters
         text = params.get("text", ["Hello World"])[0]
@@ -112,21 +411,14 @@ class Default(WorkerEntrypoint):
         text_rgb = self.hex_to_rgb(text_color)
 
         # Create image with padding for text
-        # We'll estimate size based on text length
         padding = 20
 
-        # Create a temporary image to measure text size
-        temp_img = Image.new("RGB", (1, 1))
-        temp_draw = ImageDraw.Draw(temp_img)
+        # Use Pillow's built-in font unless a bundled font is requested, see fonts.py
+        font_name, font_size = self.get_font_params(params)
+        font = get_font(font_name, font_size)
 
-        # Use default font (Pillow's built-in font)
-        # Note: In a production environment, you might want to include custom fonts
-        font = ImageFont.load_default()
-
-        # Get text bounding box to calculate required image size
-        bbox = temp_draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
+        # Measure the text to calculate the required image size
+        text_width, text_height = measure_text(text, font_name, font_size)
 
         # Create the actual image with proper dimensions
         width = text_width + (padding * 2)
@@ -141,9 +433,9 @@ class Default(WorkerEntrypoint):
         text_y = padding
         draw.text((text_x, text_y), text, fill=text_rgb, font=font)
 
-        return self.image_to_response(image, "image/png")
+        return image
 
-    def generate_placeholder(self, params: dict) -> Response:
+    def generate_placeholder(self, params: dict) -> Image.Image:
         """
         Generate a placeholder image with dimensions displayed.
 
@@ -152,10 +444,22 @@ class Default(WorkerEntrypoint):
         - height: Image height (default: 300)
         - bg_color: Background color in hex (default: #CCCCCC)
         - text_color: Text color in hex (default: #666666)
+        - font: Name of a bundled TrueType font (default: Pillow's built-in font)
+        - font_size: Font size in pixels
+        - stream: Set to 1 to stream the PNG in strips (always on for huge images)
+        """
+        size, render = self.placeholder_strips(params)
+        return render((0, 0, *size))
+
+    def placeholder_strips(self, params: dict):
+        """
+        Parse the placeholder parameters, see `generate_placeholder`.
+
+        Returns:
+            Tuple of the image size and a function rendering a given box
         """
         # Get dimensions
-        width = int(params.get("width", [400])[0])
-        height = int(params.get("height", [300])[0])
+        size = self.get_size(params, (400, 300))
         bg_color = params.get("bg_color", ["#CCCCCC"])[0]
         text_color = params.get("text_color", ["#666666"])[0]
 
@@ -163,29 +467,49 @@ class Default(WorkerEntrypoint):
         bg_rgb = self.hex_to_rgb(bg_color)
         text_rgb = self.hex_to_rgb(text_color)
 
-        # Create image
-        image = Image.new("RGB", (width, height), bg_rgb)
+        # Load the font up front, so an invalid font is reported before streaming
+        font_name, font_size = self.get_font_params(params)
+        get_font(font_name, font_size)
+
+        return size, partial(
+            self.draw_placeholder, size, bg_rgb, text_rgb, (font_name, font_size)
+        )
+
+    def draw_placeholder(
+        self,
+        size: tuple[int, int],
+        bg_rgb: tuple,
+        text_rgb: tuple,
+        font_params: tuple,
+        box: tuple,
+    ) -> Image.Image:
+        """Draw the part of a placeholder image inside a full-width box."""
+        width, height = size
+        _, top, _, bottom = box
+
+        # Create image for the box, everything below is drawn shifted up by `top`
+        image = Image.new("RGB", (width, bottom - top), bg_rgb)
         draw = ImageDraw.Draw(image)
 
         # Draw an X across the image
-        draw.line([(0, 0), (width, height)], fill=text_rgb, width=2)
-        draw.line([(width, 0), (0, height)], fill=text_rgb, width=2)
+        draw.line([(0, -top), (width, height - top)], fill=text_rgb, width=2)
+        draw.line([(width, -top), (0, height - top)], fill=text_rgb, width=2)
 
         # Draw border
-        draw.rectangle([(0, 0), (width - 1, height - 1)], outline=text_rgb, width=2)
+        draw.rectangle(
+            [(0, -top), (width - 1, height - 1 - top)], outline=text_rgb, width=2
+        )
 
         # Add dimensions text in the center
         text = f"{width} × {height}"
 
-        font = ImageFont.load_default()
+        font = get_font(*font_params)
 
         # Get text size and center it
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
+        text_width, text_height = measure_text(text, *font_params)
 
         text_x = (width - text_width) // 2
-        text_y = (height - text_height) // 2
+        text_y = (height - text_height) // 2 - top
 
         # Draw text with a background for better visibility
         padding = 10
@@ -198,92 +522,50 @@ class Default(WorkerEntrypoint):
         )
         draw.text((text_x, text_y), text, fill=text_rgb, font=font)
 
-        return self.image_to_response(image, "image/png")
+        return image
 
-    def generate_chart(self, params: dict) -> Response:
+    def generate_chart(self, params: dict, data: tuple | None = None) -> Image.Image:
         """
-        Generate a simple bar chart.
+        Generate a bar, line or area chart.
 
         Query parameters:
         - values: Comma-separated values (default: 10,25,15,30,20)
         - labels: Comma-separated labels (default: A,B,C,D,E)
+        - kind: bar, line or area (default: bar)
+        - downsample: lttb or minmax, for series wider than the chart; bar
+          charts are always downsampled with minmax
+        - width, height: Image size (default: 600x400)
         - color: Bar color in hex (default: #2196F3)
+        - font: Name of a bundled TrueType font (default: Pillow's built-in font)
+        - font_size: Font size in pixels
+
+        Large series can be POSTed instead, see charts.parse_body(). `data` is
+        the parsed (values, labels) of the request body, if any.
         """
         # Parse values and labels
-        values_str = params.get("values", ["10,25,15,30,20"])[0]
-        values = [int(v.strip()) for v in values_str.split(",")]
-
-        labels_str = params.get("labels", ["A,B,C,D,E"])[0]
-        labels = [label.strip() for label in labels_str.split(",")]
+        if data is not None:
+            values, labels = data
+        else:
+            values = parse_values(params.get("values", ["10,25,15,30,20"])[0])
+            labels_str = params.get("labels", ["A,B,C,D,E"])[0]
+            labels = [label.strip() for label in labels_str.split(",")]
 
         bar_color = params.get("color", ["#2196F3"])[0]
         bar_rgb = self.hex_to_rgb(bar_color)
 
-        # Chart dimensions
-        width = 600
-        height = 400
-        padding = 50
-        chart_width = width - (padding * 2)
-        chart_height = height - (padding * 2)
-
-        # Create image with white background
-        image = Image.new("RGB", (width, height), (255, 255, 255))
-        draw = ImageDraw.Draw(image)
-
-        # Draw axes
-        draw.line(
-            [(padding, padding), (padding, height - padding)], fill=(0, 0, 0), width=2
-        )  # Y-axis
-        draw.line(
-            [(padding, height - padding), (width - padding, height - padding)],
-            fill=(0, 0, 0),
-            width=2,
-        )  # X-axis
-
-        # Calculate bar dimensions
-        num_bars = len(values)
-        bar_width = chart_width // (num_bars * 2)
-        spacing = bar_width
-        max_value = max(values) if values else 1
-
-        # Draw bars
-        font = ImageFont.load_default()
-
-        for i, (value, label) in enumerate(zip(values, labels)):
-            # Calculate bar position and height
-            bar_height = int((value / max_value) * chart_height)
-            x = padding + spacing + (i * (bar_width + spacing))
-            y = height - padding - bar_height
-
-            # Draw bar
-            draw.rectangle(
-                [(x, y), (x + bar_width, height - padding)],
-                fill=bar_rgb,
-                outline=(0, 0, 0),
-            )
-
-            # Draw value on top of bar
-            value_text = str(value)
-            bbox = draw.textbbox((0, 0), value_text, font=font)
-            text_width = bbox[2] - bbox[0]
-            draw.text(
-                (x + (bar_width - text_width) // 2, y - 20),
-                value_text,
-                fill=(0, 0, 0),
-                font=font,
-            )
-
-            # Draw label below bar
-            bbox = draw.textbbox((0, 0), label, font=font)
-            text_width = bbox[2] - bbox[0]
-            draw.text(
-                (x + (bar_width - text_width) // 2, height - padding + 5),
-                label,
-                fill=(0, 0, 0),
-                font=font,
-            )
-
-        return self.image_to_response(image, "image/png")
+        width, height = self.get_size(params, (600, 400))
+        if width * height > MAX_BUFFERED_PIXELS:
+            raise ImageTooLarge(f"Charts can have at most {MAX_BUFFERED_PIXELS} pixels")
+
+        return render_chart(
+            values,
+            labels,
+            kind=params.get("kind", ["bar"])[0],
+            size=(width, height),
+            color=bar_rgb,
+            font_params=self.get_font_params(params),
+            downsample=params.get("downsample", [None])[0],
+        )
 
     def hex_to_rgb(self, hex_color: str) -> tuple:
         """
@@ -301,35 +583,89 @@ class Default(WorkerEntrypoint):
         # Convert to RGB
         return tuple(int(hex_color[i : i + 2], 16) for i in (0, 2, 4))
 
-    def image_to_response(self, image: Image.Image, content_type: str) -> Response:
+    def image_to_response(
+        self,
+        image: Image.Image,
+        headers: dict,
+        fmt: str = "png",
+        preset: str = "balanced",
+    ) -> Response:
         """
         Convert a PIL Image to a Response object.
 
         Args:
             image: PIL Image object
-            content_type: MIME type for the response
+            headers: Response headers
+            fmt: Output format, one of the keys of encoding.FORMATS
+            preset: Encoder preset, one of the keys of encoding.PRESETS
 
         Returns:
             Response object with image data
         """
-        # Create a BytesIO buffer to hold the image data
-        buffer = BytesIO()
+        # Encode the image into a BytesIO buffer, see encoding.py
+        phase("encode")
+        buffer = encode_image(image, fmt, preset)
+        phase("convert")
 
-        # Save image to buffer in PNG format
-        image.save(buffer, format="PNG")
+        # getbuffer() exposes the encoded bytes without copying them out of the
+        # BytesIO (getvalue() would make a copy)
+        with buffer.getbuffer() as image_bytes:
+            body = self.to_js_array(image_bytes)
 
-        image_bytes = buffer.getvalue()
+        return Response(body, headers=headers)
 
-        # Create and return response with appropriate headers
-        #
-        # TODO: This currently performs an unnecessary copy, need to fix.
-        return Response(
-            to_js(image_bytes).buffer,
-            headers={
-                "Content-Type": content_type,
-                "Cache-Control": "public, max-age=3600",
-            },
+    def stream_png(self, size: tuple[int, int], render, headers: dict) -> Response:
+        """
+        Stream a PNG image, rendering and encoding it one strip at a time.
+
+        Args:
+            size: (width, height) of the image
+            render: Function rendering a given box of the image
+            headers: Response headers
+
+        Returns:
+            Response whose body is a ReadableStream of PNG chunks
+        """
+        chunks = iter_png(size, render)
+
+        def pull(controller):
+            # Called by the runtime whenever the client is ready for more data
+            chunk = next(chunks, None)
+            if chunk is None:
+                controller.close()
+                release()
+            else:
+                controller.enqueue(self.to_js_array(chunk))
+
+        def cancel(reason):
+            # The client went away before the image was complete
+            chunks.close()
+            release()
+
+        proxies = [create_proxy(pull), create_proxy(cancel)]
+
+        def release():
+            # The stream is done, so JavaScript won't call us again
+            for proxy in proxies:
+                proxy.destroy()
+
+        source = to_js(
+            {"pull": proxies[0], "cancel": proxies[1]},
+            dict_converter=Object.fromEntries,
         )
+        return Response(ReadableStream.new(source), headers=headers)
+
+    def to_js_array(self, data):
+        """
+        Copy bytes (or any buffer) into a new JavaScript Uint8Array.
+
+        assign() copies straight into a Uint8Array owned by JavaScript. That one
+        copy is required because the response body must outlive the Python
+        buffer.
+        """
+        array = Uint8Array.new(len(data))
+        array.assign(data)
+        return array
 
     def show_endpoints(self) -> Response:
         """
@@ -0,0 +1,90 @@
+"""
+Font loading and text measurement.
+
+Fonts are loaded once per isolate instead of once per request, and text
+measurements are memoized, so laying out a label that was seen before costs
+a dictionary lookup instead of a call into FreeType. A single line is
+measured with the font directly, text with several lines with a 1x1 image
+created once, so that lines are spaced like `ImageDraw.text()` does.
+
+TrueType fonts can be bundled by dropping `.ttf` files into `src/fonts/`.
+They are referred to by file name without the extension, e.g. `font=Inter`
+for `src/fonts/Inter.ttf`. Without a name, Pillow's built-in font is used.
+"""
+
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+FONTS_DIR = Path(__file__).parent / "fonts"
+
+# Size used for bundled fonts when none is given
+DEFAULT_SIZE = 16
+
+# Smallest and largest accepted font sizes
+MIN_SIZE = 6
+MAX_SIZE = 200
+
+# Pillow's built-in font at its default size, loaded when the isolate starts
+DEFAULT_FONT = ImageFont.load_default()
+
+# Only used to measure text with several lines
+_MEASURE_DRAW = ImageDraw.Draw(Image.new("L", (1, 1)))
+
+# Font names map to file names, so only allow plain names
+_FONT_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def available_fonts() -> list[str]:
+    """Return the names of the bundled TrueType fonts."""
+    if not FONTS_DIR.is_dir():
+        return []
+    return sorted(path.stem for path in FONTS_DIR.glob("*.ttf"))
+
+
+@lru_cache(maxsize=32)
+def get_font(name: str | None = None, size: int | None = None):
+    """
+    Load a font, at most once per name and size.
+
+    Args:
+        name: Name of a bundled TrueType font, or None for Pillow's built-in font
+        size: Font size in pixels, or None for the default size
+
+    Raises:
+        ValueError: If the font does not exist or the size is out of range
+    """
+    if size is not None and not MIN_SIZE <= size <= MAX_SIZE:
+        raise ValueError(f"font size must be between {MIN_SIZE} and {MAX_SIZE}")
+
+    if name is None:
+        return DEFAULT_FONT if size is None else ImageFont.load_default(size)
+
+    path = FONTS_DIR / f"{name}.ttf"
+    if not _FONT_NAME.match(name) or not path.is_file():
+        fonts = ", ".join(available_fonts()) or "none bundled"
+        raise ValueError(f"unknown font {name!r}, available fonts: {fonts}")
+    return ImageFont.truetype(str(path), size or DEFAULT_SIZE)
+
+
+@lru_cache(maxsize=4096)
+def measure_text(
+    text: str, name: str | None = None, size: int | None = None
+) -> tuple[int, int]:
+    """
+    Measure text, which may have several lines.
+
+    Returns:
+        Tuple of (width, height) in pixels, the same as the size of the box
+        returned by `ImageDraw.textbbox((0, 0), text, font=font)`
+    """
+    font = get_font(name, size)
+    if "\n" in text:
+        left, top, right, bottom = _MEASURE_DRAW.multiline_textbbox(
+            (0, 0), text, font=font
+        )
+    else:
+        left, top, right, bottom = font.getbbox(text)
+    return right - left, bottom - top
@@ -0,0 +1,121 @@
+"""
+Gradient rendering helpers.
+
+Instead of drawing one line per pixel row, a gradient is built from a single
+8-bit ramp that Pillow generates and scales in C. The ramp is colored with
+per-channel lookup tables (one entry per ramp level), so no Python code runs
+per row or per pixel and the cost of a request is roughly constant in the
+image height.
+"""
+
+from functools import lru_cache
+
+from PIL import Image, ImageChops
+
+DIRECTIONS = ("vertical", "horizontal", "diagonal")
+
+# A full 0..255 ramp. Longer ramps are produced by scaling this up.
+_BASE_RAMP = bytes(range(256))
+
+
+def _ramp(length: int, vertical: bool) -> Image.Image:
+    """
+    Return a 1-pixel-wide (or 1-pixel-tall) "L" image going from 0 to 255.
+
+    Args:
+        length: Number of pixels in the ramp
+        vertical: If True the ramp is a column, otherwise a row
+    """
+    if length <= len(_BASE_RAMP):
+        # Short ramps are built directly so both endpoints are exact.
+        last = max(length - 1, 1)
+        data = bytes(i * 255 // last for i in range(length))
+        size = (1, length) if vertical else (length, 1)
+        return Image.frombytes("L", size, data)
+
+    base_size = (1, 256) if vertical else (256, 1)
+    size = (1, length) if vertical else (length, 1)
+    base = Image.frombytes("L", base_size, _BASE_RAMP)
+    return base.resize(size, Image.Resampling.BILINEAR)
+
+
+@lru_cache(maxsize=64)
+def _color_lut(colors: tuple[tuple, ...]) -> list[int]:
+    """
+    Build a 768-entry lookup table mapping ramp levels to RGB colors.
+
+    The colors are treated as evenly spaced stops, so two colors give a plain
+    linear gradient and more colors give a multi-stop gradient. The table is
+    laid out as 256 red entries, then 256 green, then 256 blue, which is the
+    format accepted by ``Image.point`` on an RGB image. Tables are cached, as
+    streamed gradients are rendered in many strips with the same colors.
+    """
+    segments = len(colors) - 1
+    channels = ([], [], [])
+
+    for level in range(256):
+        position = level / 255 * segments
+        index = min(int(position), segments - 1)
+        factor = position - index
+        start, end = colors[index], colors[index + 1]
+        for channel, lut in enumerate(channels):
+            lut.append(
+                int(start[channel] + (end[channel] - start[channel]) * factor + 0.5)
+            )
+
+    return channels[0] + channels[1] + channels[2]
+
+
+def _colorize(mask: Image.Image, lut: list[int]) -> Image.Image:
+    """Map an "L" mask through the lookup table to get an RGB image."""
+    return Image.merge("RGB", (mask, mask, mask)).point(lut)
+
+
+def render_gradient(
+    size: tuple[int, int],
+    colors: list[tuple],
+    direction: str = "vertical",
+    box: tuple[int, int, int, int] | None = None,
+) -> Image.Image:
+    """
+    Render a linear gradient.
+
+    Args:
+        size: (width, height) of the full gradient
+        colors: Two or more RGB tuples, used as evenly spaced color stops
+        direction: One of "vertical" (top to bottom), "horizontal" (left to
+            right) or "diagonal" (top-left to bottom-right)
+        box: Optional (left, top, right, bottom) region of the full gradient
+            to render. Defaults to the whole image.
+
+    Returns:
+        RGB image with the size of ``box``
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Unknown gradient direction: {direction}")
+    if len(colors) < 2:
+        raise ValueError("A gradient needs at least two colors")
+
+    width, height = size
+    left, top, right, bottom = box or (0, 0, width, height)
+    region = (right - left, bottom - top)
+    lut = _color_lut(tuple(map(tuple, colors)))
+
+    if direction == "vertical":
+        # Color the 1-pixel column first, then stretch it sideways.
+        column = _ramp(height, vertical=True).crop((0, top, 1, bottom))
+        return _colorize(column, lut).resize(region, Image.Resampling.NEAREST)
+
+    if direction == "horizontal":
+        row = _ramp(width, vertical=False).crop((left, 0, right, 1))
+        return _colorize(row, lut).resize(region, Image.Resampling.NEAREST)
+
+    # Diagonal: average a horizontal and a vertical ramp, then color the result.
+    rows = _ramp(width, vertical=False).crop((left, 0, right, 1))
+    columns = _ramp(height, vertical=True).crop((0, top, 1, bottom))
+    mask = ImageChops.add(
+        rows.resize(region, Image.Resampling.NEAREST),
+        columns.resize(region, Image.Resampling.NEAREST),
+        scale=2.0,
+    )
+    return _colorize(mask, lut)
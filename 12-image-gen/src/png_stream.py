@@ -0,0 +1,71 @@
+"""
+Streaming PNG encoder.
+
+Pillow needs the whole image in memory before it can encode it, and then
+holds the whole encoded PNG as well. For very large images this module
+encodes one horizontal strip at a time instead: each strip is rendered,
+pushed through a single zlib compressor and emitted as an IDAT chunk, so
+peak memory depends on the strip size rather than on the image size.
+"""
+
+import struct
+import zlib
+from collections.abc import Callable, Iterator
+
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Uncompressed bytes rendered per strip. Larger strips compress slightly
+# better, smaller strips lower the peak memory.
+STRIP_BYTES = 1024 * 1024
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    """Frame data as a PNG chunk: length, type, data and CRC."""
+    crc = zlib.crc32(data, zlib.crc32(kind))
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+
+def iter_png(
+    size: tuple[int, int],
+    render_strip: Callable[[tuple[int, int, int, int]], Image.Image],
+    compress_level: int = 6,
+    strip_bytes: int = STRIP_BYTES,
+) -> Iterator[bytes]:
+    """
+    Encode an RGB image as PNG, yielding the file a chunk at a time.
+
+    Args:
+        size: (width, height) of the full image
+        render_strip: Called with a (left, top, right, bottom) box spanning
+            the full width, returns the RGB image for that region
+        compress_level: zlib compression level, 0-9
+        strip_bytes: Approximate number of uncompressed bytes per strip
+
+    Yields:
+        Consecutive pieces of the PNG file
+    """
+    width, height = size
+    stride = width * 3
+    strip_height = max(1, strip_bytes // stride)
+
+    # 8-bit RGB, default compression and filtering, no interlacing
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    yield PNG_SIGNATURE + _chunk(b"IHDR", header)
+
+    compressor = zlib.compressobj(compress_level)
+    for top in range(0, height, strip_height):
+        bottom = min(top + strip_height, height)
+        pixels = render_strip((0, top, width, bottom)).tobytes()
+
+        # Every scanline starts with its filter type, 0 meaning "None"
+        scanlines = b"".join(
+            b"\x00" + pixels[offset : offset + stride]
+            for offset in range(0, len(pixels), stride)
+        )
+        data = compressor.compress(scanlines)
+        if data:
+            yield _chunk(b"IDAT", data)
+
+    yield _chunk(b"IDAT", compressor.flush()) + _chunk(b"IEND", b"")
@@ -0,0 +1,96 @@
+"""
+Sprite sheet packing for the /batch endpoint.
+
+Images are packed into rows ("shelves"): sorted by height, placed left to
+right, and a new row is started whenever the next image does not fit in the
+sheet width. This is not optimal, but it is fast, deterministic and wastes
+little space for images of similar heights like badges.
+"""
+
+import json
+import math
+import secrets
+
+from PIL import Image
+
+# Gap between images, so scaled sprites don't bleed into each other
+GAP = 1
+
+
+def pack(sizes: list[tuple[int, int]]) -> tuple[tuple[int, int], list[tuple]]:
+    """
+    Compute the positions of images on a sprite sheet.
+
+    Args:
+        sizes: (width, height) of every image
+
+    Returns:
+        Tuple of the sheet size and the (x, y) position of every image, in the
+        same order as `sizes`
+    """
+    # Aim for a roughly square sheet, but never narrower than the widest image
+    area = sum((width + GAP) * (height + GAP) for width, height in sizes)
+    sheet_width = max(max(width for width, _ in sizes), math.isqrt(area))
+
+    positions = [None] * len(sizes)
+    x = y = shelf_height = 0
+    for index in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        width, height = sizes[index]
+        if x and x + width > sheet_width:
+            # Start a new shelf below the current one
+            x = 0
+            y += shelf_height + GAP
+            shelf_height = 0
+        positions[index] = (x, y)
+        x += width + GAP
+        shelf_height = max(shelf_height, height)
+
+    return (sheet_width, y + shelf_height), positions
+
+
+def compose(images: list[Image.Image]) -> tuple[Image.Image, list[dict]]:
+    """
+    Paste images onto a sprite sheet.
+
+    Returns:
+        Tuple of the sheet and a list with the x, y, width and height of every
+        image, in the same order as `images`
+    """
+    sizes = [image.size for image in images]
+    sheet_size, positions = pack(sizes)
+
+    sheet = Image.new("RGB", sheet_size, (255, 255, 255))
+    frames = []
+    for image, (x, y), (width, height) in zip(images, positions, sizes):
+        sheet.paste(image, (x, y))
+        frames.append({"x": x, "y": y, "width": width, "height": height})
+    return sheet, frames
+
+
+def multipart_body(sheet_map: dict, sprite: bytes, mime_type: str) -> tuple:
+    """
+    Build a multipart/form-data body holding the coordinate map and the sheet.
+
+    Browsers can parse it with `await response.formData()`, which gives the
+    map as a string under "map" and the image as a Blob under "sprite".
+
+    Returns:
+        Tuple of the body and its Content-Type header
+    """
+    boundary = secrets.token_hex(16)
+    extension = mime_type.split("/")[1]
+    body = b"".join(
+        [
+            f"--{boundary}\r\n".encode(),
+            b'Content-Disposition: form-data; name="map"\r\n',
+            b"Content-Type: application/json\r\n\r\n",
+            json.dumps(sheet_map).encode(),
+            f"\r\n--{boundary}\r\n".encode(),
+            b'Content-Disposition: form-data; name="sprite"; ',
+            f'filename="sprite.{extension}"\r\n'.encode(),
+            f"Content-Type: {mime_type}\r\n\r\n".encode(),
+            sprite,
+            f"\r\n--{boundary}--\r\n".encode(),
+        ]
+    )
+    return body, f"multipart/form-data; boundary={boundary}"
@@ -0,0 +1,85 @@
+"""
+Events per second the pipeline handles with and without the aggregator.
+
+Runs the stream of posts the consumer subscribes to by default (see
+sample.py) through the Pipeline of the consumer, once with no processor and
+once with the Aggregator of aggregation.py, and reports the rate of both and
+the cost of the aggregator per post. For reference, the full firehose is
+around 2,000 events per second, and a few hundred of them are posts.
+
+Run from the `14-websocket-stream-consumer` directory:
+
+    uv run python benchmarks/bench_aggregation.py [--sample jetstream.jsonl]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+import sample
+from aggregation import Aggregator
+from pipeline import POST_COLLECTION, Pipeline, collection_filter, collection_prefilter
+
+FRAMES = 100_000
+ROUNDS = 5
+
+
+class MemoryKV:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def put(self, key, value):
+        self.data[key] = value
+
+
+def run(frames: list[str], processors) -> Pipeline:
+    pipeline = Pipeline(
+        prefilters=[collection_prefilter([POST_COLLECTION])],
+        filters=[collection_filter([POST_COLLECTION])],
+        processors=processors,
+    )
+    for frame in frames:
+        pipeline.process(frame)
+    return pipeline
+
+
+def best_time(frames: list[str], make_processors) -> tuple[float, Pipeline, list]:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        processors = make_processors()
+        start = time.perf_counter()
+        pipeline = run(frames, processors)
+        best = min(best, time.perf_counter() - start)
+    return best, pipeline, processors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sample", help="recorded frames, one per line")
+    args = parser.parse_args()
+
+    if args.sample:
+        frames = sample.load(args.sample)
+    else:
+        frames = sample.generate(FRAMES, collections=[POST_COLLECTION])
+
+    base, pipeline, _ = best_time(frames, list)
+    aggregated, _, (aggregator,) = best_time(frames, lambda: [Aggregator(MemoryKV())])
+
+    print(f"{'variant':<12} {'events/s':>10}")
+    print(f"{'no processor':<12} {len(frames) / base:>10.0f}")
+    print(f"{'aggregator':<12} {len(frames) / aggregated:>10.0f}")
+    per_post = (aggregated - base) / max(pipeline.processed, 1) * 1e6
+    print(f"\n{pipeline.processed} posts, aggregator: {per_post:.2f} us per post")
+    print(json.dumps(aggregator.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
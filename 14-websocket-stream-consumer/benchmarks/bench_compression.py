@@ -0,0 +1,122 @@
+"""
+Bytes received and CPU per event, with and without zstd compressed frames.
+
+Compresses every frame of a sample (see sample.py) on its own with a zstd
+dictionary, like Jetstream does with `compress=true`, and runs the frames
+through the Pipeline of the consumer:
+
+- uncompressed: the JSON text, as the consumer receives it by default
+- zstd: the compressed frames, decompressed by the Decompressor of
+  compression.py, which reuses one context and dictionary
+- zstd, new context: the same with a new context per frame, for reference
+
+The dictionary is Jetstream's if given with --dictionary (see the README),
+otherwise one trained on another generated sample. Generated frames have
+random identifiers, which compress worse than real ones: use a recording of
+the firehose with --sample for realistic ratios.
+
+Run from the `14-websocket-stream-consumer` directory:
+
+    uv run python benchmarks/bench_compression.py \\
+        [--dictionary zstd_dictionary] [--sample jetstream.jsonl]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import zstandard
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+import sample
+from compression import Decompressor, load_dictionary
+from pipeline import POST_COLLECTION, Pipeline, collection_filter, collection_prefilter
+
+FRAMES = 50_000
+ROUNDS = 3
+DICTIONARY_SIZE = 112_640
+LEVEL = 3
+
+
+def make_pipeline(collections) -> Pipeline:
+    return Pipeline(
+        prefilters=[collection_prefilter(collections)],
+        filters=[collection_filter(collections)],
+    )
+
+
+def uncompressed(frames, compressed, dictionary, collections):
+    pipeline = make_pipeline(collections)
+    for frame in frames:
+        pipeline.process(frame)
+
+
+def reused_context(frames, compressed, dictionary, collections):
+    pipeline = make_pipeline(collections)
+    decompress = Decompressor(dictionary)
+    for data in compressed:
+        pipeline.process(decompress(data))
+
+
+def new_context(frames, compressed, dictionary, collections):
+    pipeline = make_pipeline(collections)
+    for data in compressed:
+        pipeline.process(Decompressor(dictionary)(data))
+
+
+VARIANTS = {
+    "uncompressed": uncompressed,
+    "zstd": reused_context,
+    "zstd, new context": new_context,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dictionary", help="Jetstream's zstd dictionary")
+    parser.add_argument("--sample", help="recorded frames, one per line")
+    args = parser.parse_args()
+
+    if args.dictionary:
+        dictionary = load_dictionary(args.dictionary)
+    else:
+        training = [frame.encode() for frame in sample.generate(FRAMES, seed=1)]
+        dictionary = zstandard.train_dictionary(DICTIONARY_SIZE, training).as_bytes()
+
+    if args.sample:
+        streams = {"recorded": sample.load(args.sample)}
+    else:
+        streams = {
+            "firehose": sample.generate(FRAMES),
+            "posts": sample.generate(FRAMES, collections=[POST_COLLECTION]),
+        }
+
+    compressor = zstandard.ZstdCompressor(
+        level=LEVEL, dict_data=zstandard.ZstdCompressionDict(dictionary)
+    )
+    print(f"{'stream':<10} {'variant':<18} {'bytes/event':>11} {'us/event':>9}")
+    for stream, frames in streams.items():
+        compressed = [compressor.compress(frame.encode()) for frame in frames]
+        sizes = {
+            "uncompressed": sum(len(frame.encode()) for frame in frames),
+            "compressed": sum(len(data) for data in compressed),
+        }
+        for name, variant in VARIANTS.items():
+            best = float("inf")
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                variant(frames, compressed, dictionary, [POST_COLLECTION])
+                best = min(best, time.perf_counter() - start)
+            size = sizes["uncompressed" if name == "uncompressed" else "compressed"]
+            print(
+                f"{stream:<10} {name:<18} {size / len(frames):>11.0f} "
+                f"{best / len(frames) * 1e6:>9.2f}"
+            )
+        ratio = sizes["uncompressed"] / sizes["compressed"]
+        print(f"{stream:<10} {'ratio':<18} {ratio:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
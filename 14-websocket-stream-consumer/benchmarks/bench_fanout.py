@@ -0,0 +1,120 @@
+"""
+Cost of dispatching the firehose to downstream subscribers.
+
+Dispatches a sample of the full firehose (see sample.py) to 1,000
+subscribers with different filters:
+
+- a few want everything,
+- most want one to three collections,
+- the others want the events of 1 to 100 DIDs, some of one collection only.
+
+and compares:
+- per subscriber: every frame is parsed once, then checked against the
+  filters of every subscriber
+- index: the DispatchIndex of fanout.py, which reads the collection and DID
+  from the frame and looks up its subscribers in the compiled index
+
+Sockets only count the frames they are sent, so the times are those of
+matching plus one Python call per frame sent.
+
+Run from the `14-websocket-stream-consumer` directory:
+
+    uv run python benchmarks/bench_fanout.py [--subscribers 1000]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+import sample
+from fanout import DispatchIndex, Subscriber
+
+FRAMES = 20_000
+ROUNDS = 3
+COLLECTIONS = [kind for kind in sample.MIX if kind.startswith("app.")]
+
+
+class CountingSocket:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, frame):
+        self.sent += 1
+
+
+def make_subscribers(count: int, seed: int = 1) -> list[Subscriber]:
+    rng = random.Random(seed)
+    subscribers = []
+    for _ in range(count):
+        kind = rng.random()
+        collections = dids = None
+        if kind < 0.02:
+            pass
+        elif kind < 0.70:
+            collections = frozenset(rng.sample(COLLECTIONS, rng.randint(1, 3)))
+        else:
+            dids = frozenset(sample.did(rng) for _ in range(rng.randint(1, 100)))
+            if rng.random() < 0.5:
+                collections = frozenset([rng.choice(COLLECTIONS)])
+        subscribers.append(Subscriber(CountingSocket(), collections, dids))
+    return subscribers
+
+
+def per_subscriber(frames: list[str], subscribers: list[Subscriber]):
+    for frame in frames:
+        event = json.loads(frame)
+        collection = event.get("commit", {}).get("collection")
+        did = event.get("did")
+        for subscriber in subscribers:
+            if subscriber.dids is not None and did not in subscriber.dids:
+                continue
+            if subscriber.wants(collection):
+                subscriber.ws.send(frame)
+
+
+def index(frames: list[str], subscribers: list[Subscriber]):
+    dispatch = DispatchIndex()
+    for subscriber in subscribers:
+        dispatch.add(subscriber)
+    for frame in frames:
+        dispatch.dispatch(frame)
+
+
+VARIANTS = {"per subscriber": per_subscriber, "index": index}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--sample", help="recorded frames, one per line")
+    args = parser.parse_args()
+
+    frames = sample.load(args.sample) if args.sample else sample.generate(FRAMES)
+    subscribers = make_subscribers(args.subscribers)
+
+    print(
+        f"{len(frames)} frames, {args.subscribers} subscribers\n"
+        f"{'variant':<15} {'frames/s':>10} {'us/frame':>9} {'sent/frame':>11}"
+    )
+    for name, variant in VARIANTS.items():
+        best = float("inf")
+        for _ in range(ROUNDS):
+            for subscriber in subscribers:
+                subscriber.ws.sent = 0
+            start = time.perf_counter()
+            variant(frames, subscribers)
+            best = min(best, time.perf_counter() - start)
+        sent = sum(subscriber.ws.sent for subscriber in subscribers)
+        print(
+            f"{name:<15} {len(frames) / best:>10.0f} "
+            f"{best / len(frames) * 1e6:>9.1f} {sent / len(frames):>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Events per second a single isolate can filter, with and without pre-filters.
+
+Compares, on a sample of Jetstream frames (see sample.py):
+- parse all: the previous handler, json.loads() of every frame, then the
+  checks on `kind` and `commit.collection`
+- pipeline: the Pipeline of the consumer, which drops frames that cannot
+  match before parsing them
+
+for two streams: the full firehose, where most frames are of other
+collections, and the stream of posts the consumer subscribes to by default,
+where Jetstream already dropped the other collections and only identity and
+account events are left to drop.
+
+Run from the `14-websocket-stream-consumer` directory:
+
+    uv run python benchmarks/bench_pipeline.py [--sample jetstream.jsonl]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+import sample
+from pipeline import (
+    POST_COLLECTION,
+    Pipeline,
+    collection_filter,
+    collection_prefilter,
+    time_us_of,
+)
+
+FRAMES = 100_000
+ROUNDS = 5
+
+
+def parse_all(frames: list[str]) -> int:
+    processed = 0
+    for frame in frames:
+        data = json.loads(frame)
+        data.get("time_us")
+        if data.get("kind") != "commit":
+            continue
+        if data.get("commit", {}).get("collection") != POST_COLLECTION:
+            continue
+        processed += 1
+    return processed
+
+
+def pipeline(frames: list[str]) -> int:
+    pipeline = Pipeline(
+        prefilters=[collection_prefilter([POST_COLLECTION])],
+        filters=[collection_filter([POST_COLLECTION])],
+    )
+    for frame in frames:
+        pipeline.process(frame)
+        time_us_of(frame)
+    return pipeline.processed
+
+
+VARIANTS = {"parse all": parse_all, "pipeline": pipeline}
+
+
+def best_rate(variant, frames: list[str]) -> tuple[float, int]:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        processed = variant(frames)
+        best = min(best, time.perf_counter() - start)
+    return len(frames) / best, processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sample", help="recorded frames, one per line")
+    args = parser.parse_args()
+
+    if args.sample:
+        firehose = sample.load(args.sample)
+        streams = {"recorded": firehose}
+    else:
+        streams = {
+            "firehose": sample.generate(FRAMES),
+            "posts": sample.generate(FRAMES, collections=[POST_COLLECTION]),
+        }
+
+    print(f"{'stream':<10} {'variant':<10} {'events/s':>10} {'processed':>10}")
+    for stream, frames in streams.items():
+        for name, variant in VARIANTS.items():
+            rate, processed = best_rate(variant, frames)
+            print(f"{stream:<10} {name:<10} {rate:>10.0f} {processed:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Jetstream samples for the benchmarks.
+
+A sample is a list of frames, the JSON text of Jetstream events as they
+arrive on the WebSocket. It is either loaded from a recording, one frame
+per line, made for instance with:
+
+    websocat 'wss://jetstream2.us-east.bsky.network/subscribe' \\
+        | head -n 100000 > jetstream.jsonl
+
+or generated, with the same shape as the real events and roughly the mix
+of the full firehose: mostly likes, then follows, posts and reposts, with a
+few deletions, identity and account events.
+"""
+
+import json
+import random
+
+# Share of the firehose per kind of event
+MIX = {
+    "app.bsky.feed.like": 0.55,
+    "app.bsky.graph.follow": 0.12,
+    "app.bsky.feed.post": 0.12,
+    "app.bsky.feed.repost": 0.10,
+    "app.bsky.graph.block": 0.02,
+    "app.bsky.actor.profile": 0.01,
+    "delete": 0.05,
+    "identity": 0.015,
+    "account": 0.015,
+}
+
+LANGS = ["en"] * 12 + ["ja"] * 5 + ["pt"] * 3 + ["de", "es", "fr", "ko"]
+TAGS = ["python", "cloudflare", "art", "photography", "news", "music", "bluesky"]
+WORDS = "the a to of and in is on for that with this was just like my new".split()
+
+START_TIME_US = 1_762_084_800_000_000
+
+
+def tid(rng: random.Random) -> str:
+    return f"3l{rng.getrandbits(52):013x}"[:13]
+
+
+def cid(rng: random.Random) -> str:
+    return f"bafyrei{rng.getrandbits(208):052x}"
+
+
+def did(rng: random.Random, users: int = 50_000) -> str:
+    return f"did:plc:{rng.randrange(users):024x}"
+
+
+def post_record(rng: random.Random, created_at: str) -> dict:
+    text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+    record = {
+        "$type": "app.bsky.feed.post",
+        "createdAt": created_at,
+        "langs": [rng.choice(LANGS)],
+        "text": text,
+    }
+    if rng.random() < 0.15:
+        tags = rng.sample(TAGS, rng.randint(1, 3))
+        record["text"] += " " + " ".join(f"#{tag}" for tag in tags)
+        record["facets"] = [
+            {
+                "$type": "app.bsky.richtext.facet",
+                "features": [{"$type": "app.bsky.richtext.facet#tag", "tag": tag}],
+                "index": {"byteEnd": 0, "byteStart": 0},
+            }
+            for tag in tags
+        ]
+    return record
+
+
+def make_record(rng: random.Random, collection: str, created_at: str) -> dict:
+    if collection == "app.bsky.feed.post":
+        return post_record(rng, created_at)
+    if collection in ("app.bsky.feed.like", "app.bsky.feed.repost"):
+        subject = f"at://{did(rng)}/app.bsky.feed.post/{tid(rng)}"
+        return {
+            "$type": collection,
+            "createdAt": created_at,
+            "subject": {"cid": cid(rng), "uri": subject},
+        }
+    if collection == "app.bsky.actor.profile":
+        return {"$type": collection, "displayName": "Someone", "description": "Hi"}
+    return {"$type": collection, "createdAt": created_at, "subject": did(rng)}
+
+
+def make_event(rng: random.Random, kind: str, time_us: int) -> dict:
+    author = did(rng)
+    created_at = "2025-11-02T12:00:00.000Z"
+    if kind in ("identity", "account"):
+        details = {"did": author, "seq": time_us // 1000, "time": created_at}
+        if kind == "identity":
+            details["handle"] = f"user{rng.randrange(50_000)}.bsky.social"
+        else:
+            details["active"] = True
+        return {"did": author, "time_us": time_us, "kind": kind, kind: details}
+
+    # Keys in the order Jetstream sends them
+    operation = "delete" if kind == "delete" else "create"
+    if kind == "delete":
+        collection = rng.choice(["app.bsky.feed.like", "app.bsky.feed.post"])
+    else:
+        collection = kind
+    commit = {
+        "rev": tid(rng),
+        "operation": operation,
+        "collection": collection,
+        "rkey": tid(rng),
+    }
+    if operation == "create":
+        commit["record"] = make_record(rng, collection, created_at)
+        commit["cid"] = cid(rng)
+    return {"did": author, "time_us": time_us, "kind": "commit", "commit": commit}
+
+
+def generate(count: int, collections=None, seed: int = 0) -> list[str]:
+    """
+    Generate `count` frames.
+
+    Args:
+        collections: Only keep the commits to these collections, like the
+            `wantedCollections` parameter does; identity and account events
+            are always sent
+    """
+    rng = random.Random(seed)
+    kinds = list(MIX)
+    weights = list(MIX.values())
+    frames = []
+    time_us = START_TIME_US
+    while len(frames) < count:
+        time_us += rng.randint(50, 800)
+        kind = rng.choices(kinds, weights)[0]
+        if collections and kind.startswith("app.") and kind not in collections:
+            continue
+        event = make_event(rng, kind, time_us)
+        if (
+            collections
+            and event["kind"] == "commit"
+            and event["commit"]["collection"] not in collections
+        ):
+            continue
+        # Jetstream sends compact JSON
+        frames.append(json.dumps(event, separators=(",", ":")))
+    return frames
+
+
+def load(path: str) -> list[str]:
+    """Load a recording, one frame per line."""
+    with open(path) as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS events (
+    did TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    rkey TEXT NOT NULL,
+    time_us INTEGER NOT NULL,
+    operation TEXT NOT NULL,
+    record TEXT,
+    PRIMARY KEY (did, collection, rkey, time_us)
+);
+
+CREATE INDEX IF NOT EXISTS events_time_us ON events (time_us);
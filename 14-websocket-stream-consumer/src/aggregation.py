@@ -0,0 +1,204 @@
+"""
+Windowed statistics of the posts in the firehose.
+
+The Aggregator is a pipeline processor, see pipeline.py, that keeps:
+
+- the number of posts per second over a sliding window of the last
+  RATE_WINDOW seconds, in a ring of per-second buckets,
+- the top languages and hashtags of tumbling windows of WINDOW seconds,
+  with the Space-Saving algorithm, which needs memory for a fixed number of
+  candidates however many distinct values the stream has.
+
+Time is the `time_us` of the events rather than the clock, so replayed
+events land in the windows they belong to. Memory is bounded and updating
+the counters allocates next to nothing per event: the strings counted are
+the ones json.loads() already created.
+
+The statistics are written to storage every FLUSH_INTERVAL_MS, and served
+from there until events arrive after a restart.
+"""
+
+import json
+import time
+
+from pipeline import POST_COLLECTION
+
+STATS_KEY = "stats"
+
+# Seconds of the sliding window of the post rate, and of the top-k windows
+RATE_WINDOW = 60
+WINDOW = 300
+
+# Values reported per top list, and candidates tracked for them
+TOP = 10
+CANDIDATES = 100
+
+FLUSH_INTERVAL_MS = 10_000
+
+
+class SpaceSaving:
+    """
+    Approximate top-k of a stream in fixed memory (Metwally et al., 2005).
+
+    At most `capacity` values are counted. A new value replaces the one with
+    the lowest count and inherits it, so counts can be overestimated by at
+    most the count they inherited, kept as their error. Any value occurring
+    more often than 1/capacity of the stream is guaranteed to be counted.
+    """
+
+    def __init__(self, capacity: int = CANDIDATES):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, value):
+        counts = self.counts
+        if value in counts:
+            counts[value] += 1
+        elif len(counts) < self.capacity:
+            counts[value] = 1
+            self.errors[value] = 0
+        else:
+            victim = min(counts, key=counts.get)
+            floor = counts.pop(victim)
+            del self.errors[victim]
+            counts[value] = floor + 1
+            self.errors[value] = floor
+
+    def top(self, n: int = TOP) -> list:
+        """The `n` most frequent values, as [value, count, error] lists."""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return [[value, count, self.errors[value]] for value, count in ranked[:n]]
+
+    def clear(self):
+        self.counts.clear()
+        self.errors.clear()
+
+
+class RateWindow:
+    """Event counts of the last `seconds` seconds, in per-second buckets."""
+
+    def __init__(self, seconds: int = RATE_WINDOW):
+        self.seconds = seconds
+        self.buckets = [0] * seconds
+        self.first = None
+        self.current = None
+
+    def add(self, second: int, count: int = 1):
+        """Count events at `second`; a count of 0 only moves the window."""
+        if self.current is None:
+            self.first = self.current = second
+        elif second > self.current:
+            # Empty the buckets of the seconds without events
+            for skipped in range(
+                self.current + 1, min(second, self.current + self.seconds) + 1
+            ):
+                self.buckets[skipped % self.seconds] = 0
+            self.current = second
+        elif second <= self.current - self.seconds:
+            return  # Too old for the window
+        self.buckets[second % self.seconds] += count
+
+    def per_second(self) -> float:
+        """Average rate over the window, or since the first event if shorter."""
+        if self.current is None:
+            return 0.0
+        elapsed = min(self.current - self.first + 1, self.seconds)
+        return sum(self.buckets) / elapsed
+
+    def last_second(self) -> int:
+        """Events of the last full second."""
+        if self.current is None or self.current == self.first:
+            return 0
+        return self.buckets[(self.current - 1) % self.seconds]
+
+
+class Aggregator:
+    """Pipeline processor keeping windowed statistics of posts."""
+
+    def __init__(
+        self,
+        kv,
+        window: int = WINDOW,
+        top: int = TOP,
+        flush_interval_ms: int = FLUSH_INTERVAL_MS,
+    ):
+        """
+        Args:
+            kv: Synchronous key-value storage of the Durable Object
+            window: Seconds of the tumbling windows of the top lists
+            top: Values reported per top list
+            flush_interval_ms: How often the statistics are written
+        """
+        self.kv = kv
+        self.window = window
+        self.top = top
+        self.flush_interval = flush_interval_ms / 1000
+        self.rate = RateWindow()
+        self.languages = SpaceSaving(max(CANDIDATES, top * 10))
+        self.hashtags = SpaceSaving(max(CANDIDATES, top * 10))
+        self.window_start = None
+        self.window_posts = 0
+        self.previous = None
+        self.last_flush = time.monotonic()
+
+    def __call__(self, event: dict):
+        commit = event.get("commit") or {}
+        if commit.get("collection") != POST_COLLECTION:
+            return
+        record = commit.get("record")
+        if record is None:
+            return  # Deleted post
+        second = event["time_us"] // 1_000_000
+        if self.window_start is None:
+            self.window_start = second - second % self.window
+        elif second >= self.window_start + self.window:
+            self.rotate(second)
+
+        self.rate.add(second)
+        self.window_posts += 1
+        for language in record.get("langs") or ():
+            self.languages.add(language)
+        for facet in record.get("facets") or ():
+            for feature in facet.get("features") or ():
+                if tag := feature.get("tag"):
+                    self.hashtags.add(tag.lower())
+
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def rotate(self, second: int):
+        """Close the current window and start the one holding `second`."""
+        self.previous = self.window_stats()
+        self.window_start = second - second % self.window
+        self.window_posts = 0
+        self.languages.clear()
+        self.hashtags.clear()
+
+    def window_stats(self) -> dict:
+        return {
+            "start": self.window_start,
+            "end": self.window_start + self.window,
+            "posts": self.window_posts,
+            "top_languages": self.languages.top(self.top),
+            "top_hashtags": self.hashtags.top(self.top),
+        }
+
+    def stats(self) -> dict:
+        """The statistics, those stored before a restart if there are no new ones."""
+        if self.window_start is None:
+            stored = self.kv.get(STATS_KEY)
+            return json.loads(stored) if stored else {}
+        return {
+            "posts_per_second": round(self.rate.per_second(), 2),
+            "posts_last_second": self.rate.last_second(),
+            "rate_window_seconds": self.rate.seconds,
+            "current_window": self.window_stats(),
+            "previous_window": self.previous,
+        }
+
+    def flush(self):
+        """Write the statistics to storage."""
+        self.last_flush = time.monotonic()
+        if self.window_start is not None:
+            self.kv.put(STATS_KEY, json.dumps(self.stats()))
@@ -0,0 +1,84 @@
+"""
+Checkpointing of the Jetstream cursor.
+
+Jetstream can replay the firehose from a cursor, the `time_us` of an event,
+so the consumer keeps the `time_us` of the last event it processed in
+storage and resumes from there after a restart. Writing it for every event
+would be thousands of storage writes per second, so it is only written once
+every CHECKPOINT_EVERY events, or CHECKPOINT_INTERVAL_MS after the last
+write, and when the connection closes or the alarm runs.
+
+The events processed since the last write are not lost if the Durable
+Object is restarted in between: the consumer resumes from the last written
+cursor, minus REPLAY_OVERLAP_MS to make up for events that are not strictly
+ordered by `time_us`, and processes them again. Delivery is at least once,
+so the same event can be processed twice around a restart.
+"""
+
+import time
+
+CURSOR_KEY = "last_event_timestamp"
+
+# Events, and milliseconds, after which the cursor is written
+CHECKPOINT_EVERY = 1000
+CHECKPOINT_INTERVAL_MS = 5000
+
+# How far before the written cursor to resume from
+REPLAY_OVERLAP_MS = 2000
+
+
+class Checkpointer:
+    """Keeps track of the cursor and writes it to storage from time to time."""
+
+    def __init__(
+        self,
+        kv,
+        every: int = CHECKPOINT_EVERY,
+        interval_ms: int = CHECKPOINT_INTERVAL_MS,
+        overlap_ms: int = REPLAY_OVERLAP_MS,
+    ):
+        """
+        Args:
+            kv: Synchronous key-value storage of the Durable Object
+            every: Events after which the cursor is written
+            interval_ms: Milliseconds after which the cursor is written
+            overlap_ms: How far before the written cursor to resume from
+        """
+        self.kv = kv
+        self.every = every
+        self.interval = interval_ms / 1000
+        self.overlap_us = overlap_ms * 1000
+        # Newest `time_us` processed, and the one in storage
+        self.cursor = None
+        self.saved = None
+        self.pending = 0
+        self.last_write = time.monotonic()
+        self.writes = 0
+
+    def advance(self, time_us: int):
+        """Record that the event at `time_us` was processed."""
+        if self.cursor is None or time_us > self.cursor:
+            self.cursor = time_us
+        self.pending += 1
+        if (
+            self.pending >= self.every
+            or time.monotonic() - self.last_write >= self.interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write the cursor now, if it moved since the last write."""
+        self.pending = 0
+        self.last_write = time.monotonic()
+        if self.cursor is None or self.cursor == self.saved:
+            return
+        self.kv.put(CURSOR_KEY, self.cursor)
+        self.saved = self.cursor
+        self.writes += 1
+
+    def resume_cursor(self) -> int | None:
+        """The cursor to connect with, None to start from the live stream."""
+        saved = self.kv.get(CURSOR_KEY)
+        if not saved:
+            return None
+        return max(int(saved) - self.overlap_us, 0)
@@ -0,0 +1,75 @@
+"""
+Compressed ingestion of the Jetstream frames.
+
+With `compress=true` Jetstream sends every event as a binary frame,
+compressed with zstd and a dictionary trained on the firehose, which makes
+frames several times smaller than the JSON text. The dictionary is not sent:
+clients need the one Jetstream uses, see the README.
+
+Setting up a decompression context and loading a dictionary is much more
+expensive than decompressing one small frame, so the Decompressor keeps a
+single context with the dictionary loaded, and reuses it for every frame.
+
+zstandard is a dependency of the example but only imported when
+compression is enabled, so the default, uncompressed path does not load it.
+Compression that is asked for but cannot work is an error, rather than a
+silent fallback to uncompressed frames, see load_decompressor().
+"""
+
+from pathlib import Path
+
+DICTIONARY_PATH = Path(__file__).parent / "zstd_dictionary"
+
+# Upper bound of a decompressed frame, for frames without their content size
+MAX_FRAME_SIZE = 1 << 20
+
+
+def load_dictionary(path=DICTIONARY_PATH) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_decompressor(path=DICTIONARY_PATH) -> "Decompressor":
+    """
+    Return a Decompressor with the dictionary at `path`.
+
+    Raises:
+        RuntimeError: If zstandard or the dictionary is missing, saying which
+    """
+    try:
+        dictionary = load_dictionary(path)
+    except OSError as e:
+        raise RuntimeError(
+            f"JETSTREAM_COMPRESS needs the Jetstream dictionary in {path}, "
+            f"see the README: {e}"
+        ) from e
+    try:
+        return Decompressor(dictionary)
+    except ImportError as e:
+        raise RuntimeError(
+            f"JETSTREAM_COMPRESS needs the zstandard package: {e}"
+        ) from e
+
+
+class Decompressor:
+    """Decompress Jetstream frames with one reusable context and dictionary."""
+
+    def __init__(self, dictionary: bytes):
+        import zstandard
+
+        self.context = zstandard.ZstdDecompressor(
+            dict_data=zstandard.ZstdCompressionDict(dictionary)
+        )
+        # Bytes received and decompressed
+        self.received = 0
+        self.decompressed = 0
+
+    def __call__(self, data: bytes) -> str:
+        """The JSON text of a compressed frame."""
+        text = self.context.decompress(data, max_output_size=MAX_FRAME_SIZE)
+        self.received += len(data)
+        self.decompressed += len(text)
+        return text.decode()
+
+    def ratio(self) -> float:
+        return self.decompressed / self.received if self.received else 0.0
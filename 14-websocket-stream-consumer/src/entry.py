@@ -1,11 +1,35 @@
+import asyncio
 import json
 import time
 from urllib.parse import urlparse
 
 import js
+from aggregation import FLUSH_INTERVAL_MS, TOP, WINDOW, Aggregator
+from checkpoint import (
+    CHECKPOINT_EVERY,
+    CHECKPOINT_INTERVAL_MS,
+    REPLAY_OVERLAP_MS,
+    Checkpointer,
+)
+from compression import load_decompressor
+from fanout import DispatchIndex, Subscriber, check_filters, parse_filters
+from health import STALL_TIMEOUT_MS, StreamHealth
+from pipeline import (
+    POST_COLLECTION,
+    Pipeline,
+    PrintSampler,
+    collection_filter,
+    collection_prefilter,
+    time_us_of,
+)
 from pyodide.ffi import create_proxy
+from sinks import configured_sinks
 from workers import DurableObject, Response, WorkerEntrypoint
 
+# Jetstream endpoint - we'll filter for posts
+# Using wantedCollections parameter to only get post events
+JETSTREAM_URL = "wss://jetstream2.us-east.bsky.network/subscribe"
+
 
 class BlueskyFirehoseConsumer(DurableObject):
     """Durable Object that maintains a persistent WebSocket connection to Bluesky Jetstream."""
@@ -14,12 +38,72 @@ class BlueskyFirehoseConsumer(DurableObject):
         super().__init__(state, env)
         self.websocket = None
         self.connected = False
-        self.last_print_time = 0  # Track last time we printed a post
+        # Event listeners of the current socket, removed when it is replaced
+        self.listeners = []
+        # Pending reconnection and stall check, see health.py
+        self.reconnect_handle = None
+        self.stall_watch = None
+        self.health = StreamHealth(
+            stall_timeout_ms=int(
+                getattr(env, "STALL_TIMEOUT_MS", None) or STALL_TIMEOUT_MS
+            )
+        )
+        # Collections to subscribe to, comma-separated
+        self.collections = (
+            getattr(env, "WANTED_COLLECTIONS", None) or POST_COLLECTION
+        ).split(",")
+        # Windowed statistics of the posts, served from /stats
+        self.aggregator = Aggregator(
+            self.ctx.storage.kv,
+            window=int(getattr(env, "STATS_WINDOW_SECONDS", None) or WINDOW),
+            top=int(getattr(env, "STATS_TOP", None) or TOP),
+            flush_interval_ms=int(
+                getattr(env, "STATS_FLUSH_INTERVAL_MS", None) or FLUSH_INTERVAL_MS
+            ),
+        )
+        # Batched writes of the events to the D1, R2 and Queue bindings
+        # configured, if any, see sinks.py
+        flush_interval_ms = getattr(env, "SINK_FLUSH_INTERVAL_MS", None)
+        self.sinks = configured_sinks(
+            env,
+            batch_size=int(getattr(env, "SINK_BATCH_SIZE", None) or 0) or None,
+            flush_interval=int(flush_interval_ms) / 1000 if flush_interval_ms else None,
+        )
+        # Drop the events of other collections, before parsing them if
+        # possible, print at most one post per second, aggregate the posts
+        # and write the events to the sinks, see pipeline.py
+        self.pipeline = Pipeline(
+            prefilters=[collection_prefilter(self.collections)],
+            filters=[collection_filter(self.collections)],
+            processors=[PrintSampler(interval=1.0), self.aggregator, *self.sinks],
+        )
+        # Where to resume from on reconnect, written every few thousand events
+        self.checkpoint = Checkpointer(
+            self.ctx.storage.kv,
+            every=int(getattr(env, "CHECKPOINT_EVERY", None) or CHECKPOINT_EVERY),
+            interval_ms=int(
+                getattr(env, "CHECKPOINT_INTERVAL_MS", None) or CHECKPOINT_INTERVAL_MS
+            ),
+            overlap_ms=int(
+                getattr(env, "REPLAY_OVERLAP_MS", None) or REPLAY_OVERLAP_MS
+            ),
+        )
+        # Opt-in zstd compressed frames, see compression.py. The Durable
+        # Object does not start if they cannot be decompressed.
+        self.decompress = None
+        if (getattr(env, "JETSTREAM_COMPRESS", None) or "").lower() == "true":
+            self.decompress = load_decompressor()
+        # Downstream subscribers to the frames, see fanout.py. Their filters
+        # are attached to their sockets, which outlive a restart.
+        self.subscribers = DispatchIndex()
+        for ws in self.ctx.getWebSockets():
+            self.subscribers.add(Subscriber.from_attachment(ws))
 
     async def fetch(self, request):
         """Handle incoming requests to the Durable Object."""
-        # If we're not connected then make sure we start a connection.
-        if not self.connected:
+        # If we're not connected, or about to reconnect, then make sure we
+        # start a connection.
+        if self.websocket is None and self.reconnect_handle is None:
             await self._schedule_next_alarm()
             await self._connect_to_jetstream()
 
@@ -27,15 +111,91 @@ class BlueskyFirehoseConsumer(DurableObject):
         path = url.path
 
         if path == "/status":
-            status = "connected" if self.connected else "disconnected"
-            return Response(f"Firehose status: {status}")
+            return Response.json(self.status())
+        elif path == "/stats":
+            return Response.json(self.aggregator.stats())
+        elif path == "/subscribe":
+            return self.subscribe(request, url.query)
+        else:
+            return Response("Available endpoints: /status, /stats, /subscribe")
+
+    def status(self) -> dict:
+        """Connection state, event rate, lag and failures, see health.py."""
+        if self.connected:
+            state = "connected"
+        elif self.websocket is not None:
+            state = "connecting"
+        elif self.reconnect_handle is not None:
+            state = "reconnecting"
         else:
-            return Response("Available endpoints: /status")
+            state = "disconnected"
+        return {
+            "status": state,
+            **self.health.status(),
+            "pipeline": self.pipeline.metrics(),
+            "subscribers": self.subscribers.metrics(),
+            "sinks": [sink.metrics() for sink in self.sinks],
+        }
+
+    def subscribe(self, request, query):
+        """Accept a downstream subscriber to the frames, see fanout.py."""
+        if request.headers.get("Upgrade") != "websocket":
+            return Response("Expected a WebSocket upgrade", status=426)
+        try:
+            collections, dids = parse_filters(query, self.collections)
+        except ValueError as e:
+            return Response(str(e), status=400)
+
+        client, server = js.WebSocketPair.new().object_values()
+        self.ctx.acceptWebSocket(server)
+        subscriber = Subscriber(server, collections, dids)
+        server.serializeAttachment(subscriber.attachment())
+        self.subscribers.add(subscriber)
+        print(f"Subscriber connected. Subscribers: {len(self.subscribers)}")
+        return Response(None, status=101, web_socket=client)
+
+    async def webSocketMessage(self, ws, message):
+        """Update the filters of a subscriber, like Jetstream's options_update."""
+        if not isinstance(message, str):
+            return
+        try:
+            msg = json.loads(message)
+            if msg.get("type") != "options_update":
+                return
+            options = msg.get("payload", {})
+            collections, dids = check_filters(
+                options.get("wantedCollections"),
+                options.get("wantedDids"),
+                self.collections,
+            )
+        except (ValueError, AttributeError, TypeError) as e:
+            ws.send(json.dumps({"type": "error", "error": str(e)}))
+            return
+        subscriber = Subscriber.from_attachment(ws)
+        subscriber.collections, subscriber.dids = collections, dids
+        ws.serializeAttachment(subscriber.attachment())
+        self.subscribers.add(subscriber)
+
+    async def webSocketClose(self, ws, code, reason, wasClean):
+        """Forget a subscriber that disconnected."""
+        ws.close(code, reason)
+        self.subscribers.remove(Subscriber.from_attachment(ws).id)
+        print(f"Subscriber disconnected. Subscribers: {len(self.subscribers)}")
+
+    async def webSocketError(self, ws, error):
+        """Forget a subscriber whose socket failed."""
+        ws.close(1011, "WebSocket error")
+        self.subscribers.remove(Subscriber.from_attachment(ws).id)
+        print(f"Subscriber error: {error}")
 
     async def alarm(self):
         """Handle alarm events - used to ensure that the DO stays alive and connected"""
         print("Alarm triggered - making sure we are connected to jetstream...")
-        if not self.connected:
+        self.checkpoint.flush()
+        self.aggregator.flush()
+        for sink in self.sinks:
+            await sink.flush()
+        if self.websocket is None and self.reconnect_handle is None:
             await self._connect_to_jetstream()
         else:
             print("Already connected, skipping reconnection")
@@ -53,65 +213,114 @@ class BlueskyFirehoseConsumer(DurableObject):
         """Handle WebSocket open event."""
         self.connected = True
         print("Connected to Bluesky Jetstream firehose!")
-        print("Filtering for: app.bsky.feed.post (post events, rate limited to 1/sec)")
+        print(f"Filtering for: {', '.join(self.collections)} (rate limited to 1/sec)")
         # Ensure alarm is set when we connect
         await self._schedule_next_alarm()
 
     def _on_message(self, event):
         """Handle incoming WebSocket messages."""
         try:
-            # Parse the JSON message
-            data = json.loads(event.data)
-
-            # Store the timestamp for resumption on reconnect
-            if time_us := data.get("time_us"):
-                # Store the timestamp asynchronously
-                self.ctx.storage.kv.put("last_event_timestamp", time_us)
-
-            # Jetstream sends different event types
-            # We're interested in 'commit' events which contain posts
-            if data.get("kind") != "commit":
-                return
+            frame = event.data
+            if not isinstance(frame, str):
+                # A compressed frame, decompressed once for every stage
+                frame = self.decompress(frame.to_bytes())
+            # Forward the frame as is to the subscribers that want it
+            self.subscribers.dispatch(frame)
+            self.pipeline.process(frame)
 
-            commit = data.get("commit", {})
-            collection = commit.get("collection")
-
-            # Filter for post events
-            if collection != "app.bsky.feed.post":
-                return
-
-            # Rate limiting: only print at most 1 per second
-            current_time = time.time()
-            if current_time - self.last_print_time >= 1.0:
-                record = commit.get("record", {})
-                print("Post record", record)
-
-                # Update last print time
-                self.last_print_time = current_time
+            # Record the timestamp for resumption on reconnect, once the event
+            # was handled, see checkpoint.py
+            time_us = time_us_of(frame)
+            if time_us:
+                self.checkpoint.advance(self._written_up_to(time_us))
+            self.health.frame(time_us)
 
         except Exception as e:
             print(f"Error processing message: {e}")
 
-    def _on_error(self, event):
+    def _written_up_to(self, time_us: int) -> int:
+        """
+        The cursor to checkpoint after the event at `time_us`: not past the
+        oldest event buffered by a sink, so that it is replayed after a
+        restart if it was not written, see sinks.py.
+        """
+        for sink in self.sinks:
+            oldest = sink.oldest
+            if oldest is not None and oldest < time_us:
+                time_us = oldest
+        return time_us
+
+    async def _on_error(self, event):
         """Handle WebSocket error event."""
-        print(f"WebSocket error: {event}")
-        self.connected = False
-        self.ctx.abort("WebSocket error occurred")
+        self._schedule_reconnect(f"WebSocket error: {event}")
 
     async def _on_close(self, event):
         """Handle WebSocket close event."""
-        print(f"WebSocket closed: code={event.code}, reason={event.reason}")
+        self._schedule_reconnect(
+            f"WebSocket closed: code={event.code}, reason={event.reason}"
+        )
+
+    def _schedule_reconnect(self, reason: str):
+        """Drop the connection and reconnect after a backoff delay, see health.py."""
+        self.health.error(reason)
+        # Save the progress, in case the Durable Object is evicted meanwhile
+        self.checkpoint.flush()
+        self.aggregator.flush()
+        for sink in self.sinks:
+            asyncio.ensure_future(sink.flush())
+        self._disconnect(reason)
+        if self.reconnect_handle is not None:
+            return
+        delay = self.health.backoff.next()
+        print(f"Reconnecting to Jetstream in {delay:.1f}s")
+        self.reconnect_handle = asyncio.get_running_loop().call_later(
+            delay, lambda: asyncio.ensure_future(self._reconnect())
+        )
+
+    async def _reconnect(self):
+        self.reconnect_handle = None
+        self.health.reconnects += 1
+        await self._connect_to_jetstream()
+
+    def _disconnect(self, reason: str):
+        """Stop listening to the current socket, and close it."""
+        ws, self.websocket = self.websocket, None
         self.connected = False
-        self.ctx.abort("WebSocket closed")
+        if ws is None:
+            return
+        for name, proxy in self.listeners:
+            ws.removeEventListener(name, proxy)
+            proxy.destroy()
+        self.listeners = []
+        try:
+            ws.close(1000, reason[:120])
+        except Exception as e:
+            print(f"Error closing WebSocket: {e}")
+
+    def _watch_for_stall(self):
+        """Reconnect if no frame arrived for a while, and check again later."""
+        if self.websocket is not None and self.health.stalled():
+            timeout = self.health.stall_timeout
+            self._schedule_reconnect(f"No frame received for {timeout:.0f}s")
+        self.stall_watch = asyncio.get_running_loop().call_later(
+            self.health.stall_timeout / 4, self._watch_for_stall
+        )
 
     async def _connect_to_jetstream(self):
         """Connect to the Bluesky Jetstream WebSocket and start consuming events."""
-        # Get the last event timestamp from storage to resume from the right position
-        last_timestamp = self.ctx.storage.kv.get("last_event_timestamp")
+        # Resume a little before the last checkpoint, see checkpoint.py
+        last_timestamp = self.checkpoint.resume_cursor()
 
-        # Jetstream endpoint - we'll filter for posts
-        # Using wantedCollections parameter to only get post events
-        jetstream_url = "wss://jetstream2.us-east.bsky.network/subscribe?wantedCollections=app.bsky.feed.post"
+        jetstream_url = (
+            JETSTREAM_URL
+            + "?"
+            + "&".join(
+                f"wantedCollections={collection}" for collection in self.collections
+            )
+        )
+
+        if self.decompress:
+            jetstream_url += "&compress=true"
 
         # If we have a last timestamp, add it to resume from that point
         if last_timestamp:
@@ -124,24 +333,35 @@ class BlueskyFirehoseConsumer(DurableObject):
                 f"Connecting to Bluesky Jetstream at {jetstream_url} (starting fresh)"
             )
 
+        # Replace the previous connection, if any
+        self._disconnect("Reconnecting")
+
         # Create WebSocket using JS FFI
         ws = js.WebSocket.new(jetstream_url)
         self.websocket = ws
+        self.health.connecting()
 
         # Attach event handlers
         #
-        # Note that ordinarily proxies need to be destroyed once they are no longer used.
-        # However, in this Durable Object context, the WebSocket and its event listeners
-        # persist for the lifetime of the Durable Object, so we don't explicitly destroy
-        # the proxies here. When the websocket connection closes, the Durable Object
-        # is restarted which destroys these proxies.
+        # Note that proxies need to be destroyed once they are no longer used.
+        # The consumer reconnects without restarting the Durable Object, so the
+        # listeners are kept, to be removed and destroyed with the socket, see
+        # _disconnect().
         #
         # In the future, we plan to provide support for native Python websocket APIs which
         # should eliminate the need for proxy wrappers.
-        ws.addEventListener("open", create_proxy(self._on_open))
-        ws.addEventListener("message", create_proxy(self._on_message))
-        ws.addEventListener("error", create_proxy(self._on_error))
-        ws.addEventListener("close", create_proxy(self._on_close))
+        for name, handler in [
+            ("open", self._on_open),
+            ("message", self._on_message),
+            ("error", self._on_error),
+            ("close", self._on_close),
+        ]:
+            proxy = create_proxy(handler)
+            ws.addEventListener(name, proxy)
+            self.listeners.append((name, proxy))
+
+        if self.stall_watch is None:
+            self._watch_for_stall()
 
 
 class Default(WorkerEntrypoint):
@@ -0,0 +1,211 @@
+"""
+Fan-out of the Jetstream frames to downstream subscribers.
+
+The consumer holds the one upstream connection to Jetstream, and other
+workers subscribe to it with a WebSocket to `/subscribe`, with the same
+`wantedCollections` and `wantedDids` parameters as Jetstream. A frame goes
+to a subscriber if:
+
+- it is a commit to one of its collections, or it did not ask for any
+  collections, or it is an identity or account event, which Jetstream always
+  sends,
+- and it is from one of its DIDs, or it did not ask for any DIDs.
+
+Matching every frame against every subscriber would cost one check per
+subscriber per frame. Instead the filters are compiled, when subscribers
+come and go, into a dispatch index: the tuple of subscribers to send the
+commits of each collection to, and the subscribers of each DID. A frame is
+then matched once, with two dict lookups, and sent as is to the subscribers
+of the tuple. Its collection and DID are read from the JSON text, so frames
+are not parsed for the fan-out either.
+"""
+
+import json
+import secrets
+from urllib.parse import parse_qs
+
+# Jetstream accepts up to 100 collections and 10,000 DIDs per subscriber
+MAX_COLLECTIONS = 100
+MAX_DIDS = 10_000
+
+
+def string_field(frame: str, key: str) -> str | None:
+    """
+    Read the first string value of `key` in a frame without parsing it.
+
+    Jetstream sends the `did` of an event first and the `collection` of a
+    commit before its record, so the first match is the one of the event.
+    """
+    needle = f'"{key}":"'
+    start = frame.find(needle)
+    if start < 0:
+        return None
+    start += len(needle)
+    end = frame.find('"', start)
+    return frame[start:end] if end >= 0 else None
+
+
+def parse_filters(query: str, upstream) -> tuple:
+    """
+    Read the filters of a subscriber from the query string of its request.
+
+    Returns:
+        The collections and DIDs it wants, None for any
+
+    Raises:
+        ValueError: if it wants collections the consumer does not subscribe to
+    """
+    params = parse_qs(query)
+    return check_filters(
+        params.get("wantedCollections"), params.get("wantedDids"), upstream
+    )
+
+
+def check_filters(collections, dids, upstream) -> tuple:
+    collections = frozenset(collections) if collections else None
+    dids = frozenset(dids) if dids else None
+    if collections and len(collections) > MAX_COLLECTIONS:
+        raise ValueError(f"At most {MAX_COLLECTIONS} collections")
+    if dids and len(dids) > MAX_DIDS:
+        raise ValueError(f"At most {MAX_DIDS} DIDs")
+    if collections and not collections <= frozenset(upstream):
+        missing = ", ".join(sorted(collections - frozenset(upstream)))
+        raise ValueError(f"Collections not in the upstream subscription: {missing}")
+    return collections, dids
+
+
+class Subscriber:
+    """A downstream WebSocket and its filters."""
+
+    __slots__ = ("id", "ws", "collections", "dids")
+
+    def __init__(self, ws, collections=None, dids=None, id=None):
+        self.id = id or secrets.token_hex(8)
+        self.ws = ws
+        self.collections = collections
+        self.dids = dids
+
+    def wants(self, collection: str | None) -> bool:
+        return (
+            collection is None
+            or self.collections is None
+            or collection in self.collections
+        )
+
+    def attachment(self) -> str:
+        """The filters, to attach to the socket with serializeAttachment()."""
+        return json.dumps(
+            {
+                "id": self.id,
+                "wantedCollections": sorted(self.collections or ()),
+                "wantedDids": sorted(self.dids or ()),
+            }
+        )
+
+    @classmethod
+    def from_attachment(cls, ws):
+        """The subscriber of a socket accepted before a restart."""
+        attachment = json.loads(ws.deserializeAttachment())
+        return cls(
+            ws,
+            frozenset(attachment["wantedCollections"]) or None,
+            frozenset(attachment["wantedDids"]) or None,
+            attachment["id"],
+        )
+
+
+class DispatchIndex:
+    """Subscribers, and the index of who wants which frames."""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.compiled = False
+        # Frames sent, and subscribers dropped because sending failed
+        self.sent = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def add(self, subscriber: Subscriber):
+        self.subscribers[subscriber.id] = subscriber
+        self.compiled = False
+
+    def remove(self, id: str):
+        if self.subscribers.pop(id, None) is not None:
+            self.compiled = False
+
+    def compile(self):
+        """Build the routes of the frames from the filters of the subscribers."""
+        # Subscribers of every DID, by collection, or of every collection
+        by_collection = {}
+        everything = []
+        # Subscribers of some DIDs only, whose collections are checked per frame
+        by_did = {}
+        for subscriber in self.subscribers.values():
+            if subscriber.dids is not None:
+                for did in subscriber.dids:
+                    by_did.setdefault(did, []).append(subscriber)
+            elif subscriber.collections is None:
+                everything.append(subscriber)
+            else:
+                for collection in subscriber.collections:
+                    by_collection.setdefault(collection, []).append(subscriber)
+
+        self.everything = tuple(everything)
+        self.routes = {
+            collection: tuple(subscribers) + self.everything
+            for collection, subscribers in by_collection.items()
+        }
+        # Identity and account events go to the subscribers of every DID,
+        # and to those of theirs
+        self.of_any_did = tuple(
+            subscriber
+            for subscriber in self.subscribers.values()
+            if subscriber.dids is None
+        )
+        self.by_did = {did: tuple(subscribers) for did, subscribers in by_did.items()}
+        self.compiled = True
+
+    def match(self, collection: str | None, did: str | None) -> tuple:
+        """The subscribers of a frame, from its collection and DID."""
+        if not self.compiled:
+            self.compile()
+        if collection is None:
+            targets = self.of_any_did
+        else:
+            targets = self.routes.get(collection, self.everything)
+        if self.by_did and (of_did := self.by_did.get(did)):
+            targets += tuple(
+                subscriber for subscriber in of_did if subscriber.wants(collection)
+            )
+        return targets
+
+    def dispatch(self, frame: str) -> int:
+        """Send a frame to its subscribers, and return how many there were."""
+        if not self.subscribers:
+            return 0
+        targets = self.match(
+            string_field(frame, "collection"), string_field(frame, "did")
+        )
+        failed = None
+        for subscriber in targets:
+            try:
+                subscriber.ws.send(frame)
+            except Exception as e:
+                print(f"Dropping subscriber {subscriber.id}: {e}")
+                failed = failed or []
+                failed.append(subscriber.id)
+        if failed:
+            for id in failed:
+                self.remove(id)
+            self.dropped += len(failed)
+        self.sent += len(targets) - len(failed or ())
+        return len(targets)
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
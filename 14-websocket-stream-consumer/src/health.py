@@ -0,0 +1,106 @@
+"""
+Reconnection and health of the connection to Jetstream.
+
+A connection to Jetstream can close, fail, or stall: stay open without
+sending frames. Rather than restarting the Durable Object and waiting for the
+next alarm to reconnect, up to a minute later, the consumer reconnects in
+process:
+
+- after a close or an error, with exponential backoff and full jitter, so
+  that a Jetstream outage is not met with a reconnection storm: the n-th
+  attempt waits a random delay between 0 and min(BACKOFF_CAP, BACKOFF_BASE *
+  2**n) seconds, and the first frame of a new connection resets the backoff,
+- when no frame arrived for STALL_TIMEOUT_MS, which a stall detector checks
+  every quarter of it.
+
+StreamHealth keeps what `/status` reports: events per second, lag behind the
+`time_us` of the last event, reconnections and the last error.
+"""
+
+import random
+import time
+
+from aggregation import RateWindow
+
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 60.0
+STALL_TIMEOUT_MS = 30_000
+
+# Seconds of the window of the event rate
+RATE_WINDOW = 10
+
+
+class Backoff:
+    """Delays between reconnection attempts, exponential with full jitter."""
+
+    def __init__(self, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP, rng=None):
+        self.base = base
+        self.cap = cap
+        self.rng = rng or random.Random()
+        self.attempt = 0
+
+    def next(self) -> float:
+        """The delay before the next attempt, in seconds."""
+        ceiling = min(self.cap, self.base * 2**self.attempt)
+        self.attempt += 1
+        return self.rng.uniform(0, ceiling)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class StreamHealth:
+    """Event rate, lag and failures of the connection to Jetstream."""
+
+    def __init__(self, stall_timeout_ms: int = STALL_TIMEOUT_MS):
+        self.stall_timeout = stall_timeout_ms / 1000
+        self.backoff = Backoff()
+        self.rate = RateWindow(RATE_WINDOW)
+        self.frames = 0
+        self.last_frame = None
+        self.last_time_us = None
+        self.reconnects = 0
+        self.last_error = None
+
+    def frame(self, time_us: int | None):
+        """Record a frame, and the `time_us` of its event if known."""
+        self.frames += 1
+        self.last_frame = time.monotonic()
+        self.rate.add(int(time.time()))
+        if time_us:
+            self.last_time_us = time_us
+        if self.backoff.attempt:
+            # The connection works, start over with short delays
+            self.backoff.reset()
+
+    def connecting(self):
+        """Record a new connection; it is not stalled until it had time to send."""
+        self.last_frame = time.monotonic()
+
+    def stalled(self) -> bool:
+        if self.last_frame is None:
+            return False
+        return time.monotonic() - self.last_frame > self.stall_timeout
+
+    def error(self, message: str):
+        self.last_error = {"message": message, "time": int(time.time())}
+        print(f"Jetstream connection: {message}")
+
+    def status(self) -> dict:
+        now = time.time()
+        # Move the window to now, so that a stall shows as a rate dropping
+        self.rate.add(int(now), 0)
+        lag = None
+        if self.last_time_us:
+            lag = round(max(now - self.last_time_us / 1_000_000, 0), 3)
+        idle = None
+        if self.last_frame is not None:
+            idle = round(time.monotonic() - self.last_frame, 3)
+        return {
+            "events_per_second": round(self.rate.per_second(), 2),
+            "events": self.frames,
+            "lag_seconds": lag,
+            "seconds_since_last_frame": idle,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
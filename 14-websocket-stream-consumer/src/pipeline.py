@@ -0,0 +1,118 @@
+"""
+Filter and processor pipeline of the firehose consumer.
+
+Every Jetstream frame goes through three stages:
+
+1. Pre-filters look at the raw JSON text of the frame. Most frames are
+   dropped, and a substring check is much cheaper than json.loads(), so
+   frames that cannot match are dropped before they are parsed. Jetstream
+   sends compact JSON, `"collection":"app.bsky.feed.post"` without spaces.
+2. Filters look at the parsed event. A pre-filter can let through a frame
+   that only mentions a collection, in the text of a post for instance, so
+   filters make the exact decision.
+3. Processors are called with every event that passed the filters.
+
+Pre-filters and filters are functions returning whether to keep the frame
+or event, processors are functions taking the event.
+"""
+
+import json
+import time
+
+POST_COLLECTION = "app.bsky.feed.post"
+
+
+def contains(*needles: str):
+    """Pre-filter keeping the frames that contain any of `needles`."""
+    if len(needles) == 1:
+        (needle,) = needles
+        return lambda frame: needle in frame
+    return lambda frame: any(needle in frame for needle in needles)
+
+
+def collection_prefilter(collections):
+    """Pre-filter keeping the frames that mention any of `collections`."""
+    return contains(*(f'"collection":"{collection}"' for collection in collections))
+
+
+def collection_filter(collections):
+    """Filter keeping the commits to any of `collections`."""
+    collections = frozenset(collections)
+
+    def keep(event: dict) -> bool:
+        if event.get("kind") != "commit":
+            return False
+        return event.get("commit", {}).get("collection") in collections
+
+    return keep
+
+
+def time_us_of(frame: str) -> int | None:
+    """Read the `time_us` of a frame without parsing it."""
+    start = frame.find('"time_us":')
+    if start < 0:
+        return None
+    start += len('"time_us":')
+    end = frame.find(",", start)
+    try:
+        return int(frame[start : end if end >= 0 else None].rstrip("}"))
+    except ValueError:
+        return None
+
+
+class PrintSampler:
+    """Processor printing the record of at most one event per `interval` seconds."""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.last_print_time = 0  # Track last time we printed a post
+
+    def __call__(self, event: dict):
+        current_time = time.time()
+        if current_time - self.last_print_time >= self.interval:
+            record = event.get("commit", {}).get("record", {})
+            print("Post record", record)
+            self.last_print_time = current_time
+
+
+class Pipeline:
+    """Pre-filters, filters and processors applied to every frame."""
+
+    def __init__(self, prefilters=(), filters=(), processors=()):
+        self.prefilters = list(prefilters)
+        self.filters = list(filters)
+        self.processors = list(processors)
+        # Frames seen, dropped before parsing, and processed
+        self.frames = 0
+        self.prefiltered = 0
+        self.processed = 0
+
+    def process(self, frame: str) -> dict | None:
+        """
+        Run a frame through the pipeline.
+
+        Returns:
+            The parsed event if it reached the processors, None otherwise
+        """
+        self.frames += 1
+        for prefilter in self.prefilters:
+            if not prefilter(frame):
+                self.prefiltered += 1
+                return None
+
+        event = json.loads(frame)
+        for keep in self.filters:
+            if not keep(event):
+                return None
+
+        self.processed += 1
+        for processor in self.processors:
+            processor(event)
+        return event
+
+    def metrics(self) -> dict:
+        return {
+            "frames": self.frames,
+            "prefiltered": self.prefiltered,
+            "processed": self.processed,
+        }
@@ -0,0 +1,291 @@
+"""
+Batched writes of the processed events to D1, R2 or a Queue.
+
+Writing every event on its own would be hundreds of writes per second, so
+a BufferedSink, a pipeline processor, keeps the events in memory and hands
+them to its sink in batches: once `batch_size` events are buffered, or
+`flush_interval` seconds after the first one. A single write is in flight at
+a time; the events that arrive meanwhile wait for the next batch.
+
+A failed batch is put back at the front of the buffer and retried after the
+flush interval. The buffer is bounded: if the sink stays down long enough
+for it to hold `max_buffer` events, the oldest are dropped and counted.
+Whatever the batch size, a sink buffers at most MAX_BUFFER events, as a
+parsed event takes a couple of kilobytes and a Durable Object is evicted
+once it uses more than 128 MB.
+
+Buffered events are lost if the Durable Object is evicted before they are
+written, so the consumer does not move its cursor past the oldest of them,
+see `BufferedSink.oldest`: after a restart they are replayed by Jetstream.
+
+Sinks are chosen by the bindings in wrangler.jsonc:
+
+- EVENTS_DB, a D1 database: one row per event, see schema.sql, written with
+  one batch of statements per flush
+- EVENTS_BUCKET, an R2 bucket: one newline-delimited JSON object per flush
+- EVENTS_QUEUE, a Queue: messages sent with sendBatch(), as JSON text
+"""
+
+import asyncio
+import json
+import time
+
+import js
+from pyodide.ffi import to_js
+
+# Events buffered per batch, and per buffer before dropping the oldest
+BATCH_SIZE = 500
+MAX_BATCHES_BUFFERED = 20
+MAX_BUFFER = 10_000
+FLUSH_INTERVAL = 5.0
+
+
+class BufferedSink:
+    """Pipeline processor buffering events and writing them in batches."""
+
+    def __init__(
+        self,
+        sink,
+        batch_size: int | None = None,
+        flush_interval: float | None = None,
+        max_buffer: int | None = None,
+    ):
+        """
+        Args:
+            sink: Writes a list of events, with an async `write(events)`
+            batch_size: Events per write, the sink's default if None
+            flush_interval: Seconds an event stays buffered at most
+            max_buffer: Events buffered at most, MAX_BATCHES_BUFFERED batches
+                but no more than MAX_BUFFER events by default
+        """
+        self.sink = sink
+        self.batch_size = batch_size or getattr(sink, "batch_size", BATCH_SIZE)
+        self.flush_interval = flush_interval or getattr(
+            sink, "flush_interval", FLUSH_INTERVAL
+        )
+        self.max_buffer = max_buffer or max(
+            min(self.batch_size * MAX_BATCHES_BUFFERED, MAX_BUFFER), self.batch_size
+        )
+        self.buffer = []
+        self.in_flight = None
+        # Whether the last write failed, then only the timer retries
+        self.retrying = False
+        self._flush_task = None
+        self._flush_handle = None
+        # Events written, writes, failed writes and events dropped
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def __call__(self, event: dict):
+        self.buffer.append(event)
+        if len(self.buffer) > self.max_buffer:
+            self._drop_oldest()
+        if len(self.buffer) >= self.batch_size and not self.retrying:
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.ensure_future(self.flush())
+        else:
+            self._schedule_flush()
+
+    @property
+    def oldest(self) -> int | None:
+        """The `time_us` of the oldest event not written yet."""
+        if self.in_flight:
+            return self.in_flight[0]["time_us"]
+        if self.buffer:
+            return self.buffer[0]["time_us"]
+        return None
+
+    async def flush(self):
+        """Write the buffered events, in batches of `batch_size`."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # Events buffered during the write in flight are written after it
+        while self.buffer and self.in_flight is None:
+            batch = self.buffer[: self.batch_size]
+            del self.buffer[: len(batch)]
+            self.in_flight = batch
+            try:
+                await self.sink.write(batch)
+            except Exception as e:
+                self.failures += 1
+                self.retrying = True
+                print(f"{type(self.sink).__name__} write failed, will retry: {e}")
+                self.buffer[:0] = batch
+                if len(self.buffer) > self.max_buffer:
+                    self._drop_oldest()
+                break
+            finally:
+                self.in_flight = None
+            self.retrying = False
+            self.written += len(batch)
+            self.batches += 1
+            if len(self.buffer) < self.batch_size:
+                break
+        if self.buffer:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.flush_interval, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    def _drop_oldest(self):
+        excess = len(self.buffer) - self.max_buffer
+        del self.buffer[:excess]
+        if not self.dropped:
+            print(f"{type(self.sink).__name__} buffer full, dropping the oldest events")
+        self.dropped += excess
+
+    def metrics(self) -> dict:
+        return {
+            "sink": type(self.sink).__name__,
+            "buffered": len(self.buffer) + len(self.in_flight or ()),
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+class MemorySink:
+    """Local stand-in for a sink, keeping the batches in a list."""
+
+    batch_size = BATCH_SIZE
+    flush_interval = FLUSH_INTERVAL
+
+    def __init__(self, failures: int = 0):
+        """
+        Args:
+            failures: Number of writes to fail before succeeding
+        """
+        self.batches = []
+        self.failures = failures
+
+    async def write(self, events: list[dict]):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Sink unavailable")
+        self.batches.append(list(events))
+
+    @property
+    def events(self) -> list[dict]:
+        return [event for batch in self.batches for event in batch]
+
+
+def event_row(event: dict) -> tuple:
+    commit = event.get("commit") or {}
+    return (
+        event.get("did", ""),
+        commit.get("collection", ""),
+        commit.get("rkey", ""),
+        event.get("time_us", 0),
+        commit.get("operation", ""),
+        json.dumps(commit.get("record")),
+    )
+
+
+class D1Sink:
+    """One row per event in D1, one batch of statements per write."""
+
+    batch_size = 500
+    flush_interval = 5.0
+
+    # Replayed events are already there, see checkpoint.py
+    INSERT = (
+        "INSERT OR IGNORE INTO events"
+        " (did, collection, rkey, time_us, operation, record)"
+        " VALUES (?, ?, ?, ?, ?, ?)"
+    )
+
+    def __init__(self, db):
+        self.db = db
+        self.statement = db.prepare(self.INSERT)
+
+    async def write(self, events: list[dict]):
+        # A batch is a single round trip, and a single transaction
+        await self.db.batch(
+            to_js([self.statement.bind(*event_row(event)) for event in events])
+        )
+
+
+class R2Sink:
+    """Newline-delimited JSON objects in R2, one per write."""
+
+    # Two batches fit in the buffer, see MAX_BUFFER
+    batch_size = 5_000
+    flush_interval = 60.0
+
+    def __init__(self, bucket, prefix: str = "jetstream/"):
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def key(self, events: list[dict]) -> str:
+        """Keys sort like the events, and are grouped by hour."""
+        first, last = events[0]["time_us"], events[-1]["time_us"]
+        hour = time.strftime("%Y/%m/%d/%H", time.gmtime(first / 1_000_000))
+        return f"{self.prefix}{hour}/{first:016d}-{last:016d}.ndjson"
+
+    async def write(self, events: list[dict]):
+        body = "".join(json.dumps(event) + "\n" for event in events)
+        options = {"httpMetadata": {"contentType": "application/x-ndjson"}}
+        await self.bucket.put(
+            self.key(events),
+            body,
+            to_js(options, dict_converter=js.Object.fromEntries),
+        )
+
+
+class QueueSink:
+    """Messages in a Queue, sent with as few sendBatch() calls as allowed."""
+
+    batch_size = 500
+    flush_interval = 1.0
+
+    # Limits of a sendBatch() call
+    MAX_MESSAGES = 100
+    MAX_BYTES = 256_000
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def chunks(self, events: list[dict]):
+        """Split the events into lists of message bodies within the limits."""
+        chunk, size = [], 0
+        for event in events:
+            body = json.dumps(event)
+            if chunk and (
+                len(chunk) == self.MAX_MESSAGES or size + len(body) > self.MAX_BYTES
+            ):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(body)
+            size += len(body)
+        if chunk:
+            yield chunk
+
+    async def write(self, events: list[dict]):
+        for chunk in self.chunks(events):
+            messages = [{"body": body, "contentType": "text"} for body in chunk]
+            await self.queue.sendBatch(
+                to_js(messages, dict_converter=js.Object.fromEntries)
+            )
+
+
+# Sink of each binding
+SINKS = {"EVENTS_DB": D1Sink, "EVENTS_BUCKET": R2Sink, "EVENTS_QUEUE": QueueSink}
+
+
+def configured_sinks(
+    env, batch_size: int | None = None, flush_interval: float | None = None
+) -> list[BufferedSink]:
+    """A buffered sink per sink binding in `env`."""
+    return [
+        BufferedSink(sink(binding), batch_size, flush_interval)
+        for name, sink in SINKS.items()
+        if (binding := getattr(env, name, None)) is not None
+    ]
@@ -0,0 +1,143 @@
+"""
+Broadcast throughput at 10, 1k and 10k sockets.
+
+Runs outside of the Workers runtime with local stand-ins for WebSocketPair
+and the Durable Object state. Crossing into JavaScript is modelled by what
+it costs at least: `getWebSockets()` builds a new list of new socket
+proxies on every call, and `send()` copies the message out of Python as UTF-8.
+
+Compares:
+- per message: the previous broadcast, json.dumps() and getWebSockets() for
+  every message and one send() per socket per message
+- cached: Broadcaster with batching off, the socket list is reused
+- batched: Broadcaster with messages arriving in bursts of BURST within the
+  batch window, one send() per socket per burst
+
+Run from the `15-chatroom` directory:
+
+    uv run python benchmarks/bench_broadcast.py
+"""
+
+import asyncio
+import json
+import time
+
+import shim  # noqa: F401 - must be imported before broadcast
+from broadcast import Broadcaster
+
+SOCKETS = (10, 1_000, 10_000)
+MESSAGES = 200
+BURST = 10
+
+
+class StandInSocket:
+    """Server end of a WebSocketPair that counts what was sent to it."""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def send(self, data: str):
+        self.frames += 1
+        self.bytes += len(data.encode())
+
+    def deserializeAttachment(self):
+        return None
+
+
+class JsProxy:
+    """Python-side proxy for a JavaScript object, created per access."""
+
+    __slots__ = ("target",)
+
+    def __init__(self, target):
+        self.target = target
+
+    def send(self, data: str):
+        self.target.send(data)
+
+    def deserializeAttachment(self):
+        return self.target.deserializeAttachment()
+
+
+class WebSocketPair:
+    @classmethod
+    def new(cls):
+        return cls()
+
+    def object_values(self):
+        return StandInSocket(), StandInSocket()
+
+
+class State:
+    """Durable Object state holding the accepted sockets."""
+
+    def __init__(self):
+        self._websockets = []
+
+    def acceptWebSocket(self, ws):
+        self._websockets.append(ws)
+
+    def getWebSockets(self):
+        # The runtime returns a fresh JS array of fresh proxies on every call
+        return [JsProxy(ws) for ws in self._websockets]
+
+
+def make_room(sockets: int) -> State:
+    state = State()
+    for _ in range(sockets):
+        _, server = WebSocketPair.new().object_values()
+        state.acceptWebSocket(server)
+    return state
+
+
+def make_message(index: int) -> dict:
+    return {
+        "type": "message",
+        "username": f"user{index % 50}",
+        "text": f"Message number {index} in a busy room",
+        "timestamp": "2025-11-02T12:00:00.000000+00:00",
+    }
+
+
+def per_message(state: State):
+    for index in range(MESSAGES):
+        message = json.dumps(make_message(index))
+        for ws in state.getWebSockets():
+            ws.send(message)
+
+
+def cached(state: State):
+    broadcaster = Broadcaster(state, window=0)
+    for index in range(MESSAGES):
+        broadcaster.send(json.dumps(make_message(index)))
+
+
+def batched(state: State):
+    broadcaster = Broadcaster(state, window=1)
+    for index in range(MESSAGES):
+        broadcaster.send(json.dumps(make_message(index)))
+        if (index + 1) % BURST == 0:
+            # The batch window closes
+            broadcaster.flush()
+    broadcaster.flush()
+
+
+VARIANTS = {"per message": per_message, "cached": cached, "batched": batched}
+
+
+async def main():
+    print(f"{'sockets':>8} {'variant':<12} {'messages/s':>12} {'sends':>10}")
+    for sockets in SOCKETS:
+        for name in VARIANTS:
+            state = make_room(sockets)
+            start = time.perf_counter()
+            VARIANTS[name](state)
+            elapsed = time.perf_counter() - start
+            sends = sum(ws.frames for ws in state._websockets)
+            print(f"{sockets:>8} {name:<12} {MESSAGES / elapsed:>12.0f} {sends:>10}")
+
+
+if __name__ == "__main__":
+    # Batching schedules its flush on the running event loop
+    asyncio.run(main())
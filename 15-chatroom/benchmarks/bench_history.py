@@ -0,0 +1,69 @@
+"""
+Storage writes per message of the durable history under sustained load.
+
+Messages are appended to a HistoryArchive backed by in-memory storage at a
+steady rate for a while. Real time is scaled down by TIME_SCALE, both the
+gap between messages and the flush delay, so a minute of traffic takes a
+fraction of a second and the writes per message are the same as at full
+speed. Reading back a page from deep in the history is timed as well.
+
+Run from the `15-chatroom` directory:
+
+    uv run python benchmarks/bench_history.py
+"""
+
+import asyncio
+import json
+import time
+
+import shim  # noqa: F401 - must be imported before archive
+from archive import FLUSH_DELAY, HistoryArchive
+
+# Messages per second in the room
+RATES = (1, 10, 100, 1000)
+
+# Simulated seconds of traffic per rate, and how much faster they run
+DURATION = 60
+TIME_SCALE = 1000
+
+
+async def sustained_load(rate: int) -> tuple[HistoryArchive, int]:
+    storage = shim.MemoryStorage()
+    archive = HistoryArchive(storage, flush_delay=FLUSH_DELAY / TIME_SCALE)
+    messages = rate * DURATION
+    gap = 1 / rate / TIME_SCALE
+    start = time.perf_counter()
+    for index in range(messages):
+        # Keep a steady pace, like messages arriving from clients
+        delay = start + index * gap - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        message_id = archive.next_id()
+        message = {"type": "message", "id": message_id, "text": f"Message {index}"}
+        await archive.append(message_id, json.dumps(message))
+    await archive.flush()
+    return archive, messages
+
+
+async def main():
+    print(
+        f"{'msg/s':>6} {'messages':>9} {'writes':>7} {'writes/msg':>11} {'page ms':>8}"
+    )
+    for rate in RATES:
+        archive, messages = await sustained_load(rate)
+
+        # Page from the middle of the history
+        middle = (await archive.read(limit=messages // 2))[0][0]
+        start = time.perf_counter()
+        page = await archive.read(before=middle, limit=50)
+        page_ms = (time.perf_counter() - start) * 1000
+        assert page[-1][0] < middle
+
+        print(
+            f"{rate:>6} {messages:>9} {archive.writes:>7} "
+            f"{archive.writes / messages:>11.3f} {page_ms:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""
+Bytes on the wire and encode/decode cost of the JSON and binary protocols.
+
+For both protocols, a chat message goes through the same steps as in the
+room: decoding what the client sent, encoding the message for the other
+clients, and decoding it on their side. A room whose clients all use the
+binary protocol only encodes messages as JSON when the archive writes them
+to storage, off the path of the message: that is the storage column.
+
+Sizes are given for a single message, a batch of BATCH messages and the
+history of HISTORY messages sent to joining clients.
+
+Run from the `15-chatroom` directory:
+
+    uv run python benchmarks/bench_protocol.py
+"""
+
+import json
+import time
+from datetime import UTC, datetime
+
+import shim  # noqa: F401 - must be imported before protocol
+from broadcast import batch_frame
+from protocol import (
+    HISTORY,
+    MESSAGES,
+    ChatMessage,
+    decode_client,
+    encode_chat,
+    pack,
+    unpack,
+)
+
+MESSAGES_PER_RUN = 20_000
+BATCH = 10
+HISTORY_SIZE = 50
+
+TEXTS = {
+    "short": "ok!",
+    "typical": "Has anyone tried the new deployment pipeline yet?",
+    "long": "A much longer message, " * 20,
+}
+
+
+def timed(function, *args) -> tuple[float, object]:
+    """Return the µs per message taken by `function`, and its last result."""
+    start = time.perf_counter()
+    for _ in range(MESSAGES_PER_RUN):
+        result = function(*args)
+    return (time.perf_counter() - start) / MESSAGES_PER_RUN * 1e6, result
+
+
+def json_server(frame: str, message_id: int):
+    data = json.loads(frame)
+    message = {
+        "type": "message",
+        "id": message_id,
+        "username": data["username"],
+        "text": data.get("text", ""),
+        "timestamp": datetime.now(UTC).isoformat(),
+    }
+    return json.dumps(message)
+
+
+def binary_server(frame: bytes, message_id: int):
+    data = decode_client(frame)
+    timestamp = int(time.time() * 1000)
+    message = ChatMessage(message_id, timestamp, data["username"], data["text"])
+    return message, message.record
+
+
+def storage(message: ChatMessage):
+    message._json = None
+    return str(message)
+
+
+def main():
+    message_id = 1_762_084_800_000
+    print(
+        f"{'text':<8} {'protocol':<8} {'server µs':>10} {'storage µs':>11} "
+        f"{'client µs':>10} {'msg B':>6} {'batch B':>8} {'history B':>10}"
+    )
+    for name, text in TEXTS.items():
+        # JSON
+        incoming = json.dumps({"username": "alice", "text": text})
+        server_us, fragment = timed(json_server, incoming, message_id)
+        client_us, _ = timed(json.loads, fragment)
+        batch = batch_frame([fragment] * BATCH)
+        history = (
+            '{"type": "history", "messages": ['
+            + ", ".join([fragment] * HISTORY_SIZE)
+            + "]}"
+        )
+        print(
+            f"{name:<8} {'json':<8} {server_us:>10.2f} {0:>11.2f} "
+            f"{client_us:>10.2f} "
+            f"{len(fragment.encode()):>6} {len(batch.encode()):>8} "
+            f"{len(history.encode()):>10}"
+        )
+
+        # Binary
+        incoming = encode_chat(text, "alice")
+        server_us, (message, record) = timed(binary_server, incoming, message_id)
+        storage_us, _ = timed(storage, message)
+        frame = pack(MESSAGES, [record])
+        client_us, _ = timed(unpack, frame)
+        batch = pack(MESSAGES, [record] * BATCH)
+        history = pack(HISTORY, [record] * HISTORY_SIZE)
+        print(
+            f"{'':<8} {'binary':<8} {server_us:>10.2f} {storage_us:>11.2f} "
+            f"{client_us:>10.2f} "
+            f"{len(frame):>6} {len(batch):>8} {len(history):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Fan-out latency of a room with 1 and 8 shards.
+
+Fan-out latency is the time from a message reaching the room until the
+last client of the room was sent it. In-process, the shards of a room
+cannot run in parallel like Durable Objects do, so this is a simulation
+in two steps:
+
+1. The cost of every step is measured by running the real Chatroom and
+   RoomCoordinator code with the local stand-ins of shim.py: handling a
+   message from a client, sending a frame to one socket, archiving and
+   queueing a message on the coordinator and taking a relayed message on
+   a shard.
+2. A discrete-event simulation of the room replays Poisson arrivals of
+   messages with these costs. Every Durable Object is a single-threaded
+   server that runs one job at a time, broadcasts and relays are batched
+   within BATCH_WINDOW like in broadcast.py and shards.py, and every call
+   between Durable Objects takes RPC_LATENCY.
+
+The costs are those of CPython, not Pyodide, where crossing into JavaScript
+makes every send more expensive; compare the shard counts with each other
+rather than reading the numbers as absolute. `--send-us` replaces the
+measured cost of a send, in microseconds, to see where a room tips over
+with costlier sends.
+
+Run from the `15-chatroom` directory:
+
+    uv run python benchmarks/bench_shards.py [--send-us 5]
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import statistics
+import time
+import types
+
+import shim
+from broadcast import BATCH_WINDOW, Broadcaster
+from entry import Chatroom, RoomCoordinator
+from sessions import MEMBER, new_session, save_session
+from shards import encode_batch, shard_name
+
+SOCKETS = (1_000, 10_000, 50_000)
+RATES = (100, 1_000)
+SHARDS = (1, 8)
+
+# Simulated seconds of traffic, and one way latency between Durable Objects
+DURATION = 5
+RPC_LATENCY = 0.001
+
+# Messages per timed step when measuring costs
+SAMPLES = 2_000
+BATCH = 10
+
+
+def make_message(index: int) -> dict:
+    return {"text": f"Message number {index} in a very large room"}
+
+
+def make_env(shards: int):
+    env = types.SimpleNamespace(ROOM_SHARDS=str(shards))
+    env.CHATROOM = shim.Namespace(Chatroom, env)
+    env.COORDINATOR = shim.Namespace(RoomCoordinator, env)
+    return env
+
+
+def add_sockets(room, count: int):
+    for _ in range(count):
+        ws = shim.MemorySocket()
+        save_session(ws, new_session("bench", MEMBER, 0))
+        room.state.acceptWebSocket(ws)
+    room.broadcaster.invalidate()
+
+
+def timed(total: float, count: int) -> float:
+    return (time.perf_counter() - total) / count
+
+
+async def measure_costs() -> dict:
+    """Seconds taken by each step of a broadcast, see above."""
+    costs = {}
+
+    # Handling a message in a room of one Durable Object, archiving included
+    room = Chatroom(shim.MemoryState(), make_env(1))
+    add_sockets(room, 1)
+    room.broadcaster.window = DURATION
+    ws = room.state.websockets[0]
+    start = time.perf_counter()
+    for index in range(SAMPLES):
+        await room.webSocketMessage(ws, json.dumps(make_message(index)))
+    costs["handle"] = timed(start, SAMPLES)
+
+    # Handling a message on a shard, which queues it for the coordinator
+    env = make_env(8)
+    shard = env.CHATROOM.get(shard_name("bench", 0))
+    await shard.configure_shard("bench", 0, 8)
+    add_sockets(shard, 1)
+    shard.broadcaster.window = shard.relay.window = DURATION
+    ws = shard.state.websockets[0]
+    start = time.perf_counter()
+    for index in range(SAMPLES):
+        await shard.webSocketMessage(ws, json.dumps(make_message(index)))
+    costs["handle_shard"] = timed(start, SAMPLES)
+
+    # Archiving and queueing relayed messages on the coordinator, and taking
+    # them on another shard
+    batch = encode_batch(
+        [[index, json.dumps(make_message(index))] for index in range(BATCH)]
+    )
+    coordinator = env.COORDINATOR.get("bench")
+    coordinator.relay.window = DURATION
+    start = time.perf_counter()
+    for _ in range(SAMPLES // BATCH):
+        await coordinator.publish("bench", 8, 1, batch)
+    costs["publish"] = timed(start, SAMPLES)
+    start = time.perf_counter()
+    for _ in range(SAMPLES // BATCH):
+        await shard.deliver(batch)
+    costs["deliver"] = timed(start, SAMPLES)
+
+    # Sending a frame to one socket
+    state = shim.MemoryState()
+    room = types.SimpleNamespace(state=state, broadcaster=Broadcaster(state))
+    add_sockets(room, 1_000)
+    frame = json.dumps(make_message(0))
+    start = time.perf_counter()
+    for _ in range(SAMPLES // 10):
+        room.broadcaster.send_frame(frame)
+    costs["send"] = timed(start, SAMPLES // 10 * 1_000)
+    return costs
+
+
+class Server:
+    """A Durable Object: runs one job at a time."""
+
+    def __init__(self):
+        self.free_at = 0.0
+        self.busy = 0.0
+
+    def run(self, ready: float, cost: float) -> float:
+        """Run a job that can start at `ready`, return when it is done."""
+        start = max(ready, self.free_at)
+        self.free_at = start + cost
+        self.busy += cost
+        return self.free_at
+
+
+class Window:
+    """Items collected from the first one until BATCH_WINDOW has passed."""
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, sim, now: float, items: list, flush):
+        if not self.items:
+            sim.at(now + BATCH_WINDOW, flush)
+        self.items.extend(items)
+
+    def take(self) -> list:
+        items, self.items = self.items, []
+        return items
+
+
+class Simulation:
+    """A room of `sockets` clients spread evenly across `shards` shards."""
+
+    def __init__(self, shards: int, sockets: int, costs: dict):
+        self.costs = costs
+        self.sharded = shards > 1
+        self.per_shard = sockets / shards
+        self.shards = [Server() for _ in range(shards)]
+        self.broadcasts = [Window() for _ in range(shards)]
+        self.relays = [Window() for _ in range(shards)]
+        self.coordinator = Server()
+        self.fan_out = Window()
+        self.events = []
+        self.order = itertools.count()
+        # Arrival time of every message, and when it reached every shard
+        self.arrived = []
+        self.reached = []
+
+    def at(self, when: float, action, *args):
+        heapq.heappush(self.events, (when, next(self.order), action, args))
+
+    def run(self, rate: int, seed: int = 0) -> list[float]:
+        """Replay DURATION seconds of messages, return their latencies."""
+        rng = random.Random(seed)
+        now = 0.0
+        while (now := now + rng.expovariate(rate)) < DURATION:
+            message = len(self.arrived)
+            self.arrived.append(now)
+            self.reached.append([])
+            self.at(now, self.arrive, rng.randrange(len(self.shards)), message)
+        while self.events:
+            when, _, action, args = heapq.heappop(self.events)
+            action(when, *args)
+        return [
+            max(reached) - arrived
+            for arrived, reached in zip(self.arrived, self.reached, strict=True)
+        ]
+
+    def arrive(self, now: float, index: int, message: int):
+        cost = self.costs["handle_shard" if self.sharded else "handle"]
+        done = self.shards[index].run(now, cost)
+        self.broadcast(done, index, [message])
+        if self.sharded:
+            self.relays[index].add(
+                self, done, [message], lambda when: self.relay(when, index)
+            )
+
+    def broadcast(self, now: float, index: int, messages: list):
+        self.broadcasts[index].add(
+            self, now, messages, lambda when: self.send(when, index)
+        )
+
+    def send(self, now: float, index: int):
+        messages = self.broadcasts[index].take()
+        cost = self.per_shard * self.costs["send"]
+        done = self.shards[index].run(now, cost)
+        for message in messages:
+            self.reached[message].append(done)
+
+    def relay(self, now: float, index: int):
+        messages = [(index, m) for m in self.relays[index].take()]
+        self.at(now + RPC_LATENCY, self.publish, messages)
+
+    def publish(self, now: float, messages: list):
+        done = self.coordinator.run(now, len(messages) * self.costs["publish"])
+        self.fan_out.add(self, done, messages, self.deliver_all)
+
+    def deliver_all(self, now: float):
+        messages = self.fan_out.take()
+        for index in range(len(self.shards)):
+            others = [m for origin, m in messages if origin != index]
+            if others:
+                self.at(now + RPC_LATENCY, self.deliver, index, others)
+
+    def deliver(self, now: float, index: int, messages: list):
+        done = self.shards[index].run(now, len(messages) * self.costs["deliver"])
+        self.broadcast(done, index, messages)
+
+
+def percentile(values: list[float], share: float) -> float:
+    return statistics.quantiles(values, n=100)[int(share * 100) - 1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--send-us", type=float, help="cost of one send in µs")
+    args = parser.parse_args()
+
+    costs = await measure_costs()
+    if args.send_us is not None:
+        costs["send"] = args.send_us / 1e6
+    print("Costs (µs): " + ", ".join(f"{k} {v * 1e6:.2f}" for k, v in costs.items()))
+    print()
+    print(
+        f"{'sockets':>8} {'msg/s':>6} {'shards':>7} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'max ms':>9} {'busiest DO':>11}"
+    )
+    for sockets in SOCKETS:
+        for rate in RATES:
+            for shards in SHARDS:
+                simulation = Simulation(shards, sockets, costs)
+                latencies = simulation.run(rate)
+                busiest = max(
+                    server.busy
+                    for server in [*simulation.shards, simulation.coordinator]
+                )
+                print(
+                    f"{sockets:>8} {rate:>6} {shards:>7} "
+                    f"{percentile(latencies, 0.5) * 1000:>8.1f} "
+                    f"{percentile(latencies, 0.99) * 1000:>8.1f} "
+                    f"{max(latencies) * 1000:>9.1f} "
+                    f"{busiest / DURATION:>10.0%}"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
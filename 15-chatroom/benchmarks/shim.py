@@ -0,0 +1,172 @@
+"""
+Stand-ins for the Workers runtime, so the chatroom modules can be imported
+by the benchmarks outside of workerd.
+
+Only the small part of `js`, `pyodide.ffi` and `workers` that the chatroom
+touches is provided, plus in-memory versions of Durable Object storage,
+state and namespaces.
+Import this module before importing anything from `src/`.
+"""
+
+import sys
+import time
+import types
+from pathlib import Path
+
+SRC = Path(__file__).parents[1] / "src"
+
+
+class MemoryStorage:
+    """Durable Object storage kept in a dict, counting the writes."""
+
+    def __init__(self):
+        self.data = {}
+        self.puts = 0
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def put(self, key, value):
+        self.puts += 1
+        self.data[key] = value
+
+    async def delete(self, key):
+        return self.data.pop(key, None) is not None
+
+    async def list(self, options=None):
+        options = options or {}
+        prefix = options.get("prefix", "")
+        start, end = options.get("start"), options.get("end")
+        keys = sorted(
+            key
+            for key in self.data
+            if key.startswith(prefix)
+            and (start is None or key >= start)
+            and (end is None or key < end)
+        )
+        if options.get("reverse"):
+            keys.reverse()
+        if "limit" in options:
+            keys = keys[: options["limit"]]
+        return {key: self.data[key] for key in keys}
+
+
+class MemorySocket:
+    """Server end of a WebSocket, counting what was sent to it."""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.attachment = None
+
+    def send(self, data: str):
+        self.frames += 1
+        self.bytes += len(data.encode())
+
+    def serializeAttachment(self, value):
+        self.attachment = value
+
+    def deserializeAttachment(self):
+        return self.attachment
+
+    def close(self, code, reason):
+        pass
+
+
+class WebSocketPair:
+    @classmethod
+    def new(cls):
+        return cls()
+
+    def object_values(self):
+        return MemorySocket(), MemorySocket()
+
+
+class MemoryState:
+    """Durable Object state with its storage and accepted sockets."""
+
+    def __init__(self):
+        self.storage = MemoryStorage()
+        self.websockets = []
+
+    def acceptWebSocket(self, ws):
+        self.websockets.append(ws)
+
+    def getWebSockets(self):
+        return list(self.websockets)
+
+    def setWebSocketAutoResponse(self, pair):
+        pass
+
+    def getWebSocketAutoResponseTimestamp(self, ws):
+        # Every socket keeps answering its keep-alive pings
+        return types.SimpleNamespace(getTime=lambda: time.time() * 1000)
+
+
+class Namespace:
+    """Durable Object namespace whose stubs are the objects themselves."""
+
+    def __init__(self, cls, env=None):
+        self.cls = cls
+        self.env = env
+        self.objects = {}
+
+    def idFromName(self, name):
+        return name
+
+    def get(self, name):
+        if name not in self.objects:
+            self.objects[name] = self.cls(MemoryState(), self.env)
+        return self.objects[name]
+
+
+class DurableObject:
+    def __init__(self, ctx, env):
+        self.ctx = ctx
+        self.env = env
+
+
+class WorkerEntrypoint:
+    def __init__(self, ctx=None, env=None):
+        self.ctx = ctx
+        self.env = env
+
+
+class Response:
+    def __init__(self, body=None, status=200, headers=None, **kwargs):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+        self.web_socket = kwargs.get("web_socket")
+
+
+def install():
+    """Register the stand-in modules and put `src/` on the import path."""
+    js = types.ModuleType("js")
+    js.Object = types.SimpleNamespace(fromEntries=dict)
+    js.WebSocketPair = WebSocketPair
+    js.WebSocketRequestResponsePair = types.SimpleNamespace(new=lambda *pair: pair)
+
+    pyodide = types.ModuleType("pyodide")
+    ffi = types.ModuleType("pyodide.ffi")
+    ffi.to_js = lambda obj, **kwargs: obj
+    pyodide.ffi = ffi
+
+    workers = types.ModuleType("workers")
+    workers.DurableObject = DurableObject
+    workers.Response = Response
+    workers.WorkerEntrypoint = WorkerEntrypoint
+
+    for name, module in (
+        ("js", js),
+        ("pyodide", pyodide),
+        ("pyodide.ffi", ffi),
+        ("workers", workers),
+    ):
+        sys.modules.setdefault(name, module)
+
+    if str(SRC) not in sys.path:
+        sys.path.insert(0, str(SRC))
+
+
+install()
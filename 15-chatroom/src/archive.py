@@ -0,0 +1,143 @@
+"""
+Durable chat history in Durable Object storage.
+
+Every message gets an id, its timestamp in milliseconds since the epoch,
+made unique within the room. Messages are not written one by one: they
+are buffered and written together as one append-only segment, under the
+key "seg:<id of its first message>", once SEGMENT_SIZE messages are
+buffered or FLUSH_DELAY seconds after the first one. In a busy room that
+is a small fraction of a storage write per message. In exchange, the
+messages of the last FLUSH_DELAY seconds are lost if the Durable Object
+is evicted before they are written.
+
+Messages are archived in the order they arrive, at increasing positions:
+the message id, or the position after the previous message if that is
+higher. The ids of a sharded room are made by its shards, and those from
+different shards can reach the coordinator out of order, see shards.py;
+positions never are. Segments are keyed by the position of their first
+message, so older messages are read by listing the segments before a given
+position in reverse.
+"""
+
+import asyncio
+import json
+import time
+
+from js import Object
+from pyodide.ffi import to_js
+
+PREFIX = "seg:"
+
+# Most messages per segment, and longest time a message stays buffered
+SEGMENT_SIZE = 100
+FLUSH_DELAY = 2.0
+
+# Segments listed per storage read while paging
+SEGMENTS_PER_READ = 8
+
+
+def segment_key(position: int) -> str:
+    # Zero-padded so that keys sort like the positions
+    return f"{PREFIX}{position:015d}"
+
+
+class HistoryArchive:
+    """Write-behind store of a room's messages, read back in pages."""
+
+    def __init__(
+        self,
+        storage,
+        segment_size: int = SEGMENT_SIZE,
+        flush_delay: float = FLUSH_DELAY,
+    ):
+        self.storage = storage
+        self.segment_size = segment_size
+        self.flush_delay = flush_delay
+        self.last_id = 0
+        # Position of the newest message, None until read from storage
+        self.last_position = None
+        self.writes = 0
+        self._pending = []
+        self._flush_handle = None
+
+    def next_id(self) -> int:
+        """Return a new message id, the current time in ms unless taken."""
+        self.last_id = max(int(time.time() * 1000), self.last_id + 1)
+        return self.last_id
+
+    async def append(self, message_id: int, fragment) -> int:
+        """
+        Buffer a JSON-encoded message, writing a segment when it is full.
+        Anything whose str() is the JSON will do, it is encoded when written.
+
+        Returns:
+            The position of the message
+        """
+        if self.last_position is None:
+            self.last_position = await self._read_last_position()
+        position = max(message_id, self.last_position + 1)
+        self.last_position = position
+        self._pending.append((position, fragment))
+        if len(self._pending) >= self.segment_size:
+            await self.flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.flush_delay, lambda: asyncio.ensure_future(self.flush())
+            )
+        return position
+
+    async def _read_last_position(self) -> int:
+        options = {"prefix": PREFIX, "reverse": True, "limit": 1}
+        segments = await self.storage.list(
+            to_js(options, dict_converter=Object.fromEntries)
+        )
+        for value in segments.values():
+            return json.loads(value)[-1][0]
+        return 0
+
+    async def flush(self):
+        """Write the buffered messages as one segment."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        value = ", ".join(f"[{position}, {fragment}]" for position, fragment in pending)
+        await self.storage.put(segment_key(pending[0][0]), f"[{value}]")
+        self.writes += 1
+
+    async def read(self, before: int | None = None, limit: int = 50) -> list:
+        """
+        Read the newest `limit` messages with a position lower than `before`.
+
+        Returns:
+            List of (position, message) tuples, oldest first
+        """
+        # Buffered messages are the newest
+        found = [
+            (position, json.loads(str(fragment)))
+            for position, fragment in reversed(self._pending)
+            if before is None or position < before
+        ]
+
+        end = None if before is None else segment_key(before)
+        while len(found) < limit:
+            options = {"prefix": PREFIX, "reverse": True, "limit": SEGMENTS_PER_READ}
+            if end is not None:
+                options["end"] = end  # exclusive
+            segments = await self.storage.list(
+                to_js(options, dict_converter=Object.fromEntries)
+            )
+            if len(segments) == 0:
+                break
+            for key, value in segments.items():
+                for position, message in reversed(json.loads(value)):
+                    if before is None or position < before:
+                        found.append((position, message))
+                end = key
+
+        found = found[:limit]
+        found.reverse()
+        return found
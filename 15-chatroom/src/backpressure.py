@@ -0,0 +1,252 @@
+"""
+Backpressure for clients that cannot keep up with a room.
+
+The runtime buffers whatever is sent to a WebSocket, so without a limit a
+slow client makes the Durable Object hold every message it has not received
+yet. Clients that connect with `?acks=1` acknowledge the id of the last
+message they processed, and the room keeps track of the bytes sent to each
+of them that were not acknowledged yet. Once these reach the high-water
+mark, the socket is throttled according to the room's policy:
+
+- "coalesce": stop sending and keep the newest messages, up to MAX_BACKLOG,
+  to be sent as a single batch once the client has caught up
+- "drop": stop sending and drop the messages, telling the client how many
+  it missed once it has caught up
+- "disconnect": close the connection
+
+Clients that do not send acknowledgements are throttled the same way, with
+a limit SILENT_FACTOR times higher, on the bytes sent since they were last
+heard from: anything they send, or a keep-alive ping, which the runtime
+answers on its own but timestamps, counts as acknowledging everything sent
+before it. A client that stops reading usually stops pinging too.
+
+The counters of a socket are kept in its session, see sessions.py, so that
+they survive hibernation. Writing an attachment crosses into JavaScript, so
+they are saved on acknowledgements and in place of the frames a throttled
+socket is not sent, not after every frame sent: after hibernation, a socket
+can have been sent up to its limit more than it is counted for.
+"""
+
+import json
+from collections import deque
+
+from broadcast import batch_frame
+from protocol import MESSAGES, binary_frame
+from sessions import load_session, save_session
+
+# Unacknowledged bytes at which a socket is throttled. It is resumed once
+# they are down to half of it.
+HIGH_WATER = 256 * 1024
+
+# Most messages held back per throttled socket with the "coalesce" policy
+MAX_BACKLOG = 200
+
+# How many times the high-water mark clients that send no acknowledgements
+# can be sent before they are heard from again
+SILENT_FACTOR = 4
+
+POLICIES = ("coalesce", "drop", "disconnect")
+
+
+class Consumer:
+    """Send accounting of one socket."""
+
+    def __init__(self, max_backlog: int, binary: bool = False, acks: bool = True):
+        # Whether the client uses the binary protocol, see protocol.py
+        self.binary = binary
+        # Whether the client acknowledges messages, and when it was last heard
+        # from otherwise, in ms since the epoch
+        self.acks = acks
+        self.heard_at = 0
+        # (id of the last message, size) of the frames not acknowledged yet
+        self.unacked = deque()
+        self.unacked_bytes = 0
+        # Messages held back while throttled, JSON or binary records, and the
+        # id of the last one
+        self.backlog = deque(maxlen=max_backlog)
+        self.backlog_id = None
+        # Messages the client missed since it was last told about it
+        self.missed = 0
+
+    def snapshot(self) -> dict:
+        """The counters to keep in the session, see sessions.py."""
+        return {
+            "unacked": self.unacked_bytes,
+            "last_id": self.unacked[-1][0] if self.unacked else None,
+            # The backlog is lost if the Durable Object is evicted
+            "missed": self.missed + len(self.backlog),
+            "heard_at": self.heard_at,
+        }
+
+    def restore(self, snapshot: dict):
+        """Take back the counters saved by snapshot()."""
+        if snapshot.get("unacked"):
+            # A single entry, acknowledged with the newest message sent
+            self.unacked.append((snapshot["last_id"], snapshot["unacked"]))
+            self.unacked_bytes = snapshot["unacked"]
+        self.missed = snapshot.get("missed", 0)
+        self.heard_at = snapshot.get("heard_at", 0)
+
+
+class FlowControl:
+    """Throttles the sockets that have too many unacknowledged bytes."""
+
+    def __init__(
+        self,
+        high_water: int = HIGH_WATER,
+        policy: str = "coalesce",
+        max_backlog: int = MAX_BACKLOG,
+        last_ping=None,
+    ):
+        """
+        Args:
+            high_water: Unacknowledged bytes at which a socket is throttled
+            policy: One of POLICIES
+            max_backlog: Most messages held back per socket, for "coalesce"
+            last_ping: Function returning when the runtime last answered a
+                keep-alive ping of a socket, in ms since the epoch, or None
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of: {', '.join(POLICIES)}")
+        self.high_water = high_water
+        self.policy = policy
+        self.max_backlog = max_backlog
+        self.last_ping = last_ping
+        # Consumers by session id, see sessions.py
+        self.consumers = {}
+        # Totals since the Durable Object was started
+        self.coalesced = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def consumer(self, session: dict) -> Consumer:
+        """Return the accounting of a session."""
+        consumer = self.consumers.get(session["id"])
+        if consumer is None:
+            consumer = self.consumers[session["id"]] = Consumer(
+                self.max_backlog,
+                session.get("binary", False),
+                bool(session.get("acks")),
+            )
+            consumer.restore(session.get("flow") or {})
+        return consumer
+
+    def limit(self, consumer: Consumer) -> int:
+        """Unacknowledged bytes at which `consumer` is throttled."""
+        if consumer.acks:
+            return self.high_water
+        return self.high_water * SILENT_FACTOR
+
+    def forget(self, session: dict):
+        """Drop the accounting of a closed connection."""
+        self.consumers.pop(session.get("id"), None)
+
+    def send(self, ws, consumer: Consumer, frame: str, fragments: list, last_id):
+        """
+        Send a frame holding `fragments` to a socket, unless it is throttled.
+
+        Returns:
+            False if the socket was disconnected
+        """
+        limit = self.limit(consumer)
+        if consumer.unacked_bytes >= limit and not consumer.acks and self.last_ping:
+            # Only asked once the limit is reached, it is a call into JavaScript
+            pinged_at = self.last_ping(ws)
+            if pinged_at is not None and pinged_at > consumer.heard_at:
+                self.heard_from(ws, consumer, pinged_at)
+
+        if consumer.unacked_bytes < limit:
+            self._send(ws, consumer, frame, last_id)
+            return True
+
+        if self.policy == "disconnect":
+            ws.close(1008, "Too many unacknowledged messages")
+            self.disconnected += 1
+            return False
+
+        if self.policy == "drop":
+            consumer.missed += len(fragments)
+            self.dropped += len(fragments)
+            self._save(ws, consumer)
+            return True
+
+        # Keep the newest messages, the backlog drops the oldest when full
+        overflow = max(len(consumer.backlog) + len(fragments) - self.max_backlog, 0)
+        consumer.missed += overflow
+        self.dropped += overflow
+        self.coalesced += len(fragments) - overflow
+        consumer.backlog.extend(fragments)
+        consumer.backlog_id = last_id
+        self._save(ws, consumer)
+        return True
+
+    def heard_from(self, ws, consumer: Consumer, now: int):
+        """Handle a client without acks showing signs of life at `now`."""
+        consumer.heard_at = now
+        self.ack(ws, consumer, None)
+
+    def ack(self, ws, consumer: Consumer, message_id: int | None):
+        """
+        Handle a client acknowledging every message up to `message_id`,
+        every message sent if None.
+        """
+        while consumer.unacked and (
+            message_id is None or consumer.unacked[0][0] <= message_id
+        ):
+            _, size = consumer.unacked.popleft()
+            consumer.unacked_bytes -= size
+
+        if consumer.unacked_bytes >= self.limit(consumer) // 2:
+            self._save(ws, consumer)
+            return
+
+        # Caught up: tell the client what it missed and send what was held back
+        if consumer.missed:
+            notice = {
+                "type": "system",
+                "text": f"{consumer.missed} messages were skipped because the "
+                "connection was too slow",
+            }
+            ws.send(json.dumps(notice))
+            consumer.missed = 0
+        if consumer.backlog:
+            if consumer.binary:
+                frame = binary_frame(MESSAGES, list(consumer.backlog))
+            else:
+                frame = batch_frame(list(consumer.backlog))
+            consumer.backlog.clear()
+            self._send(ws, consumer, frame, consumer.backlog_id)
+        self._save(ws, consumer)
+
+    def throttled(self) -> int:
+        """Number of sockets currently throttled."""
+        return sum(
+            consumer.unacked_bytes >= self.limit(consumer)
+            for consumer in self.consumers.values()
+        )
+
+    def metrics(self) -> dict:
+        return {
+            "policy": self.policy,
+            "high_water": self.high_water,
+            "tracked": len(self.consumers),
+            "throttled": self.throttled(),
+            "backlog": sum(len(c.backlog) for c in self.consumers.values()),
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+        }
+
+    def _save(self, ws, consumer: Consumer):
+        # Read again, the rest of the session may have changed meanwhile
+        session = load_session(ws)
+        session["flow"] = consumer.snapshot()
+        save_session(ws, session)
+
+    def _send(self, ws, consumer: Consumer, frame: str, last_id):
+        ws.send(frame)
+        if last_id is not None:
+            # Characters rather than UTF-8 bytes for JSON, close enough for a
+            # limit
+            consumer.unacked.append((last_id, len(frame)))
+            consumer.unacked_bytes += len(frame)
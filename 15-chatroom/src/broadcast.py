@@ -0,0 +1,170 @@
+"""
+Batched broadcast to every WebSocket of a chatroom.
+
+Every `ws.send()` crosses from Python into JavaScript, and so does every call
+to `state.getWebSockets()`. A busy room would pay for both on every message,
+so the Broadcaster:
+
+- serializes each message once and queues the JSON text, or a ChatMessage
+  that is only serialized if a socket gets JSON, see protocol.py,
+- coalesces the messages queued within a short window into one frame,
+  `{"type": "batch", "messages": [...]}`, built by joining the queued text,
+- keeps the list of sockets between membership changes instead of asking
+  the runtime for it on every broadcast.
+
+With a FlowControl every socket is sent to through it, which throttles the
+ones that fall behind, see backpressure.py.
+Sockets using the binary protocol get the same messages as one binary frame,
+built once per batch, see protocol.py.
+"""
+
+import asyncio
+
+from protocol import MESSAGES, binary_frame, record_of
+from sessions import load_session
+
+# Default time to wait for more messages before sending a batch, in seconds
+BATCH_WINDOW = 0.01
+
+
+def batch_frame(fragments: list) -> str:
+    """Join pre-encoded JSON messages, or ChatMessages, into a single frame."""
+    if len(fragments) == 1:
+        return str(fragments[0])
+    return '{"type": "batch", "messages": [' + ", ".join(map(str, fragments)) + "]}"
+
+
+class Broadcaster:
+    """Sends JSON messages to all WebSockets accepted by a Durable Object."""
+
+    def __init__(self, state, window: float = BATCH_WINDOW, flow=None):
+        """
+        Args:
+            state: The Durable Object state, used to list the sockets
+            window: Seconds to collect messages into one batch, 0 to send
+                every message right away
+            flow: Optional backpressure.FlowControl
+        """
+        self.state = state
+        self.window = window
+        self.flow = flow
+        self._sockets = None
+        self._targets = None
+        self._binary = False
+        self._pending = []
+        self._pending_id = None
+        self._flush_handle = None
+
+    @property
+    def sockets(self) -> list:
+        """The room's sockets, fetched from the runtime once per membership."""
+        if self._sockets is None:
+            self._sockets = list(self.state.getWebSockets())
+        return self._sockets
+
+    @property
+    def targets(self) -> list[tuple]:
+        """
+        (socket, backpressure.Consumer or None without flow control, whether
+        it uses the binary protocol) for every socket.
+        """
+        if self._targets is None:
+            self._load_targets()
+        return self._targets
+
+    @property
+    def binary(self) -> bool:
+        """Whether any socket uses the binary protocol."""
+        if self._targets is None:
+            self._load_targets()
+        return self._binary
+
+    def invalidate(self):
+        """Forget the cached sockets, call whenever one joins or leaves."""
+        self._sockets = None
+        self._targets = None
+
+    def send(self, fragment, message_id: int | None = None):
+        """
+        Queue an already serialized JSON message, or a ChatMessage, for
+        every socket.
+
+        Messages with an id can be acknowledged by the clients, see ack().
+        """
+        self._pending.append(fragment)
+        if message_id is not None:
+            self._pending_id = message_id
+        if self.window <= 0:
+            self.flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.window, self.flush)
+
+    def flush(self):
+        """Send the queued messages now, as one frame."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        fragments, last_id = self._pending, self._pending_id
+        self._pending, self._pending_id = [], None
+        self.send_frame(None, fragments, last_id)
+
+    def send_frame(self, frame: str | None, fragments=None, last_id=None):
+        """
+        Send one frame to every socket.
+
+        Args:
+            frame: The frame to send, None to join `fragments` into one if
+                any socket gets JSON
+            fragments: The messages in the frame, kept by FlowControl for
+                throttled sockets, and sent as a binary frame to the sockets
+                using the binary protocol
+            last_id: Id of the last message in the frame, if any
+        """
+        binary = records = None
+        failed = 0
+        for ws, consumer, is_binary in self.targets:
+            if is_binary and fragments:
+                if binary is None:
+                    records = [record_of(fragment) for fragment in fragments]
+                    binary = binary_frame(MESSAGES, records)
+                data, parts = binary, records
+            else:
+                if frame is None:
+                    frame = batch_frame(fragments)
+                data, parts = frame, fragments or [frame]
+            try:
+                if consumer is None:
+                    ws.send(data)
+                elif not self.flow.send(ws, consumer, data, parts, last_id):
+                    failed += 1
+            except Exception as e:
+                failed += 1
+                print(f"Error broadcasting to session: {e}")
+        if failed:
+            # Closed sockets are dropped from getWebSockets(), refresh the list
+            self.invalidate()
+
+    def _load_targets(self):
+        self._targets = []
+        for ws in self.sockets:
+            session = load_session(ws)
+            consumer = self.flow.consumer(session) if self.flow else None
+            self._targets.append((ws, consumer, session.get("binary", False)))
+        self._binary = any(binary for _, _, binary in self._targets)
+
+    def ack(self, ws, message_id: int):
+        """Handle a client acknowledging every message up to `message_id`."""
+        if self.flow is None:
+            return
+        self.flow.ack(ws, self.flow.consumer(load_session(ws)), message_id)
+
+    def heard_from(self, ws, now: int):
+        """Handle a message from a client that does not send acks."""
+        if self.flow is None:
+            return
+        consumer = self.flow.consumer(load_session(ws))
+        if not consumer.acks:
+            self.flow.heard_from(ws, consumer, now)
@@ -1,11 +1,37 @@
+import asyncio
 import json
 from datetime import UTC, datetime
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
 
-from js import WebSocketPair
+from archive import HistoryArchive
+from backpressure import HIGH_WATER, FlowControl
+from broadcast import Broadcaster
+from history import MAX_HISTORY, MessageHistory
+from js import WebSocketPair, WebSocketRequestResponsePair
+from protocol import BINARY, ChatMessage, decode_client, frame_bytes, negotiate
+from sessions import (
+    MEMBER,
+    OWNER,
+    clean_username,
+    load_session,
+    new_session,
+    save_session,
+)
+from shards import (
+    Relay,
+    decode_batch,
+    encode_batch,
+    shard_count,
+    shard_for,
+    shard_message_id,
+    shard_name,
+)
 from workers import DurableObject, Response, WorkerEntrypoint
 
+# Endpoints of a room besides the WebSocket, /room/<name>/<endpoint>
+ROOM_ENDPOINTS = ("/history", "/sessions", "/metrics")
+
 
 class Chatroom(DurableObject):
     """Durable Object that manages a chatroom with WebSocket connections."""
@@ -14,11 +40,46 @@ class Chatroom(DurableObject):
         super().__init__(state, env)
         self.state = state
         self.env = env
-        self.message_history = []  # Limited message history
-        self.max_history = 50  # Maximum number of messages to keep
+        # Last messages of the room, already encoded as JSON
+        max_history = int(getattr(env, "MAX_HISTORY", None) or MAX_HISTORY)
+        self.message_history = MessageHistory(max_history)
+        self.history_loaded = False
+        # All messages of the room, in Durable Object storage
+        self.archive = HistoryArchive(state.storage)
+        # Slow clients are throttled once they have HIGH_WATER_BYTES of
+        # unacknowledged messages, as set by SLOW_CONSUMER_POLICY
+        self.flow = FlowControl(
+            high_water=int(getattr(env, "HIGH_WATER_BYTES", None) or HIGH_WATER),
+            policy=getattr(env, "SLOW_CONSUMER_POLICY", None) or "coalesce",
+            last_ping=self.last_ping,
+        )
+        self.broadcaster = Broadcaster(state, flow=self.flow)
+        # Room, index and count of a shard of a sharded room, see shards.py
+        self.shard = None
+        self.relay = Relay(self.relay_messages)
+
+        # Answer the page's keep-alive pings without waking the Durable Object
+        # from hibernation
+        self.state.setWebSocketAutoResponse(
+            WebSocketRequestResponsePair.new("ping", "pong")
+        )
 
     async def fetch(self, request):
         """Handle incoming requests to the Durable Object."""
+        url = urlparse(request.url)
+        params = parse_qs(url.query)
+
+        # Older messages are fetched in pages: /room/<name>/history
+        if url.path.endswith("/history"):
+            return await self.get_history(params)
+
+        # Who is connected: /room/<name>/sessions
+        if url.path.endswith("/sessions"):
+            return self.get_sessions()
+
+        # Backpressure counters: /room/<name>/metrics
+        if url.path.endswith("/metrics"):
+            return self.get_metrics()
 
         # Check if this is a WebSocket upgrade request
         upgrade_header = request.headers.get("Upgrade")
@@ -26,16 +87,54 @@ class Chatroom(DurableObject):
             # If not a WebSocket request, return an error
             return Response("Expected WebSocket upgrade", status=400)
 
+        await self.load_history()
+
+        # The first client of an empty room owns it
+        role = MEMBER if self.broadcaster.sockets else OWNER
+
+        # Rooms can keep a longer or shorter history: /room/<name>?max_history=N,
+        # set by their owner only, so that joining cannot wipe out the history
+        if "max_history" in params:
+            if role != OWNER:
+                return Response(
+                    "Only the owner of a room can set its max_history", status=403
+                )
+            try:
+                self.message_history.resize(int(params["max_history"][0]))
+            except ValueError as e:
+                return Response(str(e), status=400)
+            # Kept in storage, so that it outlives hibernation
+            await self.state.storage.put(
+                "max_history", self.message_history.max_history
+            )
+
         # Create a WebSocket pair
         client, server = WebSocketPair.new().object_values()
 
+        # Deliver queued messages first, they are already in the history
+        # that is sent to the new client below
+        self.broadcaster.flush()
+
         # Accept the WebSocket connection - this tells the DO to handle it
         self.state.acceptWebSocket(server)
+        self.broadcaster.invalidate()
+
+        # Clients can ask for the binary protocol, see protocol.py
+        protocol = negotiate(request.headers.get("Sec-WebSocket-Protocol"))
+        binary = protocol == BINARY
+
+        # Attach the session to the socket, where it survives hibernation
+        username = params.get("username", [None])[0]
+        acks = params.get("acks") == ["1"]
+        session = new_session(username, role, self.get_time_ms(), acks, binary)
+        save_session(server, session)
 
         # Send message history to the newly connected client
         if self.message_history:
-            history_msg = {"type": "history", "messages": self.message_history}
-            server.send(json.dumps(history_msg))
+            if binary:
+                server.send(self.message_history.binary_payload())
+            else:
+                server.send(self.message_history.payload())
 
         # Send a welcome message
         welcome_msg = {
@@ -46,58 +145,269 @@ class Chatroom(DurableObject):
         server.send(json.dumps(welcome_msg))
 
         # Return the client-side WebSocket in the response
-        return Response(None, status=101, web_socket=client)
+        headers = {"Sec-WebSocket-Protocol": protocol} if protocol else None
+        return Response(None, status=101, headers=headers, web_socket=client)
 
     async def webSocketMessage(self, ws, message):
         """Handle incoming WebSocket messages."""
         try:
-            data = json.loads(message)
+            if isinstance(message, str):
+                data = json.loads(message)
+            else:
+                data = decode_client(frame_bytes(message))
+
+            # Acknowledgements of received messages, see backpressure.py
+            if data.get("type") == "ack":
+                self.broadcaster.ack(ws, int(data["id"]))
+                return
+            self.broadcaster.heard_from(ws, self.get_time_ms())
 
-            # Create a message object
-            msg = {
-                "type": "message",
-                "username": data.get("username", "Anonymous"),
-                "text": data.get("text", ""),
-                "timestamp": self.get_timestamp(),
-            }
+            await self.load_history()
 
-            # Add to history
+            # The username can change between messages, it defaults to the
+            # one of the session
+            session = load_session(ws)
+            if "username" in data:
+                session["username"] = clean_username(data["username"])
+            now = self.get_time_ms()
+            session["last_seen"] = now
+            save_session(ws, session)
+
+            # JSON clients can send anything, and a text that is not a
+            # string would break encoding the history for binary clients
+            text = data.get("text", "")
+            if not isinstance(text, str):
+                raise ValueError(f"text must be a string, not {type(text).__name__}")
+
+            # Create a message, encoded to JSON or for the binary protocol
+            # only when needed, see protocol.py
+            msg = ChatMessage(self.next_id(), now, session["username"], text)
+
+            # Add to history, the oldest message is dropped when it is full
             self.message_history.append(msg)
-            if len(self.message_history) > self.max_history:
-                self.message_history.pop(0)
+            if self.shard:
+                # The coordinator archives it and passes it on to the other
+                # shards of the room
+                self.relay.send([msg.id, msg])
+            else:
+                await self.archive.append(msg.id, msg)
 
             # Broadcast to all connected clients
-            self.broadcast(json.dumps(msg))
+            self.broadcast(msg, msg.id)
         except Exception as e:
             print(f"Error handling message: {e}")
 
     async def webSocketClose(self, ws, code, reason, wasClean):
         """Handle WebSocket close events."""
         ws.close(code, reason)
+        self.flow.forget(load_session(ws))
+        self.broadcaster.invalidate()
         active_connections = len(self.state.getWebSockets())
         print(f"Client disconnected. Active sessions: {active_connections}")
+        if not active_connections:
+            # Write buffered messages before the room goes idle
+            await self.relay.flush()
+            await self.archive.flush()
 
     async def webSocketError(self, ws, error):
         """Handle WebSocket error events."""
         ws.close(1011, "WebSocket error")
+        self.flow.forget(load_session(ws))
+        self.broadcaster.invalidate()
         print(f"WebSocket error: {error}")
 
-    def broadcast(self, message):
-        """Broadcast a message to all connected clients."""
-        # Get all active WebSocket connections from the state
-        websockets = self.state.getWebSockets()
+    async def load_history(self):
+        """Fill the recent history from storage, e.g. after an eviction."""
+        if self.history_loaded:
+            return
+        self.history_loaded = True
+        if self.shard is None:
+            shard = await self.state.storage.get("shard")
+            self.shard = json.loads(shard) if shard else None
+        max_history = await self.state.storage.get("max_history")
+        if max_history:
+            self.message_history.resize(int(max_history))
 
-        # Send to all active sessions
-        for ws in websockets:
-            try:
-                ws.send(message)
-            except Exception as e:
-                print(f"Error broadcasting to session: {e}")
+        # A shard that had nobody to deliver to still has the messages from
+        # before, which the reloaded history already holds
+        self.message_history.clear()
+        if self.shard:
+            # The coordinator keeps the history of a sharded room
+            batch = await self.coordinator().recent(self.message_history.max_history)
+            for _, fragment in decode_batch(batch):
+                self.message_history.append(fragment)
+            return
+
+        messages = await self.archive.read(limit=self.message_history.max_history)
+        for _, message in messages:
+            self.message_history.append(json.dumps(message))
+            self.archive.last_id = max(self.archive.last_id, message["id"])
+
+    async def get_history(self, params):
+        """Return a page of older messages as JSON, see history_page()."""
+        return await history_page(self.archive, params)
+
+    def get_sessions(self):
+        """Return the sessions of the connected clients as JSON."""
+        sessions = [load_session(ws) for ws in self.broadcaster.sockets]
+        return Response(
+            json.dumps({"sessions": sessions}),
+            headers={"Content-Type": "application/json"},
+        )
+
+    def get_metrics(self):
+        """Return the number of connected and throttled clients as JSON."""
+        metrics = {"sockets": len(self.broadcaster.sockets), **self.flow.metrics()}
+        if self.shard:
+            metrics["shard"] = self.shard["index"]
+        return Response(
+            json.dumps(metrics), headers={"Content-Type": "application/json"}
+        )
+
+    def broadcast(self, message, message_id=None):
+        """
+        Broadcast a JSON message, or a ChatMessage, to all connected clients.
+
+        Messages are batched with the others sent within a few milliseconds,
+        see broadcast.py.
+        """
+        self.broadcaster.send(message, message_id)
 
     def get_timestamp(self):
         """Get current timestamp in ISO format."""
         return datetime.now(UTC).isoformat()
 
+    def get_time_ms(self):
+        """Get current time in milliseconds since the epoch."""
+        return int(datetime.now(UTC).timestamp() * 1000)
+
+    def last_ping(self, ws):
+        """When the runtime last answered a keep-alive ping of `ws`, in ms."""
+        timestamp = self.state.getWebSocketAutoResponseTimestamp(ws)
+        return None if timestamp is None else int(timestamp.getTime())
+
+    def next_id(self):
+        """Return the id of a new message, unique across shards."""
+        message_id = self.archive.next_id()
+        if self.shard:
+            return shard_message_id(message_id, self.shard["index"])
+        return message_id
+
+    async def configure_shard(self, room, index, count):
+        """Make this Durable Object shard `index` of `count` of a room."""
+        shard = {"room": room, "index": index, "count": count}
+        if shard != self.shard:
+            self.shard = shard
+            # Kept in storage, so that it outlives hibernation
+            await self.state.storage.put("shard", json.dumps(shard))
+
+    def coordinator(self):
+        """Return the RoomCoordinator of this shard's room."""
+        namespace = self.env.COORDINATOR
+        return namespace.get(namespace.idFromName(self.shard["room"]))
+
+    async def relay_messages(self, entries):
+        """Send the messages of this shard's clients to the coordinator."""
+        await self.coordinator().publish(
+            self.shard["room"],
+            self.shard["count"],
+            self.shard["index"],
+            encode_batch([[message_id, str(msg)] for message_id, msg in entries]),
+        )
+
+    async def deliver(self, batch):
+        """Broadcast the messages of the room's other shards."""
+        if not self.broadcaster.sockets:
+            # Nobody to send them to, the history is reloaded on the next join
+            self.history_loaded = False
+            return
+        await self.load_history()
+        for message_id, fragment in decode_batch(batch):
+            self.message_history.append(fragment)
+            self.broadcast(fragment, message_id)
+
+
+class RoomCoordinator(DurableObject):
+    """Durable Object that relays messages between the shards of a room."""
+
+    def __init__(self, state, env):
+        super().__init__(state, env)
+        self.state = state
+        self.env = env
+        # All messages of the room, the shards only keep the recent ones
+        self.archive = HistoryArchive(state.storage)
+        self.relay = Relay(self.fan_out)
+        self.room = None
+        self.shards = 0
+
+    async def fetch(self, request):
+        """Serve the history of the room, /room/<name>/history."""
+        url = urlparse(request.url)
+        if url.path.endswith("/history"):
+            return await history_page(self.archive, parse_qs(url.query))
+        return Response("Not found", status=404)
+
+    async def publish(self, room, shards, origin, batch):
+        """Take the messages sent to shard `origin` of `shards`."""
+        self.room = room
+        self.shards = shards
+        for message_id, fragment in decode_batch(batch):
+            await self.archive.append(message_id, fragment)
+            self.relay.send((origin, message_id, fragment))
+
+    async def recent(self, limit):
+        """Return the last `limit` messages of the room, for a shard."""
+        messages = await self.archive.read(limit=limit)
+        return encode_batch(
+            [[message["id"], json.dumps(message)] for _, message in messages]
+        )
+
+    async def fan_out(self, items):
+        """Send every shard the batch of messages of all the other shards."""
+        calls = []
+        for index in range(self.shards):
+            entries = [
+                [message_id, fragment]
+                for origin, message_id, fragment in items
+                if origin != index
+            ]
+            if entries:
+                calls.append(self.shard(index).deliver(encode_batch(entries)))
+        await asyncio.gather(*calls)
+
+    def shard(self, index):
+        namespace = self.env.CHATROOM
+        return namespace.get(namespace.idFromName(shard_name(self.room, index)))
+
+
+async def history_page(archive, params):
+    """
+    Return a page of older messages of `archive` as JSON.
+
+    Query parameters:
+    - before: Only return messages at a lower position in the archive, see
+      archive.py (default: the newest)
+    - limit: Number of messages (default: 50, at most 200)
+
+    The response holds the messages, oldest first, and the `before` value
+    for the next older page, or null once the first message was reached.
+    Positions are the message ids in a room that is not sharded.
+    """
+    try:
+        before = int(params["before"][0]) if "before" in params else None
+        limit = int(params.get("limit", ["50"])[0])
+        if not 1 <= limit <= 200:
+            raise ValueError("limit must be between 1 and 200")
+    except ValueError as e:
+        return Response(str(e), status=400)
+
+    messages = await archive.read(before=before, limit=limit)
+    page = {
+        "messages": [message for _, message in messages],
+        "before": messages[0][0] if len(messages) == limit else None,
+    }
+    return Response(json.dumps(page), headers={"Content-Type": "application/json"})
+
 
 class Default(WorkerEntrypoint):
     """Main worker entry point that routes requests to the Durable Object."""
@@ -113,13 +423,22 @@ class Default(WorkerEntrypoint):
                 html_file.read_text(), headers={"Content-Type": "text/html"}
             )
 
-        # Handle room requests: /room/<name>
+        # Handle room requests: /room/<name> and /room/<name>/<endpoint>
         if pathname.startswith("/room/"):
             # Extract room name from path
             room_name = pathname[6:]  # Remove "/room/" prefix
+            endpoint = None
+            for suffix in ROOM_ENDPOINTS:
+                if room_name.endswith(suffix):
+                    room_name, endpoint = room_name.removesuffix(suffix), suffix
             if not room_name:
                 return Response("Room name required", status=400)
 
+            # Large rooms can be split across several Durable Objects
+            shards = shard_count(self.env)
+            if shards > 1:
+                return await self.fetch_shard(request, room_name, endpoint, shards)
+
             # Get the Durable Object namespace
             namespace = self.env.CHATROOM
 
@@ -133,3 +452,32 @@ class Default(WorkerEntrypoint):
         return Response(
             "Not found. Use /room/<name> to connect to a chatroom.", status=404
         )
+
+    async def fetch_shard(self, request, room_name, endpoint, shards):
+        """Forward a request for a sharded room, see shards.py."""
+        # The coordinator keeps the history of the whole room
+        if endpoint == "/history":
+            namespace = self.env.COORDINATOR
+            stub = namespace.get(namespace.idFromName(room_name))
+            return await stub.fetch(request)
+
+        params = parse_qs(urlparse(request.url).query)
+        if endpoint:
+            # Sessions and metrics are per shard: /room/<name>/sessions?shard=N
+            try:
+                index = int(params.get("shard", ["0"])[0])
+            except ValueError:
+                index = -1
+            if not 0 <= index < shards:
+                return Response(f"shard must be between 0 and {shards - 1}", status=400)
+        else:
+            # Clients are spread across the shards by address and username
+            address = request.headers.get("CF-Connecting-IP") or ""
+            username = params.get("username", [""])[0]
+            index = shard_for(f"{address}:{username}", shards)
+
+        namespace = self.env.CHATROOM
+        stub = namespace.get(namespace.idFromName(shard_name(room_name, index)))
+        if not endpoint:
+            await stub.configure_shard(room_name, index, shards)
+        return await stub.fetch(request)
@@ -0,0 +1,76 @@
+"""
+Recent message history of a chatroom.
+
+Messages are kept in a fixed-size ring buffer, as JSON or as ChatMessage
+objects that are only encoded when needed, see protocol.py, so adding one
+is O(1) and the oldest falls out on its own. The history sent to
+joining clients is assembled by joining those strings, and reused until the
+next message arrives, so a burst of reconnects costs one join instead of a
+full json.dumps() of the history per client. The same goes for the binary
+history of clients using the binary protocol, see protocol.py.
+"""
+
+from collections import deque
+
+from protocol import HISTORY, binary_frame, record_of
+
+# Default and largest number of messages kept per room
+MAX_HISTORY = 50
+MAX_HISTORY_LIMIT = 1000
+
+
+class MessageHistory:
+    """Ring buffer of the last `max_history` messages."""
+
+    def __init__(self, max_history: int = MAX_HISTORY):
+        self._messages = deque(maxlen=max_history)
+        self._payload = None
+        self._binary_payload = None
+
+    @property
+    def max_history(self) -> int:
+        return self._messages.maxlen
+
+    def resize(self, max_history: int):
+        """Change the capacity, keeping the most recent messages."""
+        if not 1 <= max_history <= MAX_HISTORY_LIMIT:
+            raise ValueError(f"max_history must be between 1 and {MAX_HISTORY_LIMIT}")
+        if max_history != self.max_history:
+            self._messages = deque(self._messages, maxlen=max_history)
+            self._payload = None
+            self._binary_payload = None
+
+    def append(self, message):
+        """
+        Add a JSON-encoded message or a ChatMessage, dropping the oldest one
+        if full.
+        """
+        self._messages.append(message)
+        self._payload = None
+        self._binary_payload = None
+
+    def clear(self):
+        """Drop every message, e.g. before reloading the history."""
+        self._messages.clear()
+        self._payload = None
+        self._binary_payload = None
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def payload(self) -> str:
+        """The `{"type": "history"}` message for joining clients."""
+        if self._payload is None:
+            self._payload = (
+                '{"type": "history", "messages": ['
+                + ", ".join(map(str, self._messages))
+                + "]}"
+            )
+        return self._payload
+
+    def binary_payload(self):
+        """The HISTORY frame for joining clients using the binary protocol."""
+        if self._binary_payload is None:
+            records = [record_of(message) for message in self._messages]
+            self._binary_payload = binary_frame(HISTORY, records)
+        return self._binary_payload
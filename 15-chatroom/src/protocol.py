@@ -0,0 +1,209 @@
+"""
+Compact binary framing of chat messages, chosen with the WebSocket
+subprotocol.
+
+By default every message is a JSON text frame. Clients that connect with
+the "chatroom.binary" subprotocol get chat messages as binary frames, with
+fixed-size big-endian headers and timestamps in milliseconds since the
+epoch instead of ISO strings, and send their messages and acknowledgements
+the same way. Anything else, like system messages, stays a JSON text frame;
+the client tells them apart by the type of the frame.
+
+Frames from the room start with a HEADER, the kind of frame and the number
+of messages, followed by one RECORD per message and its UTF-8 username and
+text:
+
+    kind (u8) count (u32)
+    id (u64) timestamp (u64) username length (u8) text length (u32)
+    username text
+
+The kind is MESSAGES for new messages and HISTORY for the history sent to
+joining clients. Frames from a client are either
+
+    CHAT (u8) username length (u8) username text
+
+where an empty username keeps the one of the session, or
+
+    ACK (u8) id (u64)
+
+New messages are ChatMessage objects, which build their JSON, with its ISO
+timestamp, and their record the first time either is needed: a room whose
+clients all use the binary protocol builds the JSON only when the archive
+writes it to storage, see archive.py, off the path of the message.
+"""
+
+import json
+import struct
+from datetime import UTC, datetime
+
+from pyodide.ffi import to_js
+
+BINARY = "chatroom.binary"
+JSON = "chatroom.json"
+PROTOCOLS = (BINARY, JSON)
+
+# Kinds of frames
+MESSAGES = 1
+HISTORY = 2
+CHAT = 3
+ACK = 4
+
+HEADER = struct.Struct("!BI")
+RECORD = struct.Struct("!QQBI")
+CHAT_HEADER = struct.Struct("!BB")
+ACK_FRAME = struct.Struct("!BQ")
+
+
+def negotiate(header: str | None) -> str | None:
+    """
+    Pick a subprotocol from a Sec-WebSocket-Protocol request header.
+
+    Returns:
+        The first supported subprotocol the client offered, None if there
+        is none, in which case the client gets JSON
+    """
+    offered = (protocol.strip() for protocol in (header or "").split(","))
+    return next((protocol for protocol in offered if protocol in PROTOCOLS), None)
+
+
+def encode_record(message_id: int, timestamp: int, username: str, text: str) -> bytes:
+    """Encode a chat message, `timestamp` in milliseconds since the epoch."""
+    username_bytes = username.encode()
+    text_bytes = text.encode()
+    header = RECORD.pack(message_id, timestamp, len(username_bytes), len(text_bytes))
+    return header + username_bytes + text_bytes
+
+
+def record_from_json(fragment: str) -> bytes:
+    """Encode a message that was only kept as JSON."""
+    message = json.loads(fragment)
+    timestamp = datetime.fromisoformat(message["timestamp"]).timestamp()
+    # Messages stored before texts were checked may have any JSON value
+    return encode_record(
+        message["id"],
+        round(timestamp * 1000),
+        message["username"],
+        str(message["text"]),
+    )
+
+
+class ChatMessage:
+    """
+    A new chat message, encoded when first needed. str() returns its JSON,
+    so it can be used wherever a JSON-encoded message is expected.
+    """
+
+    __slots__ = ("id", "timestamp", "username", "text", "_json", "_record")
+
+    def __init__(self, message_id: int, timestamp: int, username: str, text: str):
+        """`timestamp` is in milliseconds since the epoch."""
+        self.id = message_id
+        self.timestamp = timestamp
+        self.username = username
+        self.text = text
+        self._json = None
+        self._record = None
+
+    def __str__(self) -> str:
+        if self._json is None:
+            iso = datetime.fromtimestamp(self.timestamp / 1000, UTC).isoformat()
+            self._json = json.dumps(
+                {
+                    "type": "message",
+                    "id": self.id,
+                    "username": self.username,
+                    "text": self.text,
+                    "timestamp": iso,
+                }
+            )
+        return self._json
+
+    @property
+    def record(self) -> bytes:
+        """The message encoded for the binary protocol."""
+        if self._record is None:
+            self._record = encode_record(
+                self.id, self.timestamp, self.username, self.text
+            )
+        return self._record
+
+
+def record_of(message) -> bytes:
+    """Encode a ChatMessage, or a message kept as JSON, to a record."""
+    if isinstance(message, ChatMessage):
+        return message.record
+    return record_from_json(message)
+
+
+def pack(kind: int, records: list[bytes]) -> bytes:
+    """Join encoded messages into a frame."""
+    return HEADER.pack(kind, len(records)) + b"".join(records)
+
+
+def binary_frame(kind: int, records: list[bytes]):
+    """Join encoded messages into a frame that can be passed to `ws.send()`."""
+    # Converted once and sent as is to every socket
+    return to_js(pack(kind, records))
+
+
+def unpack(frame: bytes) -> tuple[int, list[dict]]:
+    """
+    Decode a frame from the room.
+
+    Returns:
+        The kind of frame and its messages, with the same fields as in JSON
+        except for the timestamp
+    """
+    kind, count = HEADER.unpack_from(frame)
+    offset = HEADER.size
+    messages = []
+    for _ in range(count):
+        message_id, timestamp, username_size, text_size = RECORD.unpack_from(
+            frame, offset
+        )
+        offset += RECORD.size
+        username = frame[offset : offset + username_size].decode()
+        offset += username_size
+        text = frame[offset : offset + text_size].decode()
+        offset += text_size
+        messages.append(
+            {
+                "type": "message",
+                "id": message_id,
+                "username": username,
+                "text": text,
+                "timestamp": timestamp,
+            }
+        )
+    return kind, messages
+
+
+def encode_chat(text: str, username: str | None = None) -> bytes:
+    """Encode a message sent by a client."""
+    username_bytes = (username or "").encode()
+    return CHAT_HEADER.pack(CHAT, len(username_bytes)) + username_bytes + text.encode()
+
+
+def encode_ack(message_id: int) -> bytes:
+    return ACK_FRAME.pack(ACK, message_id)
+
+
+def decode_client(frame: bytes) -> dict:
+    """Decode a frame from a client to the same dict as its JSON version."""
+    if frame[0] == ACK:
+        _, message_id = ACK_FRAME.unpack(frame)
+        return {"type": "ack", "id": message_id}
+    if frame[0] == CHAT:
+        _, username_size = CHAT_HEADER.unpack_from(frame)
+        text_start = CHAT_HEADER.size + username_size
+        data = {"text": frame[text_start:].decode()}
+        if username_size:
+            data["username"] = frame[CHAT_HEADER.size : text_start].decode()
+        return data
+    raise ValueError(f"Unknown frame kind {frame[0]}")
+
+
+def frame_bytes(message) -> bytes:
+    """Return the content of a binary frame received by `webSocketMessage()`."""
+    # The runtime passes binary frames as an ArrayBuffer
+    return message if isinstance(message, bytes) else message.to_bytes()
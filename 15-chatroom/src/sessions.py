@@ -0,0 +1,65 @@
+"""
+Per-connection session state that survives hibernation.
+
+With the WebSocket Hibernation API, a Durable Object with no work left is
+evicted from memory while its WebSockets stay connected, and is recreated
+when the next message arrives. Anything kept on the Python object is lost
+at that point, so state about a connection is attached to the WebSocket
+itself with `serializeAttachment()`, which the runtime keeps along with the
+socket, and read back with `deserializeAttachment()`.
+
+Attachments are limited to 2 KiB, so sessions only hold a few small fields
+and are stored as a JSON string.
+"""
+
+import json
+import secrets
+
+# Roles of a connection: the first client in an empty room owns it
+OWNER = "owner"
+MEMBER = "member"
+
+# Longest accepted username
+MAX_USERNAME = 20
+
+
+def new_session(
+    username: str | None,
+    role: str,
+    now: int,
+    acks: bool = False,
+    binary: bool = False,
+) -> dict:
+    """
+    Create the session of a connection that just joined.
+
+    `acks` is set for clients that acknowledge messages, see backpressure.py,
+    and `binary` for clients using the binary protocol, see protocol.py.
+    """
+    return {
+        "id": secrets.token_hex(8),
+        "username": clean_username(username),
+        "role": role,
+        "joined_at": now,
+        "last_seen": now,
+        "acks": acks,
+        "binary": binary,
+    }
+
+
+def clean_username(username: str | None) -> str:
+    return (username or "").strip()[:MAX_USERNAME] or "Anonymous"
+
+
+def load_session(ws) -> dict:
+    """Read the session attached to a WebSocket."""
+    attachment = ws.deserializeAttachment()
+    if not attachment:
+        # Connected before sessions existed
+        return new_session(None, MEMBER, 0)
+    return json.loads(attachment)
+
+
+def save_session(ws, session: dict):
+    """Attach a session to a WebSocket, replacing the previous one."""
+    ws.serializeAttachment(json.dumps(session))
@@ -0,0 +1,102 @@
+"""
+Sharded rooms, for rooms with more clients than one Durable Object can
+broadcast to.
+
+A Durable Object is single-threaded, so the time a broadcast takes grows
+with the number of sockets of the room. With the ROOM_SHARDS variable set
+to N, every room is split across N Chatroom Durable Objects, its shards,
+and each client is assigned to one of them by a hash of its address and
+username. A shard broadcasts the messages of its own clients right away,
+then relays them to the room's RoomCoordinator, which keeps the room's
+durable history and passes them on to the other shards.
+
+Both hops are batched: a shard sends the messages of its clients to the
+coordinator once per BATCH_WINDOW, and the coordinator sends every shard
+the messages of all the other shards once per BATCH_WINDOW, so the number
+of calls between Durable Objects does not grow with the message rate.
+
+Message ids must stay unique across the shards of a room, so they are the
+time in milliseconds times MAX_SHARDS, plus the index of the shard.
+"""
+
+import asyncio
+import json
+import zlib
+
+from broadcast import BATCH_WINDOW
+
+# Most shards per room
+MAX_SHARDS = 64
+
+
+def shard_count(env) -> int:
+    """Return the number of shards per room set by ROOM_SHARDS, 1 if unset."""
+    shards = int(getattr(env, "ROOM_SHARDS", None) or 1)
+    if not 1 <= shards <= MAX_SHARDS:
+        raise ValueError(f"ROOM_SHARDS must be between 1 and {MAX_SHARDS}")
+    return shards
+
+
+def shard_for(key: str, shards: int) -> int:
+    """Return the shard of a client, by a stable hash of `key`."""
+    return zlib.crc32(key.encode()) % shards
+
+
+def shard_name(room: str, index: int) -> str:
+    """Name of the Durable Object of a room's shard."""
+    return f"{room}#shard-{index}"
+
+
+def shard_message_id(message_id: int, index: int) -> int:
+    """Make a message id unique across shards, see above."""
+    return message_id * MAX_SHARDS + index
+
+
+def encode_batch(entries: list) -> str:
+    """Encode [id, JSON message] pairs to be passed between Durable Objects."""
+    return json.dumps(entries)
+
+
+def decode_batch(batch: str) -> list:
+    return json.loads(batch)
+
+
+class Relay:
+    """Collects items for a short window and hands them over in one call."""
+
+    def __init__(self, deliver, window: float = BATCH_WINDOW):
+        """
+        Args:
+            deliver: Coroutine function called with the list of items
+            window: Seconds to collect items, 0 to deliver them on the next
+                turn of the event loop
+        """
+        self.deliver = deliver
+        self.window = window
+        self._pending = []
+        self._flush_handle = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def send(self, item):
+        """Queue an item, to be delivered with the others of its window."""
+        self._pending.append(item)
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.window, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    async def flush(self):
+        """Deliver the queued items now."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        items, self._pending = self._pending, []
+        try:
+            await self.deliver(items)
+        except Exception as e:
+            print(f"Error relaying {len(items)} messages: {e}")
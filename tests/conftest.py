@@ -3,6 +3,7 @@ import socket
 import subprocess
 import sys
 import time
+import types
 from contextlib import contextmanager
 from pathlib import Path
 
@@ -11,6 +12,109 @@ import pytest
 REPO_ROOT = Path(__file__).parents[1]
 
 
+class StubStorage:
+    """
+    Durable Object storage kept in a dict, for the tests that run an example
+    without wrangler. `puts` holds the sorted keys written by every put().
+    """
+
+    def __init__(self, data=None):
+        self.data = dict(data or {})
+        self.puts = []
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def put(self, key, value=None):
+        entries = key if isinstance(key, dict) else {key: value}
+        self.puts.append(sorted(entries))
+        self.data.update(entries)
+
+    async def delete(self, key):
+        return self.data.pop(key, None) is not None
+
+    async def list(self, options):
+        keys = sorted(
+            key
+            for key in self.data
+            if key.startswith(options.get("prefix", ""))
+            and key >= options.get("start", "")
+            and ("end" not in options or key < options["end"])
+        )
+        if options.get("reverse"):
+            keys.reverse()
+        return {key: self.data[key] for key in keys[: options.get("limit")]}
+
+
+class StubDurableObject:
+    def __init__(self, ctx, env):
+        self.ctx = ctx
+        self.env = env
+
+
+def runtime_stubs(js=None, ffi=None, workers=None) -> dict:
+    """
+    Stand-ins for the modules of the Workers runtime, by module name.
+
+    Each argument is a dict of attributes to add to, or override in, the
+    js, pyodide.ffi and workers modules, which only have what most examples
+    touch by default.
+    """
+    modules = {
+        "js": {"Object": types.SimpleNamespace(fromEntries=dict), **(js or {})},
+        "pyodide.ffi": {"to_js": lambda value, **options: value, **(ffi or {})},
+        "workers": {
+            "DurableObject": StubDurableObject,
+            "Response": object,
+            "WorkerEntrypoint": object,
+            **(workers or {}),
+        },
+    }
+    stubs = {}
+    for name, attributes in modules.items():
+        stubs[name] = types.ModuleType(name)
+        for attribute, value in attributes.items():
+            setattr(stubs[name], attribute, value)
+    stubs["pyodide"] = types.ModuleType("pyodide")
+    stubs["pyodide"].ffi = stubs["pyodide.ffi"]
+    return stubs
+
+
+@contextmanager
+def example_src(example: str, stubs: dict | None = None):
+    """
+    Make the modules in the `src` directory of `example` importable, with
+    the modules in `stubs`, e.g. from runtime_stubs(), in place of the real
+    ones. The example's modules are unloaded on exit, as other examples have
+    modules with the same names.
+    """
+    src = str(REPO_ROOT / example / "src")
+    with pytest.MonkeyPatch.context() as patch:
+        for name, module in (stubs or {}).items():
+            patch.setitem(sys.modules, name, module)
+        patch.syspath_prepend(src)
+        yield
+
+    for name, module in list(sys.modules.items()):
+        if src in (getattr(module, "__file__", None) or ""):
+            del sys.modules[name]
+
+
+@pytest.fixture(scope="session")
+def example_modules():
+    """
+    example_src() for module-scoped fixtures importing an example, e.g.
+
+        @pytest.fixture(scope="module")
+        def charts(example_modules):
+            with example_modules("12-image-gen"):
+                import charts
+
+                yield charts
+    """
+    return example_src
+
+
 def find_free_port():
     """Find an unused port."""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
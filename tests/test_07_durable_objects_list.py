@@ -0,0 +1,86 @@
+"""
+Storage layout tests for the List Durable Object of 07-durable-objects.
+
+These run without wrangler: the Durable Object's storage is replaced by a
+dict, and the runtime modules by stubs.
+"""
+
+import asyncio
+import types
+
+import pytest
+from conftest import StubStorage, runtime_stubs
+
+
+@pytest.fixture(scope="module")
+def entry(example_modules):
+    with example_modules("07-durable-objects", runtime_stubs()):
+        import entry
+
+        yield entry
+
+
+def make_list(entry, storage):
+    return entry.List(types.SimpleNamespace(storage=storage), None)
+
+
+def test_add_writes_two_keys_and_pages(entry):
+    storage = StubStorage()
+    lst = make_list(entry, storage)
+
+    async def run():
+        assert await lst.get_messages() == []
+        for seq in range(25):
+            await lst.add_message(f"hi {seq}")
+        return (
+            await lst.get_messages(),
+            await lst.get_messages(10, 5),
+            await lst.get_messages(20, 50),
+        )
+
+    everything, page, last = asyncio.run(run())
+    assert everything == [f"hi {seq}" for seq in range(25)]
+    assert page == ["hi 10", "hi 11", "hi 12", "hi 13", "hi 14"]
+    assert last == ["hi 20", "hi 21", "hi 22", "hi 23", "hi 24"]
+    # Each add writes its message and the count, however long the list
+    assert storage.puts[-1] == ["count", "msg:000000000024"]
+    assert all(len(keys) == 2 for keys in storage.puts)
+
+
+def test_legacy_array_is_migrated(entry):
+    legacy = [f"old {seq}" for seq in range(300)]
+    storage = StubStorage({"messages": legacy})
+
+    async def run():
+        await make_list(entry, storage).add_message("new")
+        # A new instance, e.g. after an eviction, reads the migrated list
+        return await make_list(entry, storage).get_messages(298)
+
+    assert asyncio.run(run()) == ["old 298", "old 299", "new"]
+    assert "messages" not in storage.data
+    assert storage.data["count"] == 301
+    # Migrated with at most 128 keys per put
+    assert max(len(keys) for keys in storage.puts) == 128
+
+
+def test_failed_add_keeps_count(entry):
+    class FailingStorage(StubStorage):
+        async def put(self, key, value=None):
+            raise RuntimeError("Storage unavailable")
+
+    storage = FailingStorage({"count": 3})
+    lst = make_list(entry, storage)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await lst.add_message("lost")
+        return await lst.get_count()
+
+    assert asyncio.run(run()) == 3
+
+
+@pytest.mark.parametrize("limit", [0, -1, 1001])
+def test_page_limits(entry, limit):
+    lst = make_list(entry, StubStorage({"count": 1, "msg:000000000000": "hi"}))
+    with pytest.raises(ValueError):
+        asyncio.run(lst.get_messages(0, limit))
@@ -0,0 +1,99 @@
+"""
+Cache key and ETag tests for the 12-image-gen example, see
+test_12_image_gen_encoding.py.
+
+The entry point is imported with the Workers runtime modules replaced by
+stubs, and its responses are the stubs' Response objects.
+"""
+
+import asyncio
+import sys
+import types
+
+import pytest
+from conftest import runtime_stubs
+
+pytest.importorskip("PIL")
+
+
+class Response:
+    def __init__(self, body, status=200, headers=None):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+
+
+class Uint8Array:
+    @classmethod
+    def new(cls, length):
+        return cls()
+
+    def assign(self, data):
+        self.data = bytes(data)
+
+
+@pytest.fixture(scope="module")
+def entry(example_modules):
+    stubs = runtime_stubs(
+        js={
+            "ReadableStream": types.SimpleNamespace(new=lambda source: source),
+            "Uint8Array": Uint8Array,
+        },
+        ffi={"create_proxy": lambda function: function},
+        workers={"Request": object, "Response": Response},
+    )
+    with example_modules("12-image-gen", stubs):
+        import entry
+
+        yield entry
+
+
+@pytest.fixture
+def cache(entry):
+    return sys.modules["cache"]
+
+
+def get(entry, query, **headers):
+    worker = entry.Default()
+    worker.env = types.SimpleNamespace()
+    request = types.SimpleNamespace(
+        url=f"https://example.com{query}", method="GET", headers=headers
+    )
+    return asyncio.run(worker.fetch(request))
+
+
+def test_key_only_has_the_parameters_used(cache):
+    key = cache.cache_key("/badge", {"text": ["Hi"], "bg_color": ["#FF0000"]})
+    assert key == "/badge?bg_color=ff0000&text=Hi"
+    # Cache busters, and parameters of other endpoints, are left out
+    params = {"text": ["Hi"], "bg_color": ["ff0000"], "x": ["1"], "width": ["9"]}
+    assert cache.cache_key("/badge", params) == key
+    # The encoder preset changes the bytes
+    params = {"text": ["Hi"], "bg_color": ["ff0000"], "preset": ["small"]}
+    assert cache.cache_key("/badge", params) != key
+
+
+def test_unknown_parameters_share_the_etag(entry):
+    first = get(entry, "/placeholder?width=20&height=10&x=1")
+    second = get(entry, "/placeholder?width=20&height=10&x=2")
+    assert first.headers["ETag"] == second.headers["ETag"]
+
+
+def test_streamed_etag_is_for_png(entry):
+    query = "/gradient?width=20&height=10&colors=ff0000,0000ff"
+    webp = get(entry, query, Accept="image/webp")
+    streamed = get(entry, f"{query}&stream=1", Accept="image/webp")
+    assert streamed.headers["Content-Type"] == "image/png"
+    assert streamed.headers["ETag"] not in (
+        webp.headers["ETag"],
+        get(entry, query, Accept="image/png").headers["ETag"],
+    )
+
+    cached = get(
+        entry,
+        f"{query}&stream=1",
+        Accept="image/webp",
+        **{"If-None-Match": streamed.headers["ETag"]},
+    )
+    assert cached.status == 304
+    assert cached.headers["Content-Type"] == "image/png"
@@ -0,0 +1,44 @@
+"""
+Chart tests for the 12-image-gen example, see test_12_image_gen_encoding.py.
+"""
+
+import pytest
+
+pytest.importorskip("PIL")
+
+
+@pytest.fixture(scope="module")
+def charts(example_modules):
+    with example_modules("12-image-gen"):
+        import charts
+
+        yield charts
+
+
+@pytest.mark.parametrize("kind", ["bar", "line", "area"])
+@pytest.mark.parametrize("downsample", [None, "lttb", "minmax"])
+def test_downsamplers_per_kind(charts, kind, downsample):
+    values = [float(index % 7) for index in range(5000)]
+    if kind == "bar" and downsample == "lttb":
+        # Dense bars are always drawn from the extremes of each column
+        with pytest.raises(ValueError):
+            charts.render_chart(values, [], kind, downsample=downsample)
+    else:
+        image = charts.render_chart(values, [], kind, downsample=downsample)
+        assert image.size == (600, 400)
+
+
+@pytest.mark.parametrize(
+    "body", ['{"values": [null]}', "[{}]", "[[1, 2]]", '{"values": [1, "a"]}']
+)
+def test_invalid_json_values(charts, body):
+    with pytest.raises(ValueError):
+        charts.parse_body(body, "application/json")
+
+
+def test_json_values(charts):
+    body = '{"values": [1, 2.5, "3"], "labels": ["a", "b", 3]}'
+    assert charts.parse_body(body, "application/json") == (
+        [1.0, 2.5, 3.0],
+        ["a", "b", "3"],
+    )
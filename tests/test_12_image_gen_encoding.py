@@ -0,0 +1,49 @@
+"""
+Encoding tests for the 12-image-gen example.
+
+Only the rendering modules are imported: they need Pillow, which is a
+dependency of the example rather than of the tests, but not the Workers
+runtime.
+"""
+
+import random
+from io import BytesIO
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image, ImageDraw  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def encoding(example_modules):
+    with example_modules("12-image-gen"):
+        import encoding
+
+        yield encoding
+
+
+def flat_image(colors: int) -> Image.Image:
+    """A white image with stripes of random colors, like a badge or chart."""
+    rng = random.Random(colors)
+    image = Image.new("RGB", (4 * colors, 60), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for stripe in range(1, colors):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle([4 * stripe, 10, 4 * stripe + 3, 49], fill=color)
+    return image
+
+
+@pytest.mark.parametrize("colors", [2, 16, 200, 256])
+@pytest.mark.parametrize("fmt", ["png", "webp"])
+def test_flat_images_are_encoded_exactly(encoding, fmt, colors):
+    if fmt not in encoding.available_formats():
+        pytest.skip(f"{fmt} is not supported by this build of Pillow")
+    image = flat_image(colors)
+
+    for preset in encoding.PRESETS:
+        buffer = encoding.encode_image(image, fmt, preset)
+        decoded = Image.open(BytesIO(buffer.getvalue()))
+        if fmt == "png":
+            assert decoded.mode == "P"
+        assert decoded.convert("RGB").tobytes() == image.tobytes()
@@ -0,0 +1,35 @@
+"""
+Text measurement tests for the 12-image-gen example, see
+test_12_image_gen_encoding.py.
+"""
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image, ImageDraw  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def fonts(example_modules):
+    with example_modules("12-image-gen"):
+        import fonts
+
+        yield fonts
+
+
+@pytest.mark.parametrize(
+    "text", ["Hello", "Hello\nWorld", "a\nmuch longer line\nb", "trailing\n"]
+)
+@pytest.mark.parametrize("size", [None, 32])
+def test_measure_matches_textbbox(fonts, text, size):
+    draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    left, top, right, bottom = draw.textbbox(
+        (0, 0), text, font=fonts.get_font(None, size)
+    )
+    assert fonts.measure_text(text, None, size) == (right - left, bottom - top)
+
+
+def test_lines_add_up(fonts):
+    width, height = fonts.measure_text("Hello", None, 32)
+    assert fonts.measure_text("Hello\nHello\nHello", None, 32)[0] == width
+    assert fonts.measure_text("Hello\nHello\nHello", None, 32)[1] > 3 * height
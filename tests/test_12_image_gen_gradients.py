@@ -0,0 +1,80 @@
+"""
+Gradient tests for the 12-image-gen example, see test_12_image_gen_encoding.py.
+"""
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image  # noqa: E402
+
+RED, BLUE, WHITE = (255, 0, 0), (0, 0, 255), (255, 255, 255)
+
+
+@pytest.fixture(scope="module")
+def gradients(example_modules):
+    with example_modules("12-image-gen"):
+        import gradients
+
+        yield gradients
+
+
+def lerp(start, end, t):
+    return tuple(a + (b - a) * t for a, b in zip(start, end, strict=True))
+
+
+def close(pixel, expected, tolerance=2):
+    return all(abs(a - b) <= tolerance for a, b in zip(pixel, expected, strict=True))
+
+
+@pytest.mark.parametrize("height", [2, 100, 256, 1000])
+def test_vertical_matches_linear_interpolation(gradients, height):
+    image = gradients.render_gradient((7, height), [RED, BLUE])
+    assert image.size == (7, height)
+    assert image.getpixel((0, 0)) == RED
+    assert image.getpixel((6, height - 1)) == BLUE
+    for y in range(height):
+        expected = lerp(RED, BLUE, y / (height - 1))
+        # Rows are uniform
+        assert image.getpixel((0, y)) == image.getpixel((6, y))
+        assert close(image.getpixel((3, y)), expected)
+
+
+def test_horizontal_and_diagonal(gradients):
+    image = gradients.render_gradient((300, 5), [RED, BLUE], "horizontal")
+    assert image.getpixel((0, 4)) == RED
+    assert image.getpixel((299, 0)) == BLUE
+    assert close(image.getpixel((150, 2)), lerp(RED, BLUE, 150 / 299))
+
+    image = gradients.render_gradient((50, 50), [RED, BLUE], "diagonal")
+    assert image.getpixel((0, 0)) == RED
+    assert image.getpixel((49, 49)) == BLUE
+    # Symmetric along the diagonal, halfway on the other one
+    assert image.getpixel((10, 30)) == image.getpixel((30, 10))
+    assert close(image.getpixel((49, 0)), lerp(RED, BLUE, 0.5))
+
+
+def test_color_stops_are_evenly_spaced(gradients):
+    image = gradients.render_gradient((1, 511), [RED, WHITE, BLUE])
+    assert image.getpixel((0, 0)) == RED
+    assert close(image.getpixel((0, 255)), WHITE)
+    assert image.getpixel((0, 510)) == BLUE
+
+
+@pytest.mark.parametrize("direction", ["vertical", "horizontal", "diagonal"])
+def test_boxes_tile_the_full_gradient(gradients, direction):
+    size = (130, 700)
+    colors = [RED, WHITE, BLUE]
+    full = gradients.render_gradient(size, colors, direction)
+
+    tiled = Image.new("RGB", size)
+    for top in range(0, size[1], 64):
+        box = (0, top, size[0], min(top + 64, size[1]))
+        tiled.paste(gradients.render_gradient(size, colors, direction, box), box[:2])
+    assert tiled.tobytes() == full.tobytes()
+
+
+def test_invalid_parameters(gradients):
+    with pytest.raises(ValueError, match="direction"):
+        gradients.render_gradient((10, 10), [RED, BLUE], "radial")
+    with pytest.raises(ValueError, match="two colors"):
+        gradients.render_gradient((10, 10), [RED])
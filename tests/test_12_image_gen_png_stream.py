@@ -0,0 +1,79 @@
+"""
+Streaming PNG tests for the 12-image-gen example, see
+test_12_image_gen_encoding.py.
+"""
+
+import random
+from functools import partial
+from io import BytesIO
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def png_stream(example_modules):
+    with example_modules("12-image-gen"):
+        import png_stream
+
+        yield png_stream
+
+
+def noise(size):
+    rng = random.Random(str(size))
+    data = bytes(rng.randrange(256) for _ in range(size[0] * size[1] * 3))
+    return Image.frombytes("RGB", size, data)
+
+
+@pytest.mark.parametrize("size", [(1, 1), (37, 1), (1, 50), (123, 77)])
+@pytest.mark.parametrize("strip_bytes", [1, 500, 1 << 20])
+def test_stream_decodes_to_the_rendered_image(png_stream, size, strip_bytes):
+    image = noise(size)
+    boxes = []
+
+    def render(box):
+        boxes.append(box)
+        return image.crop(box)
+
+    chunks = list(png_stream.iter_png(size, render, strip_bytes=strip_bytes))
+    decoded = Image.open(BytesIO(b"".join(chunks)))
+    decoded.load()
+    assert decoded.mode == "RGB"
+    assert decoded.size == size
+    assert decoded.tobytes() == image.tobytes()
+
+    # Full-width strips, in order, covering every row once
+    assert all(box[0] == 0 and box[2] == size[0] for box in boxes)
+    assert boxes[0][1] == 0 and boxes[-1][3] == size[1]
+    assert all(a[3] == b[1] for a, b in zip(boxes, boxes[1:], strict=False))
+
+
+def test_strips_are_rendered_lazily(png_stream):
+    size = (100, 100)
+    image = noise(size)
+    rendered = []
+
+    def render(box):
+        rendered.append(box)
+        return image.crop(box)
+
+    chunks = png_stream.iter_png(size, render, strip_bytes=3000)
+    assert next(chunks).startswith(png_stream.PNG_SIGNATURE)
+    assert rendered == []
+    next(chunks)
+    assert len(rendered) < 10
+
+
+def test_streamed_gradient_matches_the_in_memory_render(png_stream):
+    # On the path while the fixture is active
+    import gradients
+
+    size = (300, 2000)
+    colors = [(255, 0, 0), (255, 255, 255), (0, 0, 255)]
+    render = partial(gradients.render_gradient, size, colors, "diagonal")
+
+    chunks = png_stream.iter_png(size, render, strip_bytes=64 * 1024)
+    decoded = Image.open(BytesIO(b"".join(chunks)))
+    assert decoded.tobytes() == render().tobytes()
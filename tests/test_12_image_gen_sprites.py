@@ -0,0 +1,91 @@
+"""
+Sprite sheet tests for the 12-image-gen example, see
+test_12_image_gen_encoding.py.
+"""
+
+import json
+import random
+from email.parser import BytesParser
+from email.policy import HTTP
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def sprites(example_modules):
+    with example_modules("12-image-gen"):
+        import sprites
+
+        yield sprites
+
+
+def random_sizes(seed, count):
+    rng = random.Random(seed)
+    return [(rng.randint(1, 300), rng.randint(1, 120)) for _ in range(count)]
+
+
+@pytest.mark.parametrize(
+    "sizes",
+    [
+        [(10, 10)],
+        [(500, 1), (1, 500)],
+        [(88, 20)] * 40,
+        *(random_sizes(seed, count) for seed, count in [(1, 2), (2, 17), (3, 256)]),
+    ],
+)
+def test_packed_images_do_not_overlap(sprites, sizes):
+    (sheet_width, sheet_height), positions = sprites.pack(sizes)
+    assert len(positions) == len(sizes)
+
+    boxes = []
+    for (x, y), (width, height) in zip(positions, sizes, strict=True):
+        assert x >= 0 and y >= 0
+        assert x + width <= sheet_width and y + height <= sheet_height
+        boxes.append((x, y, x + width, y + height))
+
+    # At least GAP pixels apart in one direction
+    gap = sprites.GAP
+    for index, (left, top, right, bottom) in enumerate(boxes):
+        for other in boxes[index + 1 :]:
+            assert (
+                right + gap <= other[0]
+                or other[2] + gap <= left
+                or bottom + gap <= other[1]
+                or other[3] + gap <= top
+            )
+
+    # Shelves of similar heights waste little space
+    used = sum(width * height for width, height in sizes)
+    if len(set(sizes)) == 1:
+        assert sheet_width * sheet_height < 1.5 * used
+
+
+def test_compose_pastes_every_image_at_its_frame(sprites):
+    rng = random.Random(7)
+    images = [
+        Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+        for size in random_sizes(4, 12)
+    ]
+    sheet, frames = sprites.compose(images)
+    for image, frame in zip(images, frames, strict=True):
+        box = (frame["x"], frame["y"])
+        box += (box[0] + frame["width"], box[1] + frame["height"])
+        assert sheet.crop(box).tobytes() == image.tobytes()
+
+
+def test_multipart_body(sprites):
+    sheet_map = {"width": 3, "height": 2, "images": []}
+    body, content_type = sprites.multipart_body(sheet_map, b"\x89PNG...", "image/png")
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    parts = {
+        part.get_param("name", header="content-disposition"): part
+        for part in message.iter_parts()
+    }
+    assert json.loads(parts["map"].get_content()) == sheet_map
+    assert parts["sprite"].get_content() == b"\x89PNG..."
+    assert parts["sprite"].get_filename() == "sprite.png"
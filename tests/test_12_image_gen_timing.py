@@ -0,0 +1,87 @@
+"""
+Server-Timing tests for the 12-image-gen example, see
+test_12_image_gen_encoding.py.
+"""
+
+import asyncio
+import json
+import re
+import types
+
+import pytest
+
+
+class Headers(dict):
+    def set(self, name, value):
+        self[name] = value
+
+
+@pytest.fixture(scope="module")
+def timing(example_modules):
+    with example_modules("12-image-gen"):
+        import timing
+
+        yield timing
+
+
+def make_worker(timing, **env):
+    class Worker:
+        @timing.server_timing
+        async def fetch(self, request):
+            for name in ("parse", "render", "encode", "render"):
+                timing.phase(name)
+            return types.SimpleNamespace(status=200, headers=Headers())
+
+    worker = Worker()
+    worker.env = types.SimpleNamespace(**env)
+    return worker
+
+
+def fetch(worker):
+    request = types.SimpleNamespace(url="https://example.com/badge")
+    return asyncio.run(worker.fetch(request))
+
+
+def test_header_lists_every_phase_once(timing):
+    response = fetch(make_worker(timing, SERVER_TIMING="1"))
+    header = response.headers["Server-Timing"]
+    names = [entry.split(";")[0] for entry in header.split(", ")]
+    assert names == ["parse", "render", "encode", "total"]
+    assert all(re.fullmatch(r"\w+;dur=\d+\.\d", entry) for entry in header.split(", "))
+
+
+@pytest.mark.parametrize("value", [None, "", "0", "false", "False"])
+def test_off_by_default(timing, value, capsys):
+    response = fetch(make_worker(timing, SERVER_TIMING=value))
+    assert "Server-Timing" not in response.headers
+    assert capsys.readouterr().out == ""
+    # Outside of a timed request, phases are ignored
+    timing.phase("render")
+
+
+def test_sampled_requests_are_logged(timing, capsys):
+    response = fetch(make_worker(timing, TIMING_SAMPLE_RATE="1"))
+    assert "Server-Timing" not in response.headers
+    log = json.loads(capsys.readouterr().out)
+    assert log["event"] == "server_timing"
+    assert log["url"] == "https://example.com/badge"
+    assert log["status"] == 200
+    assert {"parse_ms", "render_ms", "encode_ms", "total_ms"} <= log.keys()
+
+
+def test_invalid_sample_rate_is_ignored(timing, capsys):
+    response = fetch(make_worker(timing, TIMING_SAMPLE_RATE="often"))
+    assert "Server-Timing" not in response.headers
+    assert "TIMING_SAMPLE_RATE must be" in capsys.readouterr().out
+
+
+def test_timer_adds_up_repeated_phases(timing, monkeypatch):
+    clock = iter([0.0, 0.001, 0.003, 0.006, 0.010, 0.015])
+    monkeypatch.setattr(timing.time, "perf_counter", lambda: next(clock))
+    timer = timing.Timer()
+    for name in ("parse", "render", "encode", "render"):
+        timer.mark(name)
+    total = timer.stop()
+    assert timer.header(total) == (
+        "parse;dur=2.0, render;dur=8.0, encode;dur=4.0, total;dur=15.0"
+    )
@@ -0,0 +1,90 @@
+"""
+Windowed aggregation tests for the 14-websocket-stream-consumer example.
+
+The aggregator only depends on the pipeline module, so these import it
+directly, with the Durable Object's storage replaced by a dict.
+"""
+
+import json
+
+import pytest
+
+FIRST_TIME_US = 1_762_084_800_000_000
+
+
+class StubKV:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def put(self, key, value):
+        self.data[key] = value
+
+
+@pytest.fixture(scope="module")
+def aggregation(example_modules):
+    with example_modules("14-websocket-stream-consumer"):
+        import aggregation
+
+        yield aggregation
+
+
+def post(time_us, langs=(), tags=()):
+    record = {"text": "hello", "langs": list(langs)}
+    if tags:
+        record["facets"] = [{"features": [{"tag": tag}]} for tag in tags]
+    return {
+        "time_us": time_us,
+        "kind": "commit",
+        "commit": {"collection": "app.bsky.feed.post", "record": record},
+    }
+
+
+def test_space_saving_keeps_heavy_hitters(aggregation):
+    top = aggregation.SpaceSaving(capacity=10)
+    # Three frequent values in a long tail of distinct ones
+    stream = [
+        ("en", "ja", "pt")[index % 3] if index % 2 else f"rare{index}"
+        for index in range(10_000)
+    ]
+    for value in stream:
+        top.add(value)
+
+    assert len(top.counts) == 10
+    assert sorted(value for value, _, _ in top.top(3)) == ["en", "ja", "pt"]
+    for value, count, error in top.top(3):
+        # Counts are overestimated by at most their error
+        assert count - error <= stream.count(value) <= count
+
+
+def test_windows_and_stored_stats(aggregation):
+    kv = StubKV()
+    aggregator = aggregation.Aggregator(kv, window=60, flush_interval_ms=0)
+    # 10 posts per second for two minutes
+    for index in range(1200):
+        aggregator(
+            post(
+                FIRST_TIME_US + index * 100_000,
+                langs=["en"] if index % 4 else ["ja"],
+                tags=["Python"] if index % 10 == 0 else (),
+            )
+        )
+    # Deleted posts and other collections are not counted
+    aggregator({"time_us": FIRST_TIME_US, "kind": "commit", "commit": {}})
+
+    stats = aggregator.stats()
+    assert stats["posts_per_second"] == 10
+    assert stats["posts_last_second"] == 10
+    windows = [stats["previous_window"], stats["current_window"]]
+    assert sum(window["posts"] for window in windows) == 1200
+    previous = stats["previous_window"]
+    assert previous["end"] - previous["start"] == 60
+    assert previous["top_languages"][0][0] == "en"
+    assert previous["top_hashtags"][0][0] == "python"
+
+    # After a restart, the stored statistics are served until new posts
+    restarted = aggregation.Aggregator(kv)
+    assert restarted.stats() == json.loads(kv.data[aggregation.STATS_KEY])
+    assert restarted.stats()["current_window"]["posts"] > 0
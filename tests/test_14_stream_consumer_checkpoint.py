@@ -0,0 +1,177 @@
+"""
+Cursor checkpointing tests for the 14-websocket-stream-consumer example.
+
+These run without wrangler: Jetstream is replaced by a local stand-in that
+replays a fixed list of events from the cursor in the WebSocket URL, like
+the real one does, and the Durable Object's storage by a dict. A restart of
+the Durable Object is simulated by creating a new consumer for the same
+storage.
+"""
+
+import asyncio
+import json
+import sys
+import types
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from conftest import runtime_stubs
+
+FIRST_TIME_US = 1_762_084_800_000_000
+EVENTS = 2500
+# Events are 10 ms apart, so the 2 s replay overlap is 200 events
+GAP_US = 10_000
+
+
+class StandInWebSocket:
+    """Client WebSocket to the Jetstream stand-in."""
+
+    def __init__(self, url, events):
+        self.url = url
+        self.listeners = {}
+        cursor = parse_qs(urlparse(url).query).get("cursor")
+        self.events = [
+            event
+            for event in events
+            if not cursor or event["time_us"] >= int(cursor[0])
+        ]
+
+    def addEventListener(self, name, listener):
+        self.listeners[name] = listener
+
+    def removeEventListener(self, name, listener):
+        if self.listeners.get(name) is listener:
+            del self.listeners[name]
+
+    def close(self, code, reason):
+        self.events = []
+
+    def deliver(self, count=None):
+        """Send the next `count` events, all of them by default."""
+        count = len(self.events) if count is None else count
+        events, self.events = self.events[:count], self.events[count:]
+        for event in events:
+            # Jetstream sends compact JSON
+            frame = json.dumps(event, separators=(",", ":"))
+            self.listeners["message"](types.SimpleNamespace(data=frame))
+
+
+class StandInJetstream:
+    """Jetstream, replaying a fixed list of events from the requested cursor."""
+
+    def __init__(self, events):
+        self.events = events
+        self.sockets = []
+
+    def new(self, url):
+        ws = StandInWebSocket(url, self.events)
+        self.sockets.append(ws)
+        return ws
+
+
+class StubKV:
+    def __init__(self):
+        self.data = {}
+        self.puts = 0
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def put(self, key, value):
+        self.puts += 1
+        self.data[key] = value
+
+
+class Proxy:
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args):
+        return self.function(*args)
+
+    def destroy(self):
+        self.function = None
+
+
+@pytest.fixture(scope="module")
+def entry(example_modules):
+    stubs = runtime_stubs(ffi={"create_proxy": Proxy})
+    with example_modules("14-websocket-stream-consumer", stubs):
+        import entry
+
+        yield entry
+
+
+def make_events():
+    return [
+        {
+            "did": f"did:plc:user{index % 100}",
+            "time_us": FIRST_TIME_US + index * GAP_US,
+            "kind": "commit",
+            "commit": {
+                "collection": "app.bsky.feed.post",
+                "record": {"text": f"post {index}"},
+            },
+        }
+        for index in range(EVENTS)
+    ]
+
+
+def start_consumer(entry, jetstream, kv, processed):
+    """Create a consumer for `kv`, connect it and return its socket."""
+
+    async def set_alarm(when):
+        pass
+
+    ctx = types.SimpleNamespace(
+        storage=types.SimpleNamespace(kv=kv, setAlarm=set_alarm),
+        abort=lambda reason: None,
+        getWebSockets=lambda: [],
+    )
+    consumer = entry.BlueskyFirehoseConsumer(ctx, types.SimpleNamespace())
+    consumer.pipeline.processors = [lambda event: processed.append(event["time_us"])]
+    sys.modules["js"].WebSocket = jetstream
+    asyncio.run(consumer._connect_to_jetstream())
+    return consumer, jetstream.sockets[-1]
+
+
+def test_restart_replays_unsaved_events(entry):
+    events = make_events()
+    jetstream = StandInJetstream(events)
+    kv = StubKV()
+    processed = []
+
+    _, ws = start_consumer(entry, jetstream, kv, processed)
+    assert "cursor" not in ws.url
+    ws.deliver()
+    # One write per CHECKPOINT_EVERY events instead of one per event
+    assert kv.puts == EVENTS // 1000
+
+    # The Durable Object is restarted without a chance to save the cursor
+    _, ws = start_consumer(entry, jetstream, kv, processed)
+    assert "cursor" in ws.url
+    ws.deliver()
+
+    # Every event was processed at least once
+    assert set(processed) == {event["time_us"] for event in events}
+    # Those after the last checkpoint, and the overlap before it, twice. The
+    # cursor is inclusive, so the overlap is 201 events.
+    assert len(processed) == EVENTS + (EVENTS - 2000) + 201
+
+
+def test_close_saves_cursor(entry):
+    events = make_events()
+    jetstream = StandInJetstream(events)
+    kv = StubKV()
+    processed = []
+
+    consumer, ws = start_consumer(entry, jetstream, kv, processed)
+    ws.deliver(EVENTS - 100)
+    close = types.SimpleNamespace(code=1006, reason="")
+    asyncio.run(consumer._on_close(close))
+
+    # Only the overlap is replayed
+    _, ws = start_consumer(entry, jetstream, kv, processed)
+    ws.deliver()
+    assert set(processed) == {event["time_us"] for event in events}
+    assert len(processed) == EVENTS + 201
@@ -0,0 +1,53 @@
+"""
+Compression tests for the 14-websocket-stream-consumer example.
+
+compression.py only needs zstandard, which the tests are skipped without.
+"""
+
+import json
+
+import pytest
+
+zstandard = pytest.importorskip("zstandard")
+
+
+@pytest.fixture(scope="module")
+def compression(example_modules):
+    with example_modules("14-websocket-stream-consumer"):
+        import compression
+
+        yield compression
+
+
+def event(index):
+    return json.dumps(
+        {
+            "did": f"did:plc:{index:024d}",
+            "time_us": 1762084800000000 + index,
+            "kind": "commit",
+            "commit": {
+                "collection": "app.bsky.feed.post",
+                "record": {"text": f"post number {index}", "langs": ["en"]},
+            },
+        },
+        separators=(",", ":"),
+    )
+
+
+def test_frames_are_decompressed_with_the_dictionary(compression, tmp_path):
+    samples = [event(index).encode() for index in range(2000)]
+    dictionary = zstandard.train_dictionary(4096, samples)
+    path = tmp_path / "zstd_dictionary"
+    path.write_bytes(dictionary.as_bytes())
+    compressor = zstandard.ZstdCompressor(dict_data=dictionary)
+
+    decompress = compression.load_decompressor(path)
+    for index in range(5):
+        frame = compressor.compress(samples[index])
+        assert decompress(frame) == event(index)
+    assert decompress.ratio() > 1
+
+
+def test_missing_dictionary_is_an_error(compression, tmp_path):
+    with pytest.raises(RuntimeError, match="dictionary"):
+        compression.load_decompressor(tmp_path / "zstd_dictionary")
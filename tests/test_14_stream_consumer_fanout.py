@@ -0,0 +1,108 @@
+"""
+Fan-out tests for the 14-websocket-stream-consumer example.
+
+The dispatch index does not depend on the Workers runtime, so these import
+it directly, with subscribers' WebSockets replaced by lists of frames.
+"""
+
+import json
+
+import pytest
+
+POST = "app.bsky.feed.post"
+LIKE = "app.bsky.feed.like"
+
+
+class StubWebSocket:
+    def __init__(self, fail=False):
+        self.frames = []
+        self.fail = fail
+
+    def send(self, frame):
+        if self.fail:
+            raise RuntimeError("closed")
+        self.frames.append(frame)
+
+
+@pytest.fixture(scope="module")
+def fanout(example_modules):
+    with example_modules("14-websocket-stream-consumer"):
+        import fanout
+
+        yield fanout
+
+
+def commit(did, collection):
+    # Compact, with the keys in the order Jetstream sends them
+    event = {
+        "did": did,
+        "time_us": 1,
+        "kind": "commit",
+        "commit": {"collection": collection, "record": {"did": "did:plc:other"}},
+    }
+    return json.dumps(event, separators=(",", ":"))
+
+
+def identity(did):
+    event = {"did": did, "time_us": 1, "kind": "identity", "identity": {"did": did}}
+    return json.dumps(event, separators=(",", ":"))
+
+
+def test_frames_reach_matching_subscribers(fanout):
+    index = fanout.DispatchIndex()
+    sockets = {}
+    for name, collections, dids in [
+        ("all", None, None),
+        ("posts", {POST}, None),
+        ("likes", {LIKE}, None),
+        ("alice", None, {"did:plc:alice"}),
+        ("alice posts", {POST}, {"did:plc:alice"}),
+    ]:
+        sockets[name] = StubWebSocket()
+        index.add(fanout.Subscriber(sockets[name], collections, dids))
+
+    frames = [
+        commit("did:plc:alice", POST),
+        commit("did:plc:alice", LIKE),
+        commit("did:plc:bob", POST),
+        commit("did:plc:bob", "app.bsky.graph.follow"),
+        identity("did:plc:alice"),
+        identity("did:plc:bob"),
+    ]
+    for frame in frames:
+        index.dispatch(frame)
+
+    received = {
+        name: [frames.index(frame) for frame in ws.frames]
+        for name, ws in sockets.items()
+    }
+    assert received == {
+        "all": [0, 1, 2, 3, 4, 5],
+        "posts": [0, 2, 4, 5],
+        "likes": [1, 4, 5],
+        "alice": [0, 1, 4],
+        "alice posts": [0, 4],
+    }
+    assert index.sent == 18
+
+
+def test_failed_subscriber_is_dropped(fanout):
+    index = fanout.DispatchIndex()
+    ok, failing = StubWebSocket(), StubWebSocket(fail=True)
+    index.add(fanout.Subscriber(ok))
+    index.add(fanout.Subscriber(failing))
+
+    index.dispatch(commit("did:plc:alice", POST))
+    index.dispatch(commit("did:plc:alice", POST))
+    assert len(ok.frames) == 2
+    assert len(index) == 1
+    assert index.metrics() == {"subscribers": 1, "sent": 2, "dropped": 1}
+
+
+def test_filters_must_be_in_upstream_subscription(fanout):
+    assert fanout.parse_filters("", [POST]) == (None, None)
+    assert fanout.parse_filters(
+        "wantedCollections=app.bsky.feed.post&wantedDids=did:plc:alice", [POST]
+    ) == ({POST}, {"did:plc:alice"})
+    with pytest.raises(ValueError, match=LIKE):
+        fanout.parse_filters(f"wantedCollections={LIKE}", [POST])
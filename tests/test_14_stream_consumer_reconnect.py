@@ -0,0 +1,99 @@
+"""
+Reconnection tests for the 14-websocket-stream-consumer example.
+
+These reuse the Jetstream stand-in of the checkpoint tests, in a single
+event loop, where the consumer must reconnect by itself after a close or a
+stall instead of waiting for its alarm.
+"""
+
+import asyncio
+import random
+import sys
+import types
+
+import test_14_stream_consumer_checkpoint
+from test_14_stream_consumer_checkpoint import (
+    EVENTS,
+    StandInJetstream,
+    StubKV,
+    make_events,
+)
+
+entry = test_14_stream_consumer_checkpoint.entry
+
+
+async def start_consumer(entry, jetstream, kv, processed, **env):
+    """Create a consumer for `kv` and connect it, in the running loop."""
+
+    async def set_alarm(when):
+        pass
+
+    def abort(reason):
+        raise AssertionError(f"Durable Object aborted: {reason}")
+
+    ctx = types.SimpleNamespace(
+        storage=types.SimpleNamespace(kv=kv, setAlarm=set_alarm),
+        abort=abort,
+        getWebSockets=lambda: [],
+    )
+    consumer = entry.BlueskyFirehoseConsumer(ctx, types.SimpleNamespace(**env))
+    consumer.pipeline.processors = [lambda event: processed.append(event["time_us"])]
+    consumer.health.backoff.rng = random.Random(0)
+    sys.modules["js"].WebSocket = jetstream
+    await consumer._connect_to_jetstream()
+    return consumer
+
+
+async def wait_for_socket(jetstream, count, timeout=5.0):
+    """Wait until the consumer opened `count` sockets."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while len(jetstream.sockets) < count:
+        assert asyncio.get_running_loop().time() < deadline, "did not reconnect"
+        await asyncio.sleep(0.01)
+    return jetstream.sockets[-1]
+
+
+def test_close_reconnects_in_process(entry):
+    events = make_events()
+    jetstream = StandInJetstream(events)
+    processed = []
+
+    async def run():
+        consumer = await start_consumer(entry, jetstream, StubKV(), processed)
+        jetstream.sockets[0].deliver(EVENTS - 100)
+        close = types.SimpleNamespace(code=1006, reason="")
+        await consumer._on_close(close)
+        assert consumer.status()["status"] == "reconnecting"
+
+        # Reconnected from the saved cursor, after a backoff delay
+        ws = await wait_for_socket(jetstream, 2)
+        assert "cursor" in ws.url
+        ws.deliver()
+        return consumer.status()
+
+    status = asyncio.run(run())
+    assert set(processed) == {event["time_us"] for event in events}
+    assert status["reconnects"] == 1
+    assert "code=1006" in status["last_error"]["message"]
+    assert status["events"] == EVENTS + 201
+    # Stand-in events are from 2025, far behind the clock
+    assert status["lag_seconds"] > 0
+
+
+def test_stall_reconnects(entry):
+    jetstream = StandInJetstream(make_events())
+    processed = []
+
+    async def run():
+        consumer = await start_consumer(
+            entry, jetstream, StubKV(), processed, STALL_TIMEOUT_MS="100"
+        )
+        # The first connection sends nothing
+        await wait_for_socket(jetstream, 2)
+        return consumer.status()
+
+    status = asyncio.run(run())
+    assert status["reconnects"] == 1
+    assert status["last_error"]["message"].startswith("No frame received")
+    # The stalled socket was closed and is no longer listened to
+    assert not jetstream.sockets[0].listeners
@@ -0,0 +1,186 @@
+"""
+Sink tests for the 14-websocket-stream-consumer example.
+
+Batching runs against the local stand-in sink of sinks.py, and the D1, R2
+and Queue sinks against stand-ins for their bindings that record the calls.
+The consumer runs against the Jetstream stand-in of the checkpoint tests.
+"""
+
+import asyncio
+import json
+import sys
+import types
+
+import pytest
+import test_14_stream_consumer_checkpoint
+from test_14_stream_consumer_checkpoint import (
+    EVENTS,
+    FIRST_TIME_US,
+    StandInJetstream,
+    StubKV,
+    make_events,
+)
+
+entry = test_14_stream_consumer_checkpoint.entry
+
+
+@pytest.fixture
+def sinks(entry, monkeypatch):
+    monkeypatch.setattr(
+        sys.modules["js"], "Object", types.SimpleNamespace(fromEntries=dict), False
+    )
+    return sys.modules["sinks"]
+
+
+def test_batches_by_size_and_time(sinks):
+    memory = sinks.MemorySink()
+    events = make_events()[:250]
+
+    async def run():
+        sink = sinks.BufferedSink(memory, batch_size=100, flush_interval=0.05)
+        for event in events:
+            sink(event)
+        await asyncio.sleep(0)
+        # Full batches are written right away, the rest after the interval
+        assert [len(batch) for batch in memory.batches] == [100, 100]
+        assert sink.oldest == events[200]["time_us"]
+        await asyncio.sleep(0.1)
+        return sink
+
+    sink = asyncio.run(run())
+    assert [len(batch) for batch in memory.batches] == [100, 100, 50]
+    assert memory.events == events
+    assert sink.oldest is None
+    assert sink.metrics()["batches"] == 3
+
+
+def test_failed_writes_are_retried_in_bounded_buffer(sinks):
+    memory = sinks.MemorySink(failures=2)
+    events = make_events()[:50]
+
+    async def run():
+        sink = sinks.BufferedSink(
+            memory, batch_size=10, flush_interval=0.01, max_buffer=30
+        )
+        for event in events:
+            sink(event)
+        await asyncio.sleep(0.2)
+        return sink
+
+    sink = asyncio.run(run())
+    # The oldest events were dropped to stay within the buffer
+    assert memory.events == events[20:]
+    assert sink.metrics() == {
+        "sink": "MemorySink",
+        "buffered": 0,
+        "written": 30,
+        "batches": 3,
+        "failures": 2,
+        "dropped": 20,
+    }
+
+
+def test_cursor_waits_for_writes(entry, sinks):
+    jetstream = StandInJetstream(make_events())
+    kv = StubKV()
+    memory = sinks.MemorySink(failures=1_000_000)
+
+    async def run():
+        async def set_alarm(when):
+            pass
+
+        ctx = types.SimpleNamespace(
+            storage=types.SimpleNamespace(kv=kv, setAlarm=set_alarm),
+            getWebSockets=lambda: [],
+        )
+        consumer = entry.BlueskyFirehoseConsumer(ctx, types.SimpleNamespace())
+        sink = sinks.BufferedSink(
+            memory, batch_size=100, flush_interval=0.01, max_buffer=EVENTS
+        )
+        consumer.sinks = [sink]
+        consumer.pipeline.processors = [sink]
+        sys.modules["js"].WebSocket = jetstream
+        await consumer._connect_to_jetstream()
+
+        # Nothing is written, so the cursor stays at the first event
+        jetstream.sockets[0].deliver()
+        consumer.checkpoint.flush()
+        assert kv.data["last_event_timestamp"] == FIRST_TIME_US
+
+        memory.failures = 0
+        await sink.flush()
+        last = FIRST_TIME_US + (EVENTS - 1) * 10_000
+        assert consumer._written_up_to(last) == last
+
+    asyncio.run(run())
+    assert len(memory.events) == EVENTS
+
+
+def test_binding_sinks(sinks):
+    events = make_events()[:250]
+    calls = []
+
+    class Statement:
+        def bind(self, *values):
+            return values
+
+    db = types.SimpleNamespace(
+        prepare=lambda query: Statement(),
+        batch=lambda statements: asyncio.sleep(0, calls.append(("d1", statements))),
+    )
+    bucket = types.SimpleNamespace(
+        put=lambda key, body, options: asyncio.sleep(0, calls.append(("r2", key, body)))
+    )
+    queue = types.SimpleNamespace(
+        sendBatch=lambda messages: asyncio.sleep(0, calls.append(("queue", messages)))
+    )
+    env = types.SimpleNamespace(EVENTS_DB=db, EVENTS_BUCKET=bucket, EVENTS_QUEUE=queue)
+
+    async def run():
+        for sink in sinks.configured_sinks(env):
+            for event in events:
+                sink(event)
+            await sink.flush()
+
+    asyncio.run(run())
+
+    d1 = [call[1] for call in calls if call[0] == "d1"]
+    assert [len(statements) for statements in d1] == [250]
+    assert d1[0][0][:4] == ("did:plc:user0", "app.bsky.feed.post", "", FIRST_TIME_US)
+
+    ((_, key, body),) = [call for call in calls if call[0] == "r2"]
+    assert key.startswith("jetstream/2025/11/02/12/")
+    assert key.endswith(f"{events[-1]['time_us']:016d}.ndjson")
+    assert [json.loads(line) for line in body.splitlines()] == events
+
+    # A sendBatch() call takes at most 100 messages
+    queue_calls = [call[1] for call in calls if call[0] == "queue"]
+    assert [len(messages) for messages in queue_calls] == [100, 100, 50]
+    assert json.loads(queue_calls[0][0]["body"]) == events[0]
+
+
+def test_buffer_is_capped_while_r2_is_down(sinks):
+    def put(key, body, options):
+        raise RuntimeError("R2 unavailable")
+
+    env = types.SimpleNamespace(EVENTS_BUCKET=types.SimpleNamespace(put=put))
+    (sink,) = sinks.configured_sinks(env, flush_interval=0.01)
+    assert sink.batch_size < sink.max_buffer <= sinks.MAX_BUFFER
+    # Many more events than fit, stamped like the stream
+    events = [
+        {"did": "did:plc:user", "time_us": FIRST_TIME_US + index}
+        for index in range(sink.max_buffer + 3 * sink.batch_size)
+    ]
+
+    async def run():
+        for event in events:
+            sink(event)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    metrics = sink.metrics()
+    assert metrics["written"] == 0 and metrics["failures"] >= 1
+    assert metrics["buffered"] == sink.max_buffer
+    assert metrics["dropped"] == len(events) - sink.max_buffer
+    # The newest events are kept
+    assert sink.buffer[-1] is events[-1]
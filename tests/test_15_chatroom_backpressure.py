@@ -0,0 +1,160 @@
+"""
+Backpressure tests for the 15-chatroom broadcast, run without wrangler.
+"""
+
+import json
+
+import pytest
+from conftest import runtime_stubs
+
+
+class StubWebSocket:
+    def __init__(self, session):
+        self.attachment = json.dumps(session)
+        self.sent = []
+        self.closed = None
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def serializeAttachment(self, value):
+        self.attachment = value
+
+    def deserializeAttachment(self):
+        return self.attachment
+
+    def close(self, code, reason):
+        self.closed = (code, reason)
+
+
+class StubState:
+    def __init__(self, websockets):
+        self.websockets = websockets
+
+    def getWebSockets(self):
+        return [ws for ws in self.websockets if ws.closed is None]
+
+
+@pytest.fixture(scope="module")
+def modules(example_modules):
+    with example_modules("15-chatroom", runtime_stubs()):
+        import backpressure
+        import broadcast
+
+        yield broadcast, backpressure
+
+
+def make_room(modules, policy, acks=(True, True), sockets=None, last_ping=None):
+    broadcast, backpressure = modules
+    if sockets is None:
+        sockets = [
+            StubWebSocket({"id": f"s{index}", "acks": ack})
+            for index, ack in enumerate(acks)
+        ]
+    flow = backpressure.FlowControl(
+        high_water=950, policy=policy, max_backlog=5, last_ping=last_ping
+    )
+    broadcaster = broadcast.Broadcaster(StubState(sockets), window=0, flow=flow)
+    return broadcaster, flow, sockets
+
+
+def send_messages(broadcaster, first_id, count, fast):
+    """Send messages of ~100 bytes, `fast` acknowledges each one."""
+    for message_id in range(first_id, first_id + count):
+        message = {"type": "message", "id": message_id, "text": "x" * 59}
+        broadcaster.send(json.dumps(message), message_id)
+        broadcaster.ack(fast, message_id)
+
+
+def test_slow_consumer_is_coalesced(modules):
+    broadcaster, flow, (fast, slow) = make_room(modules, "coalesce")
+    send_messages(broadcaster, 1, 30, fast)
+
+    # The fast client gets everything, the slow one stops at the high water
+    assert len(fast.sent) == 30
+    assert len(slow.sent) == 10
+    metrics = flow.metrics()
+    assert metrics["throttled"] == 1
+    assert metrics["backlog"] == 5
+    assert metrics["dropped"] == 15
+
+    # Once caught up it is told what it missed and gets the newest messages
+    broadcaster.ack(slow, 10)
+    notice, batch = (json.loads(frame) for frame in slow.sent[10:])
+    assert notice == {
+        "type": "system",
+        "text": "15 messages were skipped because the connection was too slow",
+    }
+    assert [m["id"] for m in batch["messages"]] == [26, 27, 28, 29, 30]
+    assert flow.metrics()["throttled"] == 0
+
+
+def test_slow_consumer_is_dropped(modules):
+    broadcaster, flow, (fast, slow) = make_room(modules, "drop")
+    send_messages(broadcaster, 1, 30, fast)
+    assert len(slow.sent) == 10
+    assert flow.metrics()["dropped"] == 20
+
+    broadcaster.ack(slow, 10)
+    assert "20 messages were skipped" in json.loads(slow.sent[-1])["text"]
+    send_messages(broadcaster, 31, 1, fast)
+    assert json.loads(slow.sent[-1])["id"] == 31
+
+
+def test_slow_consumer_is_disconnected(modules):
+    broadcaster, flow, (fast, slow) = make_room(modules, "disconnect")
+    send_messages(broadcaster, 1, 30, fast)
+    assert slow.closed[0] == 1008
+    assert len(slow.sent) == 10
+    assert len(fast.sent) == 30
+    assert flow.metrics()["disconnected"] == 1
+
+
+def test_clients_without_acks_are_throttled(modules):
+    broadcaster, flow, (fast, legacy) = make_room(modules, "disconnect", (True, False))
+    send_messages(broadcaster, 1, 30, fast)
+    assert len(legacy.sent) == 30
+    assert legacy.closed is None
+
+    # Four times the high water without being heard from
+    send_messages(broadcaster, 31, 30, fast)
+    assert legacy.closed[0] == 1008
+    assert len(legacy.sent) == 39
+    assert len(fast.sent) == 60
+
+
+def test_clients_without_acks_are_heard_from(modules):
+    pings = iter(range(1, 1000))
+    broadcaster, flow, (fast, legacy, pinging) = make_room(
+        modules,
+        "disconnect",
+        (True, False, False),
+        last_ping=lambda ws: next(pings) if ws is pinging else None,
+    )
+    for first_id in range(1, 100, 20):
+        send_messages(broadcaster, first_id, 20, fast)
+        broadcaster.heard_from(legacy, first_id)
+    # The keep-alive pings answered by the runtime count too
+    assert legacy.closed is None
+    assert pinging.closed is None
+    assert len(legacy.sent) == len(pinging.sent) == 100
+    assert flow.metrics()["throttled"] == 0
+
+
+def test_counters_survive_hibernation(modules):
+    broadcaster, flow, (fast, slow) = make_room(modules, "coalesce")
+    send_messages(broadcaster, 1, 20, fast)
+    assert len(slow.sent) == 10
+
+    # A new Durable Object instance, with the sockets and their sessions
+    broadcaster, flow, _ = make_room(modules, "coalesce", sockets=[fast, slow])
+    send_messages(broadcaster, 21, 10, fast)
+    assert len(slow.sent) == 10
+    assert flow.metrics()["throttled"] == 1
+
+    broadcaster.ack(slow, 10)
+    notice, batch = (json.loads(frame) for frame in slow.sent[10:])
+    # The backlog held before hibernating is lost, but counted as missed
+    assert notice["text"].startswith("15 messages were skipped")
+    assert [m["id"] for m in batch["messages"]] == [26, 27, 28, 29, 30]
+    assert flow.metrics()["throttled"] == 0
@@ -0,0 +1,163 @@
+"""
+Binary protocol tests for the 15-chatroom example, run without wrangler.
+"""
+
+import asyncio
+import json
+import sys
+import types
+
+import pytest
+import test_15_chatroom_sessions
+from test_15_chatroom_sessions import Request, StubState
+
+# Same stubbed runtime as the hibernation tests
+entry = test_15_chatroom_sessions.entry
+
+
+@pytest.fixture
+def protocol(entry):
+    return sys.modules["protocol"]
+
+
+async def connect(room, username, protocols=None, acks=False):
+    query = f"username={username}&acks=1" if acks else f"username={username}"
+    request = Request(f"https://example.com/room/lobby?{query}")
+    if protocols:
+        request.headers["Sec-WebSocket-Protocol"] = protocols
+    response = await room.fetch(request)
+    assert response.status == 101
+    return room.state.websockets[-1], response
+
+
+def binary_messages(protocol, ws):
+    """Decode the binary frames sent to a socket."""
+    return [
+        message
+        for frame in ws.sent
+        if isinstance(frame, bytes)
+        for message in protocol.unpack(frame)[1]
+    ]
+
+
+def test_negotiation(protocol):
+    assert protocol.negotiate("chatroom.binary") == "chatroom.binary"
+    assert protocol.negotiate("foo, chatroom.json, chatroom.binary") == "chatroom.json"
+    assert protocol.negotiate("foo") is None
+    assert protocol.negotiate(None) is None
+
+
+def test_records_round_trip(protocol):
+    records = [
+        protocol.encode_record(1, 1700000000000, "alice", "hello"),
+        protocol.encode_record(2, 1700000000001, "zoë", "ünïcode ✓"),
+    ]
+    kind, messages = protocol.unpack(protocol.pack(protocol.MESSAGES, records))
+    assert kind == protocol.MESSAGES
+    assert [(m["id"], m["username"], m["text"]) for m in messages] == [
+        (1, "alice", "hello"),
+        (2, "zoë", "ünïcode ✓"),
+    ]
+    assert messages[1]["timestamp"] == 1700000000001
+
+    assert protocol.decode_client(protocol.encode_chat("hi", "bob")) == {
+        "text": "hi",
+        "username": "bob",
+    }
+    assert protocol.decode_client(protocol.encode_chat("hi")) == {"text": "hi"}
+    assert protocol.decode_client(protocol.encode_ack(42)) == {"type": "ack", "id": 42}
+
+
+def test_mixed_room(entry, protocol):
+    async def run():
+        room = entry.Chatroom(StubState(), types.SimpleNamespace())
+        plain, response = await connect(room, "alice")
+        assert "Sec-WebSocket-Protocol" not in response.headers
+        binary, response = await connect(room, "bob", "chatroom.binary")
+        assert response.headers["Sec-WebSocket-Protocol"] == "chatroom.binary"
+
+        # Binary clients send binary frames, everyone gets the message in
+        # their own protocol
+        await room.webSocketMessage(binary, protocol.encode_chat("from bob"))
+        await room.webSocketMessage(plain, json.dumps({"text": "from alice"}))
+        room.broadcaster.flush()
+
+        texts = [m["text"] for m in plain.messages() if m["type"] == "message"]
+        assert texts == ["from bob", "from alice"]
+        received = binary_messages(protocol, binary)
+        assert [m["text"] for m in received] == ["from bob", "from alice"]
+        assert received[0]["username"] == "bob"
+        assert received[0]["id"] < received[1]["id"]
+
+        # System messages stay JSON for everyone
+        assert json.loads(binary.sent[0])["type"] == "system"
+
+        # The history is sent in the protocol of the joining client
+        newcomer, _ = await connect(room, "carol", "chatroom.binary")
+        kind, history = protocol.unpack(newcomer.sent[0])
+        assert kind == protocol.HISTORY
+        assert [m["text"] for m in history] == ["from bob", "from alice"]
+
+    asyncio.run(run())
+
+
+def test_binary_backlog(entry, protocol):
+    async def run():
+        room = entry.Chatroom(StubState(), types.SimpleNamespace())
+        room.flow.high_water = 100
+        ws, _ = await connect(room, "alice", "chatroom.binary", acks=True)
+
+        for index in range(5):
+            await room.webSocketMessage(ws, protocol.encode_chat(f"message {index}"))
+            room.broadcaster.flush()
+        sent = binary_messages(protocol, ws)
+        assert len(sent) < 5
+
+        # Once caught up, what was held back arrives as one binary frame
+        await room.webSocketMessage(ws, protocol.encode_ack(sent[-1]["id"]))
+        kind, backlog = protocol.unpack(ws.sent[-1])
+        assert kind == protocol.MESSAGES
+        assert [m["text"] for m in sent + backlog] == [
+            f"message {index}" for index in range(5)
+        ]
+
+    asyncio.run(run())
+
+
+def test_text_must_be_a_string(entry, protocol):
+    async def run():
+        room = entry.Chatroom(StubState(), types.SimpleNamespace())
+        plain, _ = await connect(room, "alice")
+        for text in [42, None, {"nested": True}, ["a"], "fine"]:
+            await room.webSocketMessage(plain, json.dumps({"text": text}))
+        room.broadcaster.flush()
+
+        # Only the string was kept, so the history still encodes
+        assert len(room.message_history) == 1
+        assert [json.loads(str(f))["text"] for _, f in room.archive._pending] == [
+            "fine"
+        ]
+        newcomer, _ = await connect(room, "bob", "chatroom.binary")
+        _, history = protocol.unpack(newcomer.sent[0])
+        assert [m["text"] for m in history] == ["fine"]
+
+    asyncio.run(run())
+
+
+def test_binary_room_encodes_json_for_storage_only(entry, protocol):
+    async def run():
+        room = entry.Chatroom(StubState(), types.SimpleNamespace())
+        ws, _ = await connect(room, "alice", "chatroom.binary")
+        await room.webSocketMessage(ws, protocol.encode_chat("hello"))
+        room.broadcaster.flush()
+        ((_, message),) = room.archive._pending
+        assert message._json is None
+
+        # Written with the same timestamp as the clients got
+        await room.archive.flush()
+        (received,) = binary_messages(protocol, ws)
+        ((_, stored),) = await room.archive.read()
+        assert stored["id"] == received["id"]
+        assert protocol.record_from_json(json.dumps(stored)) == message.record
+
+    asyncio.run(run())
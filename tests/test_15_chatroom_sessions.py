@@ -0,0 +1,222 @@
+"""
+Hibernation tests for the 15-chatroom Durable Object.
+
+These run without wrangler: the Workers runtime is replaced by a small stub
+of the WebSocket Hibernation API. Hibernation is simulated by throwing the
+Chatroom object away and creating a new one for the same state, which keeps
+the accepted WebSockets, their attachments and the storage, like the runtime
+does.
+"""
+
+import asyncio
+import json
+import types
+from urllib.parse import urlencode
+
+import pytest
+from conftest import StubStorage, runtime_stubs
+
+
+class StubWebSocket:
+    """Server end of a WebSocket, recording what was sent to it."""
+
+    def __init__(self, state=None):
+        self.state = state
+        self.sent = []
+        self.attachment = None
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def serializeAttachment(self, value):
+        # The runtime stores a copy that outlives the Durable Object's memory
+        self.attachment = value
+
+    def deserializeAttachment(self):
+        return self.attachment
+
+    def close(self, code, reason):
+        if self in self.state.websockets:
+            self.state.websockets.remove(self)
+
+    def messages(self):
+        """Decode the messages sent to this socket, unpacking batches."""
+        decoded = []
+        for frame in self.sent:
+            data = json.loads(frame)
+            decoded.extend(data["messages"] if data["type"] == "batch" else [data])
+        return decoded
+
+
+class StubState:
+    """DurableObjectState: survives hibernation, unlike the Chatroom object."""
+
+    def __init__(self):
+        self.storage = StubStorage()
+        self.websockets = []
+        self.auto_response = None
+
+    def acceptWebSocket(self, ws):
+        ws.state = self
+        self.websockets.append(ws)
+
+    def getWebSockets(self):
+        return list(self.websockets)
+
+    def setWebSocketAutoResponse(self, pair):
+        self.auto_response = pair
+
+    def getWebSocketAutoResponseTimestamp(self, ws):
+        return None
+
+
+class WebSocketPair:
+    @classmethod
+    def new(cls):
+        return cls()
+
+    def object_values(self):
+        return StubWebSocket(), StubWebSocket()
+
+
+class Request:
+    def __init__(self, url):
+        self.url = url
+        self.headers = {"Upgrade": "websocket"}
+
+
+class Response:
+    def __init__(self, body=None, status=200, headers=None, web_socket=None):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+        self.web_socket = web_socket
+
+
+@pytest.fixture(scope="module")
+def entry(example_modules):
+    stubs = runtime_stubs(
+        js={
+            "WebSocketPair": WebSocketPair,
+            "WebSocketRequestResponsePair": types.SimpleNamespace(
+                new=lambda *pair: pair
+            ),
+        },
+        workers={"Response": Response},
+    )
+    with example_modules("15-chatroom", stubs):
+        import entry
+
+        yield entry
+
+
+async def connect(room, name, username, **params):
+    query = urlencode({"username": username, **params})
+    response = await room.fetch(Request(f"https://example.com/room/{name}?{query}"))
+    assert response.status == 101
+    return room.state.websockets[-1]
+
+
+async def send(room, ws, **message):
+    await room.webSocketMessage(ws, json.dumps(message))
+
+
+async def hibernate(entry, room):
+    """Evict the Chatroom once it is idle and return the recreated one."""
+    # The runtime only hibernates once no work is pending
+    room.broadcaster.flush()
+    await room.archive.flush()
+    return entry.Chatroom(room.state, types.SimpleNamespace())
+
+
+def test_session_survives_hibernation(entry):
+    async def run():
+        room = entry.Chatroom(StubState(), types.SimpleNamespace())
+        alice = await connect(room, "lobby", "alice")
+        bob = await connect(room, "lobby", "bob")
+
+        room = await hibernate(entry, room)
+
+        # Messages without a username use the one of the session
+        await send(room, alice, text="hello")
+        room.broadcaster.flush()
+        message = bob.messages()[-1]
+        assert message["username"] == "alice"
+        assert message["text"] == "hello"
+
+        sessions = json.loads(room.get_sessions().body)["sessions"]
+        assert [s["username"] for s in sessions] == ["alice", "bob"]
+        assert [s["role"] for s in sessions] == ["owner", "member"]
+        assert sessions[0]["last_seen"] >= sessions[0]["joined_at"]
+
+    asyncio.run(run())
+
+
+def test_username_change_is_kept(entry):
+    async def run():
+        room = entry.Chatroom(StubState(), types.SimpleNamespace())
+        ws = await connect(room, "lobby", "alice")
+        await send(room, ws, username="alicia", text="new name")
+
+        room = await hibernate(entry, room)
+        await send(room, ws, text="still me")
+        room.broadcaster.flush()
+        assert ws.messages()[-1]["username"] == "alicia"
+
+    asyncio.run(run())
+
+
+def test_history_survives_hibernation(entry):
+    async def run():
+        room = entry.Chatroom(StubState(), types.SimpleNamespace())
+        ws = await connect(room, "lobby", "alice")
+        for index in range(3):
+            await send(room, ws, text=f"message {index}")
+
+        room = await hibernate(entry, room)
+        newcomer = await connect(room, "lobby", "bob")
+        history = json.loads(newcomer.sent[0])
+        assert history["type"] == "history"
+        assert [m["text"] for m in history["messages"]] == [
+            "message 0",
+            "message 1",
+            "message 2",
+        ]
+        # The newcomer does not take over the room
+        assert json.loads(newcomer.attachment)["role"] == "member"
+
+    asyncio.run(run())
+
+
+def test_max_history_survives_hibernation(entry):
+    async def run():
+        room = entry.Chatroom(StubState(), types.SimpleNamespace())
+        ws = await connect(room, "lobby", "alice", max_history=2)
+        for index in range(5):
+            await send(room, ws, text=f"message {index}")
+
+        room = await hibernate(entry, room)
+        newcomer = await connect(room, "lobby", "bob")
+        history = json.loads(newcomer.sent[0])
+        assert [m["text"] for m in history["messages"]] == ["message 3", "message 4"]
+
+    asyncio.run(run())
+
+
+def test_only_owner_sets_max_history(entry):
+    async def run():
+        room = entry.Chatroom(StubState(), types.SimpleNamespace())
+        ws = await connect(room, "lobby", "alice", max_history=3)
+        for index in range(5):
+            await send(room, ws, text=f"message {index}")
+
+        query = urlencode({"username": "mallory", "max_history": 1})
+        response = await room.fetch(Request(f"https://example.com/room/lobby?{query}"))
+        assert response.status == 403
+
+        newcomer = await connect(room, "lobby", "bob")
+        history = json.loads(newcomer.sent[0])
+        assert len(history["messages"]) == 3
+        assert await room.state.storage.get("max_history") == 3
+
+    asyncio.run(run())
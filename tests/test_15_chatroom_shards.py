@@ -0,0 +1,204 @@
+"""
+Sharded room tests for the 15-chatroom example, run without wrangler.
+
+Every Durable Object of the room lives in this process: the namespaces hand
+out the objects themselves as their stubs, so calls between the shards and
+the coordinator are plain method calls.
+"""
+
+import asyncio
+import json
+import types
+from urllib.parse import urlencode
+
+import test_15_chatroom_sessions
+from test_15_chatroom_sessions import Request, StubState
+
+# Same stubbed runtime as the hibernation tests
+entry = test_15_chatroom_sessions.entry
+
+SHARDS = 4
+USERNAMES = [f"user{index}" for index in range(8)]
+
+
+class Namespace:
+    """Durable Object namespace whose stubs are the objects themselves."""
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.env = None
+        self.objects = {}
+
+    def idFromName(self, name):
+        return name
+
+    def get(self, name):
+        if name not in self.objects:
+            self.objects[name] = self.cls(StubState(), self.env)
+        return self.objects[name]
+
+
+def make_worker(entry):
+    env = types.SimpleNamespace(ROOM_SHARDS=str(SHARDS))
+    env.CHATROOM = Namespace(entry.Chatroom)
+    env.COORDINATOR = Namespace(entry.RoomCoordinator)
+    env.CHATROOM.env = env.COORDINATOR.env = env
+    worker = entry.Default()
+    worker.env = env
+    return worker
+
+
+def shard_of(entry, worker, room, username):
+    index = entry.shard_for(f":{username}", SHARDS)
+    return worker.env.CHATROOM.get(entry.shard_name(room, index))
+
+
+async def connect(entry, worker, room, username):
+    query = urlencode({"username": username})
+    response = await worker.fetch(Request(f"https://example.com/room/{room}?{query}"))
+    assert response.status == 101
+    return shard_of(entry, worker, room, username).state.websockets[-1]
+
+
+async def settle():
+    """Wait for the relays and broadcasts of both hops to be flushed."""
+    await asyncio.sleep(0.1)
+
+
+def test_messages_reach_every_shard(entry):
+    async def run():
+        worker = make_worker(entry)
+        sockets = [await connect(entry, worker, "big", name) for name in USERNAMES]
+        assert len(worker.env.CHATROOM.objects) > 1
+
+        for name, ws in zip(USERNAMES, sockets, strict=True):
+            shard = shard_of(entry, worker, "big", name)
+            await shard.webSocketMessage(ws, json.dumps({"text": f"from {name}"}))
+        await settle()
+
+        expected = {f"from {name}" for name in USERNAMES}
+        for ws in sockets:
+            messages = [m for m in ws.messages() if m["type"] == "message"]
+            assert sorted(m["text"] for m in messages) == sorted(expected)
+            assert len({m["id"] for m in messages}) == len(USERNAMES)
+
+        # The coordinator keeps the history of the whole room
+        response = await worker.fetch(Request("https://example.com/room/big/history"))
+        page = json.loads(response.body)
+        assert {m["text"] for m in page["messages"]} == expected
+
+    asyncio.run(run())
+
+
+def test_new_shard_gets_room_history(entry):
+    async def run():
+        worker = make_worker(entry)
+        first = USERNAMES[0]
+        ws = await connect(entry, worker, "big", first)
+        shard = shard_of(entry, worker, "big", first)
+        for index in range(3):
+            await shard.webSocketMessage(ws, json.dumps({"text": f"message {index}"}))
+        await settle()
+
+        # Someone assigned to another shard joins later
+        other = next(
+            name
+            for name in USERNAMES
+            if shard_of(entry, worker, "big", name) is not shard
+        )
+        newcomer = await connect(entry, worker, "big", other)
+        history = json.loads(newcomer.sent[0])
+        assert [m["text"] for m in history["messages"]] == [
+            "message 0",
+            "message 1",
+            "message 2",
+        ]
+
+    asyncio.run(run())
+
+
+def test_shard_endpoints(entry):
+    async def run():
+        worker = make_worker(entry)
+        await connect(entry, worker, "big", USERNAMES[0])
+        index = entry.shard_for(f":{USERNAMES[0]}", SHARDS)
+
+        url = f"https://example.com/room/big/metrics?shard={index}"
+        metrics = json.loads((await worker.fetch(Request(url))).body)
+        assert metrics["sockets"] == 1
+        assert metrics["shard"] == index
+
+        url = f"https://example.com/room/big/sessions?shard={SHARDS}"
+        assert (await worker.fetch(Request(url))).status == 400
+
+    asyncio.run(run())
+
+
+def test_history_pages_follow_arrival(entry):
+    async def run():
+        coordinator = entry.RoomCoordinator(StubState(), None)
+        coordinator.archive.segment_size = 3
+        # Shard clocks differ, so ids reach the coordinator out of order
+        ms = 1_700_000_000_000
+        ids = [
+            entry.shard_message_id(ms + offset, index)
+            for offset, index in [(5, 0), (3, 1), (6, 2), (4, 3), (7, 0), (5, 1)]
+            + [(9, 2), (8, 3), (10, 0), (8, 1), (11, 2)]
+        ]
+        batch = [
+            [message_id, json.dumps({"id": message_id, "text": f"message {seq}"})]
+            for seq, message_id in enumerate(ids)
+        ]
+        await coordinator.publish("room", 0, 0, entry.encode_batch(batch))
+
+        texts, before = [], None
+        while True:
+            query = "limit=4" if before is None else f"limit=4&before={before}"
+            url = f"https://example.com/room/room/history?{query}"
+            page = json.loads((await coordinator.fetch(Request(url))).body)
+            texts[:0] = [message["text"] for message in page["messages"]]
+            before = page["before"]
+            if before is None:
+                break
+        assert texts == [f"message {seq}" for seq in range(len(ids))]
+
+        # Positions carry on after an eviction
+        await coordinator.archive.flush()
+        coordinator = entry.RoomCoordinator(coordinator.state, None)
+        position = await coordinator.archive.append(ids[0], batch[0][1])
+        assert position > max(ids)
+
+    asyncio.run(run())
+
+
+def test_rejoining_shard_history_has_no_duplicates(entry):
+    async def run():
+        worker = make_worker(entry)
+        first = USERNAMES[0]
+        shard = shard_of(entry, worker, "big", first)
+        other = next(
+            name
+            for name in USERNAMES
+            if shard_of(entry, worker, "big", name) is not shard
+        )
+        ws = await connect(entry, worker, "big", first)
+        sender = await connect(entry, worker, "big", other)
+        other_shard = shard_of(entry, worker, "big", other)
+        for index in range(3):
+            await other_shard.webSocketMessage(
+                sender, json.dumps({"text": f"message {index}"})
+            )
+        await settle()
+
+        # The shard is left empty while the room goes on
+        await shard.webSocketClose(ws, 1000, "bye", True)
+        await other_shard.webSocketMessage(sender, json.dumps({"text": "message 3"}))
+        await settle()
+
+        ws = await connect(entry, worker, "big", first)
+        history = json.loads(ws.sent[0])
+        assert [m["text"] for m in history["messages"]] == [
+            f"message {index}" for index in range(4)
+        ]
+
+    asyncio.run(run())
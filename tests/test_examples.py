@@ -173,6 +173,77 @@ def test_10_workflows(dev_server):
     assert isinstance(status, dict)
 
 
+def test_12_image_gen(dev_server):
+    port = dev_server
+    response = requests.get(f"http://localhost:{port}/")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/html"
+
+    response = requests.get(
+        f"http://localhost:{port}/gradient?width=64&height=32&colors=FF0000,00FF00,0000FF&direction=diagonal"
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.content.startswith(b"\x89PNG\r\n\x1a\n")
+
+    response = requests.get(f"http://localhost:{port}/gradient?direction=sideways")
+    assert response.status_code == 400
+
+    response = requests.get(
+        f"http://localhost:{port}/placeholder?width=300&height=200&stream=1"
+    )
+    assert response.status_code == 200
+    assert response.content.startswith(b"\x89PNG\r\n\x1a\n")
+
+    response = requests.get(f"http://localhost:{port}/placeholder?width=100000")
+    assert response.status_code == 413
+
+    response = requests.get(
+        f"http://localhost:{port}/chart", headers={"Accept": "image/webp,*/*"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+
+    response = requests.get(f"http://localhost:{port}/chart?format=jpeg&preset=small")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+
+    response = requests.get(f"http://localhost:{port}/chart?format=bmp")
+    assert response.status_code == 400
+
+    response = requests.post(
+        f"http://localhost:{port}/chart?kind=line&format=png",
+        json=[float(i % 97) for i in range(10000)],
+    )
+    assert response.status_code == 200
+    assert response.content.startswith(b"\x89PNG")
+
+    response = requests.get(f"http://localhost:{port}/chart?kind=pie")
+    assert response.status_code == 400
+
+    response = requests.post(
+        f"http://localhost:{port}/batch",
+        json=[{"type": "badge", "text": "one"}, {"type": "chart", "values": "1,2"}],
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("multipart/form-data")
+    assert b'name="map"' in response.content
+    assert b'name="sprite"' in response.content
+
+    badge_url = f"http://localhost:{port}/badge?text=Cached&bg_color=2196F3"
+    response = requests.get(badge_url)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    # Parameter order and color case do not change the cache key
+    response = requests.get(
+        f"http://localhost:{port}/badge?bg_color=%232196f3&text=Cached",
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
 def test_18_django(dev_server):
     port = dev_server
     response = requests.get(f"http://localhost:{port}")